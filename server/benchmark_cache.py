@@ -0,0 +1,83 @@
+'''
+Compare the cache backends: lookup latency and disk footprint.
+
+Builds a synthetic cache (or uses an existing directory cache with --cache_folder), stores it
+in both backends and times random single-entry lookups and whole-API loads (what the
+simulator does on an LRU miss).
+
+    python benchmark_cache.py --num_apis 2000 --entries_per_api 20
+    python benchmark_cache.py --cache_folder ./tool_response_cache
+'''
+
+import os
+import time
+import random
+import shutil
+import argparse
+import tempfile
+
+from cache import DirectoryCacheStore, SqliteCacheStore, cache_key
+from convert_cache import convert_cache
+
+
+def build_synthetic_cache(store, num_apis, entries_per_api):
+    for i in range(num_apis):
+        category, tool_name, api_name = f"Category_{i % 49}", f"tool_{i // 5}_for_Category_{i % 49}", f"api_{i % 5}"
+        records = {}
+        for j in range(entries_per_api):
+            tool_input = {"query": f"value {j}", "page": j}
+            output = {"error": "", "response": {"items": [{"id": j, "name": f"item {j} of api {i}"}], "total": j}}
+            records[cache_key(tool_input)] = {"input": tool_input, "output": output}
+        store.write_api(category, tool_name, api_name, records)
+
+
+def time_lookups(store, samples, whole_api):
+    start = time.perf_counter()
+    for category, tool_name, api_name, record_key in samples:
+        if whole_api:
+            store.load_api(category, tool_name, api_name)
+        else:
+            store.lookup(category, tool_name, api_name, record_key)
+    return (time.perf_counter() - start) / len(samples) * 1000
+
+
+def sample_keys(store, num_samples):
+    apis = list(store.iter_apis())
+    samples = []
+    for category, tool_name, api_name in random.sample(apis, min(num_samples, len(apis))):
+        records, _, _ = store.load_api(category, tool_name, api_name)
+        if records:
+            samples.append((category, tool_name, api_name, random.choice(list(records))))
+    return samples
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cache_folder', type=str, default="", required=False, help='existing directory cache to benchmark; a synthetic one is built if empty')
+    parser.add_argument('--num_apis', type=int, default=2000, required=False, help='number of APIs of the synthetic cache')
+    parser.add_argument('--entries_per_api', type=int, default=20, required=False, help='number of entries per API of the synthetic cache')
+    parser.add_argument('--num_samples', type=int, default=500, required=False, help='number of timed lookups')
+    args = parser.parse_args()
+    random.seed(42)
+
+    work_dir = tempfile.mkdtemp(prefix="cache_benchmark_")
+    try:
+        if args.cache_folder:
+            directory_store = DirectoryCacheStore(args.cache_folder)
+        else:
+            directory_store = DirectoryCacheStore(os.path.join(work_dir, "tool_response_cache"))
+            build_synthetic_cache(directory_store, args.num_apis, args.entries_per_api)
+        sqlite_store = SqliteCacheStore(os.path.join(work_dir, "tool_response_cache.db"))
+        convert_cache(directory_store, sqlite_store)
+        sqlite_store._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+        samples = sample_keys(directory_store, args.num_samples)
+        print(f"{'backend':<10} {'lookup ms':>10} {'load api ms':>12} {'apparent MB':>12} {'on disk MB':>11} {'files':>7}")
+        for store in (directory_store, sqlite_store):
+            lookup_ms = time_lookups(store, samples, whole_api=False)
+            load_ms = time_lookups(store, samples, whole_api=True)
+            apparent, allocated, files = store.disk_usage()
+            print(f"{store.backend:<10} {lookup_ms:>10.3f} {load_ms:>12.3f} {apparent / 2**20:>12.1f} {allocated / 2**20:>11.1f} {files:>7}")
+        sqlite_store.close()
+    finally:
+        shutil.rmtree(work_dir)
@@ -0,0 +1,593 @@
+import os
+import re
+import ast
+import json
+import asyncio
+import hashlib
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows, where the directory store is single-process only
+    fcntl = None
+
+CACHE_KEY_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+LOCK_FILE_NAME = ".lock"
+ACCESS_STATS_FILE_NAME = "access_stats.json"
+
+
+def canonical_tool_input(tool_input):
+    """
+    Normalize a tool input so that equivalent inputs compare equal: strings are stripped,
+    integral floats become ints and dict keys are sorted when serialized.
+    """
+    if isinstance(tool_input, dict):
+        return {str(k).strip(): canonical_tool_input(v) for k, v in tool_input.items()}
+    if isinstance(tool_input, (list, tuple)):
+        return [canonical_tool_input(v) for v in tool_input]
+    if isinstance(tool_input, str):
+        return tool_input.strip()
+    if isinstance(tool_input, float) and tool_input.is_integer():
+        return int(tool_input)
+    return tool_input
+
+
+def cache_key(tool_input):
+    """Fixed-width, order-independent cache key: sha256 of the sorted-key JSON of the canonical input."""
+    canonical = json.dumps(canonical_tool_input(tool_input), sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def parse_legacy_key(key):
+    """Recover the tool input from a legacy `str(tool_input)` cache key."""
+    try:
+        return ast.literal_eval(key)
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        return key
+
+
+def add_record(records, key, value):
+    """
+    Add one raw cache entry to `records`, converting legacy `{str(tool_input): response}`
+    entries to the canonical `{cache_key: {"input": ..., "output": ...}}` layout.
+    """
+    if CACHE_KEY_PATTERN.match(key) and isinstance(value, dict) and "output" in value:
+        records[key] = value
+        return
+    tool_input = canonical_tool_input(parse_legacy_key(key))
+    records[cache_key(tool_input)] = {"input": tool_input, "output": value}
+
+
+def parse_snapshot(content, records):
+    """Add the entries of a `<api>.json` snapshot to `records`; returns the number of raw entries."""
+    snapshot = json.loads(content)
+    for key, value in snapshot.items():
+        add_record(records, key, value)
+    return len(snapshot)
+
+
+def parse_journal(content, records):
+    """Replay the lines of a `<api>.jsonl` journal onto `records`; returns the number of raw entries."""
+    count = 0
+    for line in content.splitlines():
+        try:
+            entry = json.loads(line)
+        except json.JSONDecodeError:
+            # a torn trailing line left by a crash mid-append
+            continue
+        if "key" in entry:
+            records[entry["key"]] = {"input": entry["input"], "output": entry["output"]}
+            if "ts" in entry:
+                records[entry["key"]]["ts"] = entry["ts"]
+        else:
+            add_record(records, entry["input"], entry["response"])
+        count += 1
+    return count
+
+
+class DirectoryCacheStore:
+    """
+    The original cache layout: one `<cache_folder>/<category>/<tool>/<api>.json` snapshot
+    per API plus an append-only `<api>.jsonl` journal of the responses added since the
+    last compaction. All methods are blocking.
+
+    Several processes (e.g. `uvicorn --workers N`) can share one cache folder: appends and
+    compactions of a tool take an exclusive `flock` on `<category>/<tool>/.lock` and reads
+    a shared one, so a compaction never drops a line appended by another process.
+
+    Records carry their creation time (`ts`) once written by this version; access statistics
+    (`record_access`) are kept in one `access_stats.json` at the top of the cache folder.
+    """
+
+    backend = "directory"
+
+    def __init__(self, cache_folder):
+        self.cache_folder = cache_folder
+        os.makedirs(cache_folder, exist_ok=True)
+
+    def cache_file_path(self, category, tool_name, api_name):
+        return os.path.join(self.cache_folder, category, tool_name, api_name + ".json")
+
+    def journal_file_path(self, category, tool_name, api_name):
+        return os.path.join(self.cache_folder, category, tool_name, api_name + ".jsonl")
+
+    @contextmanager
+    def _locked(self, category, tool_name, exclusive):
+        # category and tool empty: the cache-wide lock of the access statistics
+        tool_dir = os.path.join(self.cache_folder, category, tool_name)
+        os.makedirs(tool_dir, exist_ok=True)
+        with open(os.path.join(tool_dir, LOCK_FILE_NAME), 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            # closing the file releases the lock
+            yield
+
+    def load_api(self, category, tool_name, api_name):
+        """Read snapshot + journal of one API, returning (records, nbytes, raw entry count)."""
+        if not os.path.isdir(os.path.join(self.cache_folder, category, tool_name)):
+            return {}, 0, 0
+        with self._locked(category, tool_name, exclusive=False):
+            return self._load_api(category, tool_name, api_name)
+
+    def _load_api(self, category, tool_name, api_name):
+        records, nbytes, count = {}, 0, 0
+        cache_file_path = self.cache_file_path(category, tool_name, api_name)
+        if os.path.exists(cache_file_path):
+            with open(cache_file_path, 'r') as f:
+                content = f.read()
+            count += parse_snapshot(content, records)
+            nbytes += len(content)
+        journal_file_path = self.journal_file_path(category, tool_name, api_name)
+        if os.path.exists(journal_file_path):
+            with open(journal_file_path, 'r') as f:
+                content = f.read()
+            count += parse_journal(content, records)
+            nbytes += len(content)
+        return records, nbytes, count
+
+    def lookup(self, category, tool_name, api_name, record_key):
+        """Return the cached output of one input hash, or None."""
+        records, _, _ = self.load_api(category, tool_name, api_name)
+        record = records.get(record_key)
+        return record["output"] if record is not None else None
+
+    def append(self, category, tool_name, api_name, record_key, tool_input, output, ts=None):
+        """Persist one response created at `ts` (default: now); returns the number of bytes written."""
+        line = json.dumps({"key": record_key, "input": tool_input, "output": output, "ts": ts or time.time()}) + "\n"
+        journal_file_path = self.journal_file_path(category, tool_name, api_name)
+        with self._locked(category, tool_name, exclusive=True):
+            with open(journal_file_path, 'a') as f:
+                f.write(line)
+        return len(line)
+
+    def write_api(self, category, tool_name, api_name, records):
+        """Replace the stored records of one API with `records` (a compacted snapshot)."""
+        with self._locked(category, tool_name, exclusive=True):
+            self._write_api(category, tool_name, api_name, records)
+
+    def _write_api(self, category, tool_name, api_name, records):
+        cache_file_path = self.cache_file_path(category, tool_name, api_name)
+        os.makedirs(os.path.dirname(cache_file_path), exist_ok=True)
+        tmp_file_path = cache_file_path + ".tmp"
+        with open(tmp_file_path, 'w') as f:
+            json.dump(records, f, indent=4)
+        os.replace(tmp_file_path, cache_file_path)
+        journal_file_path = self.journal_file_path(category, tool_name, api_name)
+        if os.path.exists(journal_file_path):
+            os.remove(journal_file_path)
+
+    def compact(self, category, tool_name, api_name):
+        """Fold the journal of one API into its snapshot and remove the journal."""
+        if not os.path.exists(self.journal_file_path(category, tool_name, api_name)):
+            return
+        # one lock around read + rewrite, so no append can fall in between
+        with self._locked(category, tool_name, exclusive=True):
+            records, _, _ = self._load_api(category, tool_name, api_name)
+            self._write_api(category, tool_name, api_name, records)
+
+    def delete_records(self, category, tool_name, api_name, record_keys):
+        """Remove the given input hashes of one API and their access statistics; returns the number removed."""
+        if not os.path.isdir(os.path.join(self.cache_folder, category, tool_name)):
+            return 0
+        self._forget_access([(category, tool_name, api_name, record_key) for record_key in record_keys])
+        with self._locked(category, tool_name, exclusive=True):
+            records, _, _ = self._load_api(category, tool_name, api_name)
+            removed = 0
+            for record_key in record_keys:
+                if records.pop(record_key, None) is not None:
+                    removed += 1
+            if removed:
+                if records:
+                    self._write_api(category, tool_name, api_name, records)
+                else:
+                    for path in (self.cache_file_path(category, tool_name, api_name), self.journal_file_path(category, tool_name, api_name)):
+                        if os.path.exists(path):
+                            os.remove(path)
+        return removed
+
+    def record_access(self, accesses):
+        """Merge `{(category, tool, api, key): (hits, last_access)}` into the access statistics."""
+        path = os.path.join(self.cache_folder, ACCESS_STATS_FILE_NAME)
+        with self._locked("", "", exclusive=True):
+            stats = self._load_access(path)
+            for key, (hits, last_access) in accesses.items():
+                key = "\t".join(key)
+                old_hits, old_last_access = stats.get(key, (0, 0))
+                stats[key] = (old_hits + hits, max(old_last_access, last_access))
+            tmp_file_path = path + ".tmp"
+            with open(tmp_file_path, 'w') as f:
+                json.dump(stats, f)
+            os.replace(tmp_file_path, path)
+
+    def _forget_access(self, keys):
+        path = os.path.join(self.cache_folder, ACCESS_STATS_FILE_NAME)
+        with self._locked("", "", exclusive=True):
+            stats = self._load_access(path)
+            removed = [stats.pop("\t".join(key)) for key in keys if "\t".join(key) in stats]
+            if not removed:
+                return
+            tmp_file_path = path + ".tmp"
+            with open(tmp_file_path, 'w') as f:
+                json.dump(stats, f)
+            os.replace(tmp_file_path, path)
+
+    def load_access(self):
+        """Return `{(category, tool, api, key): (hits, last_access)}`."""
+        with self._locked("", "", exclusive=False):
+            stats = self._load_access(os.path.join(self.cache_folder, ACCESS_STATS_FILE_NAME))
+        return {tuple(key.split("\t")): tuple(value) for key, value in stats.items()}
+
+    def _load_access(self, path):
+        if not os.path.exists(path):
+            return {}
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def find_journals(self, min_journal_bytes=0):
+        """List (category, tool_name, api_name) of the journals larger than `min_journal_bytes`."""
+        journals = []
+        for root, _, files in os.walk(self.cache_folder):
+            for file in files:
+                if not file.endswith(".jsonl"):
+                    continue
+                if os.path.getsize(os.path.join(root, file)) < min_journal_bytes:
+                    continue
+                category, tool_name = os.path.split(os.path.relpath(root, self.cache_folder))
+                journals.append((category, tool_name, file[:-len(".jsonl")]))
+        return journals
+
+    def iter_apis(self):
+        """Yield (category, tool_name, api_name) of every API with a snapshot or a journal."""
+        for category in sorted(os.listdir(self.cache_folder)):
+            category_dir = os.path.join(self.cache_folder, category)
+            if not os.path.isdir(category_dir):
+                continue
+            for tool_name in sorted(os.listdir(category_dir)):
+                tool_dir = os.path.join(category_dir, tool_name)
+                if not os.path.isdir(tool_dir):
+                    continue
+                api_names = set()
+                for file in os.listdir(tool_dir):
+                    if file.endswith(".json"):
+                        api_names.add(file[:-len(".json")])
+                    elif file.endswith(".jsonl"):
+                        api_names.add(file[:-len(".jsonl")])
+                for api_name in sorted(api_names):
+                    yield category, tool_name, api_name
+
+    def disk_usage(self):
+        """(apparent bytes, allocated bytes, number of files) of the cache tree."""
+        apparent, allocated, files = 0, 0, 0
+        for root, _, names in os.walk(self.cache_folder):
+            for name in names:
+                st = os.stat(os.path.join(root, name))
+                apparent += st.st_size
+                allocated += st.st_blocks * 512
+                files += 1
+        return apparent, allocated, files
+
+    def close(self):
+        pass
+
+
+class SqliteCacheStore:
+    """
+    Embedded single-file cache store. Responses live in one SQLite table whose primary key
+    (category, tool, api, key) gives indexed lookups both of a whole API and of a single
+    input hash; WAL mode lets several processes share the file. All methods are blocking
+    and serialized on one connection.
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "category TEXT NOT NULL, tool TEXT NOT NULL, api TEXT NOT NULL, key TEXT NOT NULL, "
+                "input TEXT NOT NULL, output TEXT NOT NULL, created REAL, "
+                "PRIMARY KEY (category, tool, api, key)) WITHOUT ROWID"
+            )
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(responses)")]
+            if "created" not in columns:
+                self._conn.execute("ALTER TABLE responses ADD COLUMN created REAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS access ("
+                "category TEXT NOT NULL, tool TEXT NOT NULL, api TEXT NOT NULL, key TEXT NOT NULL, "
+                "hits INTEGER NOT NULL, last_access REAL NOT NULL, "
+                "PRIMARY KEY (category, tool, api, key)) WITHOUT ROWID"
+            )
+            self._conn.commit()
+
+    def load_api(self, category, tool_name, api_name):
+        records, nbytes = {}, 0
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, input, output, created FROM responses WHERE category=? AND tool=? AND api=?",
+                (category, tool_name, api_name),
+            ).fetchall()
+        for key, tool_input, output, created in rows:
+            records[key] = {"input": json.loads(tool_input), "output": json.loads(output)}
+            if created is not None:
+                records[key]["ts"] = created
+            nbytes += len(key) + len(tool_input) + len(output)
+        return records, nbytes, len(rows)
+
+    def lookup(self, category, tool_name, api_name, record_key):
+        """Return the cached output of one input hash, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT output FROM responses WHERE category=? AND tool=? AND api=? AND key=?",
+                (category, tool_name, api_name, record_key),
+            ).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def append(self, category, tool_name, api_name, record_key, tool_input, output, ts=None):
+        tool_input, output = json.dumps(tool_input), json.dumps(output)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (category, tool_name, api_name, record_key, tool_input, output, ts or time.time()),
+            )
+            self._conn.commit()
+        return len(record_key) + len(tool_input) + len(output)
+
+    def write_api(self, category, tool_name, api_name, records):
+        rows = [
+            (category, tool_name, api_name, key, json.dumps(record["input"]), json.dumps(record["output"]), record.get("ts"))
+            for key, record in records.items()
+        ]
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM responses WHERE category=? AND tool=? AND api=?",
+                (category, tool_name, api_name),
+            )
+            self._conn.executemany("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self._conn.commit()
+
+    def compact(self, category, tool_name, api_name):
+        pass
+
+    def delete_records(self, category, tool_name, api_name, record_keys):
+        keys = [(category, tool_name, api_name, record_key) for record_key in record_keys]
+        with self._lock:
+            removed = self._conn.executemany(
+                "DELETE FROM responses WHERE category=? AND tool=? AND api=? AND key=?", keys,
+            ).rowcount
+            self._conn.executemany("DELETE FROM access WHERE category=? AND tool=? AND api=? AND key=?", keys)
+            self._conn.commit()
+        return removed
+
+    def vacuum(self):
+        """Give the pages of deleted rows back to the file system, so `disk_usage` shrinks."""
+        with self._lock:
+            self._conn.execute("VACUUM")
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def record_access(self, accesses):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO access VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (category, tool, api, key) "
+                "DO UPDATE SET hits = hits + excluded.hits, last_access = MAX(last_access, excluded.last_access)",
+                [(*key, hits, last_access) for key, (hits, last_access) in accesses.items()],
+            )
+            self._conn.commit()
+
+    def load_access(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT category, tool, api, key, hits, last_access FROM access").fetchall()
+        return {tuple(row[:4]): (row[4], row[5]) for row in rows}
+
+    def find_journals(self, min_journal_bytes=0):
+        return []
+
+    def iter_apis(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT category, tool, api FROM responses ORDER BY category, tool, api"
+            ).fetchall()
+        yield from rows
+
+    def disk_usage(self):
+        apparent, allocated, files = 0, 0, 0
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.db_path + suffix):
+                st = os.stat(self.db_path + suffix)
+                apparent += st.st_size
+                allocated += st.st_blocks * 512
+                files += 1
+        return apparent, allocated, files
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def open_cache_store(backend, path, pack=None):
+    """
+    Open a cache store: `directory` (a cache folder) or `sqlite` (a database file). With
+    `pack`, the store becomes the writable overlay of that read-only cache pack.
+    """
+    if backend == "directory":
+        store = DirectoryCacheStore(path)
+    elif backend == "sqlite":
+        store = SqliteCacheStore(path)
+    else:
+        raise ValueError(f"Unknown cache backend: {backend}")
+    if pack:
+        from cache_pack import PackedCacheStore, OverlayCacheStore
+        store = OverlayCacheStore(PackedCacheStore(pack), store)
+    return store
+
+
+def read_records(cache_folder, category, tool_name, api_name):
+    """Synchronously read snapshot + journal of one API, returning (records, raw entry count)."""
+    records, _, count = DirectoryCacheStore(cache_folder).load_api(category, tool_name, api_name)
+    return records, count
+
+
+class ApiResponseCache:
+    """
+    In-process LRU layer over a cache store of the simulator.
+
+    Every entry is keyed by (category, tool_name, api_name) and holds the decoded
+    `{cache_key(tool_input): {"input": ..., "output": ...}}` dict of one API, as returned by
+    the store (`DirectoryCacheStore` or `SqliteCacheStore`). Hot APIs are served from memory
+    without touching disk; new responses are written through to the store, which stays the
+    source of truth. Store calls run in worker threads so they never block the event loop.
+
+    The layer is bounded both by the number of resident APIs and by the (approximate)
+    serialized size of their records. It is meant to be used from a single event loop.
+    """
+
+    def __init__(self, store, max_entries=2048, max_bytes=256 * 1024 * 1024):
+        self.store = store
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # key -> [records, nbytes], ordered from least to most recently used
+        self._entries = OrderedDict()
+        self._write_locks = {}
+        # (category, tool, api, record key) -> [hits, last access], flushed to the store by `flush_access`
+        self._access = {}
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    async def get(self, category, tool_name, api_name):
+        """Return the (shared, mutable) records dict of one API, loading it on a miss."""
+        key = (category, tool_name, api_name)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key][0]
+        self.misses += 1
+
+        records, nbytes, _ = await asyncio.to_thread(self.store.load_api, category, tool_name, api_name)
+        # another coroutine may have loaded the same API while we were reading
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+        self._entries[key] = [records, nbytes]
+        self.current_bytes += nbytes
+        self._evict()
+        return records
+
+    async def refresh(self, category, tool_name, api_name):
+        """
+        Re-read one API from the store and merge it into the resident records, picking up
+        responses written by other processes sharing the store. Returns the records dict.
+        """
+        key = (category, tool_name, api_name)
+        records, nbytes, _ = await asyncio.to_thread(self.store.load_api, category, tool_name, api_name)
+        if key not in self._entries:
+            self._entries[key] = [records, nbytes]
+            self.current_bytes += nbytes
+            self._evict()
+            return records
+        entry = self._entries[key]
+        # update in place: callers may hold a reference to the resident dict
+        entry[0].update(records)
+        self.current_bytes += max(nbytes - entry[1], 0)
+        entry[1] = max(nbytes, entry[1])
+        self._entries.move_to_end(key)
+        self._evict()
+        return entry[0]
+
+    async def put(self, category, tool_name, api_name, tool_input, response):
+        """Insert the response to one tool input and write it through to the store."""
+        key = (category, tool_name, api_name)
+        records = await self.get(category, tool_name, api_name)
+        record_key = cache_key(tool_input)
+        tool_input = canonical_tool_input(tool_input)
+        ts = time.time()
+        records[record_key] = {"input": tool_input, "output": response, "ts": ts}
+        async with self._write_lock(key):
+            added = await asyncio.to_thread(self.store.append, category, tool_name, api_name, record_key, tool_input, response, ts)
+        if key in self._entries:
+            self._entries[key][1] += added
+            self.current_bytes += added
+            self._evict()
+
+    def record_access(self, category, tool_name, api_name, record_key):
+        """Count a cache hit of one entry (feeds LFU / LRU eviction by the maintenance task)."""
+        access = self._access.setdefault((category, tool_name, api_name, record_key), [0, 0.0])
+        access[0] += 1
+        access[1] = time.time()
+
+    async def flush_access(self):
+        """Write the access counts gathered since the last flush to the store."""
+        if not self._access:
+            return
+        accesses, self._access = self._access, {}
+        await asyncio.to_thread(self.store.record_access, accesses)
+
+    def invalidate(self, category, tool_name, api_name):
+        """Drop one resident API, e.g. after entries were deleted from the store."""
+        entry = self._entries.pop((category, tool_name, api_name), None)
+        if entry is not None:
+            self.current_bytes -= entry[1]
+
+    async def compact(self, category, tool_name, api_name):
+        """Fold the journal of one API into its snapshot (directory store only)."""
+        async with self._write_lock((category, tool_name, api_name)):
+            await asyncio.to_thread(self.store.compact, category, tool_name, api_name)
+
+    async def compact_all(self, min_journal_bytes=0):
+        """Compact every API whose journal has grown beyond `min_journal_bytes`; returns the count."""
+        journals = await asyncio.to_thread(self.store.find_journals, min_journal_bytes)
+        for category, tool_name, api_name in journals:
+            await self.compact(category, tool_name, api_name)
+        return len(journals)
+
+    def _write_lock(self, key):
+        return self._write_locks.setdefault(key, asyncio.Lock())
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self.current_bytes > self.max_bytes):
+            key, (_, nbytes) = self._entries.popitem(last=False)
+            self.current_bytes -= nbytes
+            self.evictions += 1
+
+    def stats(self):
+        return {
+            "backend": self.store.backend,
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
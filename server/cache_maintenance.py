@@ -0,0 +1,146 @@
+'''
+Maintenance of a simulator cache: statistics, pruning of bad responses, TTL and size bound.
+
+    # entries and bytes per category (or tool / api)
+    python cache_maintenance.py stats --by category --cache_folder ./tool_response_cache
+    # drop responses failing check_result, entries older than 30 days, and evict the least
+    # frequently used entries until the cache is under 1GB
+    python cache_maintenance.py prune --prune_invalid --ttl 2592000 --max_bytes 1073741824 --policy lfu --cache_folder ./tool_response_cache
+
+Access counts come from the servers (recorded on every cache hit, see `ApiResponseCache.record_access`);
+entries never hit are evicted first, oldest first. The same `maintain` runs periodically inside
+`main.py` when `cache_maintenance_interval` is set. With a `cache_pack`, only the writable overlay
+is maintained: the entries of the pack are read-only.
+'''
+
+import time
+import json
+import argparse
+from collections import defaultdict
+
+from cache import open_cache_store
+
+def check_result(processes_value: dict):
+    if 'error' not in processes_value or processes_value['error'] != '':
+        return False
+    if 'response' not in processes_value:
+        return False
+    response = str(processes_value['response'])
+    if 'got an unexpected keyword argument' in response.lower():
+        return True
+    elif 'rate limit' in response.lower() or 'time out' in response.lower() or 'timed out' in response.lower() or 'does not exist' in response.lower() or '404' in response.lower() or '504' in response.lower() or '500' in response.lower() or 'internal error' in response.lower() or 'API doesn\'t exists' in response.lower() or "API doesn\'t exists" in response.lower() or response == '{\'message\': "API doesn\'t exists"}' or 'Service Not Found' in response:
+        return False
+    elif 'authoriz' in response.lower() or 'authenticat' in response.lower() or 'unauthorized' in response.lower() or 'blocked user' in response.lower() or 'unsubscribe' in response.lower() or 'blocked' in response.lower() or '401' in response.lower() or '403' in response.lower() or 'credential' in response.lower() or 'unauthenticated' in response.lower() or 'disabled for your subscription' in response.lower() or 'ACCESS_DENIED' in response or 'invalid consumer key' in response.lower():
+        return False
+    elif 'parameter' in response.lower() or 'parse' in response.lower() or 'is not defined' in response.lower():
+        return False
+    elif len(response) == 0:
+        return False
+    elif "status_code=50" in response or "status_code=429" in response:
+        return False
+    return True
+
+
+def cache_stats(store, level="category"):
+    """Return `{group: {"entries", "raw_entries", "bytes"}}` grouped by category, tool or api."""
+    depth = {"category": 1, "tool": 2, "api": 3}[level]
+    stats = defaultdict(lambda: {"entries": 0, "raw_entries": 0, "bytes": 0})
+    for api in store.iter_apis():
+        records, nbytes, raw_entries = store.load_api(*api)
+        group = stats["/".join(api[:depth])]
+        group["entries"] += len(records)
+        # raw entries above entries are duplicates collapsed by the canonical keys
+        group["raw_entries"] += raw_entries
+        group["bytes"] += nbytes
+    return dict(stats)
+
+
+def maintain(store, prune_invalid=False, ttl=0, max_bytes=0, policy="lru", dry_run=False, now=None):
+    """
+    Delete the entries failing `check_result` (if `prune_invalid`), older than `ttl` seconds
+    (if set), then evict by `policy` ("lru": least recently used, "lfu": least frequently
+    used) until the cache holds at most `max_bytes` (if set). Returns (report, touched APIs).
+
+    On a pack + overlay store only the overlay's entries are candidates, and its `disk_usage`
+    is what is kept under `max_bytes`.
+    """
+    overlay = getattr(store, "overlay", None)
+    if overlay is not None:
+        store = overlay
+    now = now or time.time()
+    access = store.load_access()
+    to_delete = defaultdict(list)
+    report = {"apis": 0, "entries": 0, "bytes": 0, "invalid": 0, "expired": 0, "evicted": 0}
+    candidates = []
+    for api in store.iter_apis():
+        records, _, _ = store.load_api(*api)
+        report["apis"] += 1
+        for record_key, record in records.items():
+            size = len(json.dumps(record))
+            report["entries"] += 1
+            report["bytes"] += size
+            if prune_invalid and not check_result(record["output"]):
+                to_delete[api].append(record_key)
+                report["invalid"] += 1
+            elif ttl and record.get("ts") and now - record["ts"] > ttl:
+                to_delete[api].append(record_key)
+                report["expired"] += 1
+            else:
+                hits, last_access = access.get((*api, record_key), (0, 0))
+                candidates.append((hits, last_access or record.get("ts") or 0, size, api, record_key))
+
+    kept_bytes = sum(candidate[2] for candidate in candidates)
+    if overlay is not None:
+        # what the overlay occupies on disk, less the (estimated) size of what is pruned above
+        kept_bytes = max(store.disk_usage()[0] - (report["bytes"] - kept_bytes), 0)
+    if max_bytes and kept_bytes > max_bytes:
+        if policy == "lfu":
+            candidates.sort(key=lambda candidate: (candidate[0], candidate[1]))
+        else:
+            candidates.sort(key=lambda candidate: candidate[1])
+        for _, _, size, api, record_key in candidates:
+            if kept_bytes <= max_bytes:
+                break
+            to_delete[api].append(record_key)
+            kept_bytes -= size
+            report["evicted"] += 1
+    report["bytes_after"] = kept_bytes
+
+    if not dry_run:
+        for api, record_keys in to_delete.items():
+            store.delete_records(*api, record_keys)
+        if overlay is not None and to_delete and hasattr(store, "vacuum"):
+            store.vacuum()
+    return report, list(to_delete)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('command', choices=["stats", "prune"], help='report statistics or prune the cache')
+    parser.add_argument('--cache_backend', type=str, default="directory", choices=["directory", "sqlite"], required=False, help='cache store')
+    parser.add_argument('--cache_folder', type=str, default="./tool_response_cache", required=False, help='cache folder of the directory backend')
+    parser.add_argument('--cache_db', type=str, default="./tool_response_cache.db", required=False, help='database file of the sqlite backend')
+    parser.add_argument('--by', type=str, default="category", choices=["category", "tool", "api"], required=False, help='grouping of the statistics')
+    parser.add_argument('--top', type=int, default=50, required=False, help='number of largest groups to print')
+    parser.add_argument('--prune_invalid', action='store_true', help='drop responses failing check_result')
+    parser.add_argument('--ttl', type=float, default=0, required=False, help='drop entries older than this many seconds (0: keep)')
+    parser.add_argument('--max_bytes', type=int, default=0, required=False, help='evict entries until the cache is this large (0: unbounded)')
+    parser.add_argument('--policy', type=str, default="lru", choices=["lru", "lfu"], required=False, help='eviction order')
+    parser.add_argument('--dry_run', action='store_true', help='only report what would be deleted')
+    args = parser.parse_args()
+
+    store = open_cache_store(args.cache_backend, args.cache_folder if args.cache_backend == "directory" else args.cache_db)
+    try:
+        if args.command == "stats":
+            stats = cache_stats(store, args.by)
+            print(f"{args.by:<80} {'entries':>9} {'dups':>6} {'MB':>9}")
+            for group, group_stats in sorted(stats.items(), key=lambda item: -item[1]["bytes"])[:args.top]:
+                print(f"{group[:80]:<80} {group_stats['entries']:>9} {group_stats['raw_entries'] - group_stats['entries']:>6} {group_stats['bytes'] / 2**20:>9.2f}")
+            print(f"{'total':<80} {sum(g['entries'] for g in stats.values()):>9} {sum(g['raw_entries'] - g['entries'] for g in stats.values()):>6} {sum(g['bytes'] for g in stats.values()) / 2**20:>9.2f}")
+        else:
+            report, touched = maintain(store, args.prune_invalid, args.ttl, args.max_bytes, args.policy, args.dry_run)
+            print(f"{'Would delete' if args.dry_run else 'Deleted'} {report['invalid']} invalid, {report['expired']} expired and {report['evicted']} evicted "
+                  f"of {report['entries']} entries in {len(touched)}/{report['apis']} APIs; "
+                  f"{report['bytes'] / 2**20:.2f}MB -> {report['bytes_after'] / 2**20:.2f}MB")
+    finally:
+        store.close()
@@ -0,0 +1,256 @@
+'''
+Packed single-file simulator cache archive.
+
+A pack holds every API of a cache in one file: one zlib-compressed JSON block per API, a
+names blob and a sorted fixed-width index, found through the footer. It is memory-mapped, so
+opening it reads only the footer and a lookup is a binary search over the index plus the
+decompression of one block. The simulator serves from it read-only (`cache_pack` in the
+config), with new responses going to the regular cache store as a writable overlay.
+
+    # pack a cache folder (or --cache_backend sqlite --cache_db ...) into one file
+    python cache_pack.py pack --cache_folder ./tool_response_cache --output ./tool_response_cache.pack
+    # unpack it into a cache folder
+    python cache_pack.py unpack --input ./tool_response_cache.pack --cache_folder ./tool_response_cache
+    # compare copy time, cold start and lookup latency with the directory layout
+    python cache_pack.py benchmark --num_apis 2000 --entries_per_api 20
+
+Layout: MAGIC | blocks | names | index entries (name offset, name length, block offset,
+block length, entry count) sorted by name | footer (index offset, entry count, MAGIC).
+Names are `category\\ttool\\tapi` in UTF-8.
+'''
+
+import os
+import mmap
+import json
+import time
+import zlib
+import shutil
+import random
+import struct
+import argparse
+import tempfile
+
+from cache import open_cache_store
+
+MAGIC = b"TBCPACK1"
+INDEX_ENTRY = struct.Struct("<QIQII")
+FOOTER = struct.Struct("<QQ8s")
+
+
+def _api_name(category, tool_name, api_name):
+    return "\t".join((category, tool_name, api_name)).encode("utf-8")
+
+
+def pack_cache(src_store, pack_path, level=6):
+    """Write every API of `src_store` into a pack at `pack_path`; returns (apis, entries)."""
+    apis = sorted(src_store.iter_apis(), key=lambda api: _api_name(*api))
+    tmp_path = pack_path + ".tmp"
+    entries, num_records = [], 0
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        for api in apis:
+            records, _, _ = src_store.load_api(*api)
+            if not records:
+                continue
+            block = zlib.compress(json.dumps(records, separators=(",", ":")).encode("utf-8"), level)
+            entries.append((_api_name(*api), f.tell(), len(block), len(records)))
+            f.write(block)
+            num_records += len(records)
+        name_offsets = []
+        for name, _, _, _ in entries:
+            name_offsets.append(f.tell())
+            f.write(name)
+        index_offset = f.tell()
+        for name_offset, (name, block_offset, block_length, count) in zip(name_offsets, entries):
+            f.write(INDEX_ENTRY.pack(name_offset, len(name), block_offset, block_length, count))
+        f.write(FOOTER.pack(index_offset, len(entries), MAGIC))
+    os.replace(tmp_path, pack_path)
+    return len(entries), num_records
+
+
+class PackedCacheStore:
+    """Read-only cache store over a pack file, see the module docstring."""
+
+    backend = "packed"
+
+    def __init__(self, pack_path):
+        self.pack_path = pack_path
+        self._file = open(pack_path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{pack_path} is not a cache pack")
+        self.index_offset, self.num_apis, magic = FOOTER.unpack_from(self._mmap, len(self._mmap) - FOOTER.size)
+        if magic != MAGIC:
+            raise ValueError(f"{pack_path} is truncated")
+
+    def _entry(self, i):
+        name_offset, name_length, block_offset, block_length, count = INDEX_ENTRY.unpack_from(
+            self._mmap, self.index_offset + i * INDEX_ENTRY.size
+        )
+        return self._mmap[name_offset:name_offset + name_length], block_offset, block_length, count
+
+    def _find(self, category, tool_name, api_name):
+        name = _api_name(category, tool_name, api_name)
+        lo, hi = 0, self.num_apis
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._entry(mid)[0] < name:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.num_apis:
+            entry = self._entry(lo)
+            if entry[0] == name:
+                return entry
+        return None
+
+    def load_api(self, category, tool_name, api_name):
+        entry = self._find(category, tool_name, api_name)
+        if entry is None:
+            return {}, 0, 0
+        _, block_offset, block_length, count = entry
+        content = zlib.decompress(self._mmap[block_offset:block_offset + block_length])
+        return json.loads(content), len(content), count
+
+    def lookup(self, category, tool_name, api_name, record_key):
+        records, _, _ = self.load_api(category, tool_name, api_name)
+        record = records.get(record_key)
+        return record["output"] if record is not None else None
+
+    def iter_apis(self):
+        for i in range(self.num_apis):
+            yield tuple(self._entry(i)[0].decode("utf-8").split("\t"))
+
+    def disk_usage(self):
+        st = os.stat(self.pack_path)
+        return st.st_size, st.st_blocks * 512, 1
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
+
+
+class OverlayCacheStore:
+    """
+    A read-only `PackedCacheStore` with a writable cache store on top. Reads merge both,
+    overlay entries winning; every write, compaction, deletion and access statistic goes to
+    the overlay, so entries of the pack itself are never removed.
+    """
+
+    def __init__(self, base, overlay):
+        self.base = base
+        self.overlay = overlay
+        self.backend = f"{base.backend}+{overlay.backend}"
+
+    def load_api(self, category, tool_name, api_name):
+        records, nbytes, count = self.base.load_api(category, tool_name, api_name)
+        overlay_records, overlay_nbytes, overlay_count = self.overlay.load_api(category, tool_name, api_name)
+        records.update(overlay_records)
+        return records, nbytes + overlay_nbytes, count + overlay_count
+
+    def lookup(self, category, tool_name, api_name, record_key):
+        output = self.overlay.lookup(category, tool_name, api_name, record_key)
+        if output is None:
+            output = self.base.lookup(category, tool_name, api_name, record_key)
+        return output
+
+    def append(self, *args, **kwargs):
+        return self.overlay.append(*args, **kwargs)
+
+    def write_api(self, category, tool_name, api_name, records):
+        self.overlay.write_api(category, tool_name, api_name, records)
+
+    def compact(self, category, tool_name, api_name):
+        self.overlay.compact(category, tool_name, api_name)
+
+    def delete_records(self, category, tool_name, api_name, record_keys):
+        return self.overlay.delete_records(category, tool_name, api_name, record_keys)
+
+    def find_journals(self, min_journal_bytes=0):
+        return self.overlay.find_journals(min_journal_bytes)
+
+    def record_access(self, accesses):
+        self.overlay.record_access(accesses)
+
+    def load_access(self):
+        return self.overlay.load_access()
+
+    def iter_apis(self):
+        yield from sorted(set(self.base.iter_apis()) | set(self.overlay.iter_apis()))
+
+    def disk_usage(self):
+        return tuple(a + b for a, b in zip(self.base.disk_usage(), self.overlay.disk_usage()))
+
+    def close(self):
+        self.base.close()
+        self.overlay.close()
+
+
+def benchmark(num_apis, entries_per_api, num_samples):
+    from benchmark_cache import build_synthetic_cache, sample_keys, time_lookups
+
+    work_dir = tempfile.mkdtemp(prefix="cache_pack_benchmark_")
+    try:
+        directory_store = open_cache_store("directory", os.path.join(work_dir, "tool_response_cache"))
+        build_synthetic_cache(directory_store, num_apis, entries_per_api)
+        pack_path = os.path.join(work_dir, "tool_response_cache.pack")
+        start = time.perf_counter()
+        pack_cache(directory_store, pack_path)
+        print(f"packed {num_apis} APIs in {time.perf_counter() - start:.2f}s")
+        samples = sample_keys(directory_store, num_samples)
+
+        print(f"{'layout':<10} {'copy s':>8} {'cold start ms':>14} {'lookup ms':>10} {'MB':>8} {'files':>7}")
+        for layout in ("directory", "packed"):
+            # shipping the cache to another machine / disk
+            start = time.perf_counter()
+            if layout == "directory":
+                copy_path = os.path.join(work_dir, "copy")
+                shutil.copytree(directory_store.cache_folder, copy_path)
+            else:
+                copy_path = os.path.join(work_dir, "copy.pack")
+                shutil.copyfile(pack_path, copy_path)
+            copy_seconds = time.perf_counter() - start
+            # open the store and serve a first lookup
+            category, tool_name, api_name, record_key = random.choice(samples)
+            start = time.perf_counter()
+            store = open_cache_store("directory", copy_path) if layout == "directory" else PackedCacheStore(copy_path)
+            store.lookup(category, tool_name, api_name, record_key)
+            cold_start_ms = (time.perf_counter() - start) * 1000
+            lookup_ms = time_lookups(store, samples, whole_api=False)
+            apparent, _, files = store.disk_usage()
+            print(f"{layout:<10} {copy_seconds:>8.2f} {cold_start_ms:>14.3f} {lookup_ms:>10.3f} {apparent / 2**20:>8.1f} {files:>7}")
+            store.close()
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('command', choices=["pack", "unpack", "benchmark"], help='pack a cache, unpack a pack or run the benchmark')
+    parser.add_argument('--cache_backend', type=str, default="directory", choices=["directory", "sqlite"], required=False, help='cache store to pack from / unpack into')
+    parser.add_argument('--cache_folder', type=str, default="./tool_response_cache", required=False, help='cache folder of the directory backend')
+    parser.add_argument('--cache_db', type=str, default="./tool_response_cache.db", required=False, help='database file of the sqlite backend')
+    parser.add_argument('--output', type=str, default="./tool_response_cache.pack", required=False, help='pack file to write')
+    parser.add_argument('--input', type=str, default="./tool_response_cache.pack", required=False, help='pack file to read')
+    parser.add_argument('--num_apis', type=int, default=2000, required=False, help='number of APIs of the synthetic benchmark cache')
+    parser.add_argument('--entries_per_api', type=int, default=20, required=False, help='number of entries per API of the synthetic benchmark cache')
+    parser.add_argument('--num_samples', type=int, default=500, required=False, help='number of timed lookups')
+    args = parser.parse_args()
+    random.seed(42)
+
+    if args.command == "benchmark":
+        benchmark(args.num_apis, args.entries_per_api, args.num_samples)
+    else:
+        store = open_cache_store(args.cache_backend, args.cache_folder if args.cache_backend == "directory" else args.cache_db)
+        try:
+            if args.command == "pack":
+                num_apis, num_entries = pack_cache(store, args.output)
+                print(f"Packed {num_entries} entries of {num_apis} APIs into {args.output}")
+            else:
+                from convert_cache import convert_cache
+                pack = PackedCacheStore(args.input)
+                num_apis, num_entries = convert_cache(pack, store)
+                pack.close()
+                print(f"Unpacked {num_entries} entries of {num_apis} APIs from {args.input}")
+        finally:
+            store.close()
@@ -0,0 +1,47 @@
+'''
+Import/export a simulator cache between the storage backends.
+
+    # directory tree -> SQLite file
+    python convert_cache.py --src_backend directory --src ./tool_response_cache --dst_backend sqlite --dst ./tool_response_cache.db
+    # SQLite file -> directory tree
+    python convert_cache.py --src_backend sqlite --src ./tool_response_cache.db --dst_backend directory --dst ./tool_response_cache
+
+Entries already present in the destination are kept unless the source has the same input,
+in which case the source response wins. Legacy directory caches are converted to
+canonical keys on the way.
+'''
+
+import argparse
+
+from cache import open_cache_store
+
+
+def convert_cache(src_store, dst_store):
+    """Copy every API of `src_store` into `dst_store`; returns (apis, entries) copied."""
+    num_apis, num_entries = 0, 0
+    for category, tool_name, api_name in list(src_store.iter_apis()):
+        records, _, _ = src_store.load_api(category, tool_name, api_name)
+        if not records:
+            continue
+        merged, _, _ = dst_store.load_api(category, tool_name, api_name)
+        merged.update(records)
+        dst_store.write_api(category, tool_name, api_name, merged)
+        num_apis += 1
+        num_entries += len(records)
+    return num_apis, num_entries
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--src_backend', type=str, default="directory", choices=["directory", "sqlite"], required=False, help='backend of the source cache')
+    parser.add_argument('--src', type=str, default="./tool_response_cache", required=False, help='source cache folder or database file')
+    parser.add_argument('--dst_backend', type=str, default="sqlite", choices=["directory", "sqlite"], required=False, help='backend of the destination cache')
+    parser.add_argument('--dst', type=str, default="./tool_response_cache.db", required=False, help='destination cache folder or database file')
+    args = parser.parse_args()
+
+    src_store = open_cache_store(args.src_backend, args.src)
+    dst_store = open_cache_store(args.dst_backend, args.dst)
+    num_apis, num_entries = convert_cache(src_store, dst_store)
+    src_store.close()
+    dst_store.close()
+    print(f"Copied {num_entries} entries of {num_apis} APIs from {args.src} ({args.src_backend}) to {args.dst} ({args.dst_backend})")
@@ -0,0 +1,94 @@
+import re
+import heapq
+from collections import OrderedDict
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def _input_features(tool_input):
+    """Key set and value token set of a tool input, used for similarity scoring."""
+    if isinstance(tool_input, dict):
+        keys = frozenset(tool_input)
+        values = tool_input.values()
+    else:
+        keys = frozenset()
+        values = [tool_input]
+    tokens = frozenset(token for value in values for token in TOKEN_PATTERN.findall(str(value).lower()))
+    return keys, tokens
+
+
+def _jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class ExampleSelector:
+    """
+    Picks the cached (input, output) pairs most similar to an incoming tool input as
+    few-shot examples for the simulator prompt.
+
+    Every cached record is serialized once, as `str((input, output))`, and kept per API
+    together with its length and input features, so a prompt's examples are ranked by
+    key overlap + value token overlap and packed under the character budget in one pass.
+    The per-API serializations are kept in an LRU bounded by `max_apis`. A serialization is
+    reused only while its record is the same object: an overwritten or reloaded record is
+    serialized again. `update` / `invalidate` drop the serializations of changed records.
+    """
+
+    def __init__(self, max_examples=5, budget=2048, max_apis=2048):
+        self.max_examples = max_examples
+        self.budget = budget
+        self.max_apis = max_apis
+        # (category, tool_name, api_name) -> {record_key: (serialized, keys, tokens, record)}
+        self._serialized = OrderedDict()
+
+    def _api_examples(self, api_key, records):
+        examples = self._serialized.get(api_key)
+        if examples is None:
+            examples = self._serialized[api_key] = {}
+            while len(self._serialized) > self.max_apis:
+                self._serialized.popitem(last=False)
+        else:
+            self._serialized.move_to_end(api_key)
+        for record_key, record in records.items():
+            example = examples.get(record_key)
+            if example is None or example[3] is not record:
+                keys, tokens = _input_features(record["input"])
+                examples[record_key] = (str((record["input"], record["output"])), keys, tokens, record)
+        return examples
+
+    def update(self, api_key, record_key):
+        """The record of `record_key` was written: drop its serialization."""
+        examples = self._serialized.get(api_key)
+        if examples is not None:
+            examples.pop(record_key, None)
+
+    def invalidate(self, api_key):
+        """Records of the API were deleted (maintenance): drop all of its serializations."""
+        self._serialized.pop(api_key, None)
+
+    def select(self, api_key, records, tool_input):
+        """Return the serialized example list (`[(input, output), ...]`) for the prompt."""
+        if not records:
+            return "[]"
+        examples = self._api_examples(api_key, records)
+        keys, tokens = _input_features(tool_input)
+        candidates = [examples[record_key] for record_key in records]
+        ranked = heapq.nlargest(
+            self.max_examples,
+            candidates,
+            key=lambda example: _jaccard(keys, example[1]) + _jaccard(tokens, example[2]),
+        )
+        selected, length = [], 2
+        for serialized, _, _, _ in ranked:
+            # ", " separator between examples, "[]" around the list
+            added = len(serialized) + (2 if selected else 0)
+            if length + added > self.budget:
+                continue
+            selected.append(serialized)
+            length += added
+        if not selected:
+            # even the best example alone is over budget: keep a truncated one
+            return ("[" + ranked[0][0])[:self.budget]
+        return "[" + ", ".join(selected) + "]"
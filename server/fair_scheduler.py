@@ -0,0 +1,146 @@
+import time
+import asyncio
+import hashlib
+from collections import deque
+
+
+def tenant_name(key):
+    """Metric-safe name of an unconfigured toolbench key (the key itself is a secret)."""
+    if not key:
+        return "anonymous"
+    return "key-" + hashlib.sha256(key.encode("utf-8")).hexdigest()[:8]
+
+
+class _Tenant:
+    def __init__(self, name, weight, max_concurrency, token_budget):
+        self.name = name
+        self.weight = weight
+        self.max_concurrency = max_concurrency
+        self.token_budget = token_budget
+        self.waiters = deque()
+        self.in_flight = 0
+        # weighted virtual time: grows by 1 / weight per granted slot
+        self.vtime = 0.0
+        self.tokens = 0
+        self.window_start = time.monotonic()
+        self.granted = 0
+
+
+class FairScheduler:
+    """
+    Weighted fair sharing of `capacity` upstream slots between toolbench keys.
+
+    Every key (tenant) has its own FIFO of waiting calls. When a slot frees up it goes to
+    the tenant with waiters and the smallest virtual time, which advances by 1 / weight per
+    granted slot, so busy tenants share the upstream in proportion to their weights and a
+    single large sweep cannot starve the others. A tenant can further be capped to
+    `max_concurrency` slots and to `token_budget` upstream tokens per `budget_window`
+    seconds (0 disables either).
+
+    `tenants` maps a toolbench key to `{"name", "weight", "max_concurrency", "token_budget"}`;
+    unlisted keys get the defaults.
+    """
+
+    def __init__(self, capacity, tenants=None, default_weight=1, default_max_concurrency=0,
+                 default_token_budget=0, budget_window=3600):
+        self.capacity = capacity
+        self.tenant_config = tenants or {}
+        self.default_weight = default_weight
+        self.default_max_concurrency = default_max_concurrency
+        self.default_token_budget = default_token_budget
+        self.budget_window = budget_window
+        self.in_use = 0
+        self._tenants = {}
+
+    def tenant(self, key):
+        tenant = self._tenants.get(key)
+        if tenant is None:
+            config = self.tenant_config.get(key) or {}
+            tenant = self._tenants[key] = _Tenant(
+                name=config.get("name", tenant_name(key)),
+                weight=max(config.get("weight", self.default_weight), 1e-6),
+                max_concurrency=config.get("max_concurrency", self.default_max_concurrency),
+                token_budget=config.get("token_budget", self.default_token_budget),
+            )
+        return tenant
+
+    def budget_retry_after(self, key):
+        """Seconds until `key` has token budget again, or None if it has budget left."""
+        tenant = self.tenant(key)
+        if not tenant.token_budget:
+            return None
+        elapsed = time.monotonic() - tenant.window_start
+        if elapsed >= self.budget_window:
+            tenant.window_start += elapsed - elapsed % self.budget_window
+            tenant.tokens = 0
+            return None
+        if tenant.tokens < tenant.token_budget:
+            return None
+        return max(1, int(self.budget_window - elapsed) + 1)
+
+    def charge(self, key, tokens):
+        self.tenant(key).tokens += tokens
+
+    async def acquire(self, key):
+        tenant = self.tenant(key)
+        if not tenant.waiters and not tenant.in_flight:
+            # an idle tenant re-enters at the current virtual time instead of with saved credit
+            active = [t.vtime for t in self._tenants.values() if t.waiters or t.in_flight]
+            if active:
+                tenant.vtime = max(tenant.vtime, min(active))
+        waiter = asyncio.get_running_loop().create_future()
+        tenant.waiters.append(waiter)
+        self._dispatch()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # granted just before the cancellation: hand the slot on
+                self.release(key)
+            else:
+                try:
+                    tenant.waiters.remove(waiter)
+                except ValueError:
+                    pass
+            raise
+
+    def release(self, key):
+        tenant = self.tenant(key)
+        tenant.in_flight -= 1
+        self.in_use -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        while self.in_use < self.capacity:
+            eligible = [
+                tenant for tenant in self._tenants.values()
+                if tenant.waiters and (not tenant.max_concurrency or tenant.in_flight < tenant.max_concurrency)
+            ]
+            if not eligible:
+                return
+            tenant = min(eligible, key=lambda t: t.vtime)
+            waiter = tenant.waiters.popleft()
+            if waiter.cancelled():
+                continue
+            waiter.set_result(None)
+            self.in_use += 1
+            tenant.in_flight += 1
+            tenant.granted += 1
+            tenant.vtime += 1 / tenant.weight
+
+    @property
+    def waiting(self):
+        return sum(len(tenant.waiters) for tenant in self._tenants.values())
+
+    def stats(self):
+        return {
+            tenant.name: {
+                "weight": tenant.weight,
+                "in_flight": tenant.in_flight,
+                "waiting": len(tenant.waiters),
+                "granted": tenant.granted,
+                "tokens_in_window": tenant.tokens,
+                "token_budget": tenant.token_budget,
+            }
+            for tenant in self._tenants.values()
+        }
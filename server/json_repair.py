@@ -0,0 +1,111 @@
+import re
+import json
+
+CODE_FENCE_PATTERN = re.compile(r"^\s*```[a-zA-Z]*\s*|\s*```\s*$")
+PYTHON_LITERALS = {"True": "true", "False": "false", "None": "null"}
+
+
+def _strip_wrapping(text):
+    """Remove code fences and any prose around the outermost JSON object."""
+    text = CODE_FENCE_PATTERN.sub("", text.strip())
+    start = text.find("{")
+    if start > 0:
+        text = text[start:]
+    end = text.rfind("}")
+    if end != -1 and text[end + 1:].strip() and not text[end + 1:].strip().startswith(("}", "]", ",")):
+        text = text[:end + 1]
+    return text
+
+
+def _drop_trailing(out, chars):
+    while out and (out[-1].isspace() or out[-1] in chars):
+        out.pop()
+
+
+def _rewrite(text):
+    """
+    Single pass over `text` that converts single-quoted strings and Python literals,
+    drops trailing commas and closes an unterminated string and any open brackets.
+    Returns (rewritten text, whether it was truncated, i.e. something had to be closed).
+    """
+    out = []
+    stack = []
+    quote = None  # quote char of the string we are in, if any
+    i = 0
+    while i < len(text):
+        c = text[i]
+        if quote is not None:
+            if c == "\\" and i + 1 < len(text):
+                nxt = text[i + 1]
+                # \' is not a valid JSON escape
+                out.append("'" if nxt == "'" else c + nxt)
+                i += 2
+                continue
+            if c == quote:
+                out.append('"')
+                quote = None
+            elif c == '"':
+                # a double quote inside a single-quoted string
+                out.append('\\"')
+            elif c == "\n":
+                out.append("\\n")
+            else:
+                out.append(c)
+            i += 1
+            continue
+        if c in "\"'":
+            quote = c
+            out.append('"')
+        elif c in "{[":
+            stack.append("}" if c == "{" else "]")
+            out.append(c)
+        elif c in "}]":
+            _drop_trailing(out, ",")
+            if stack:
+                stack.pop()
+            out.append(c)
+        elif c.isalpha():
+            j = i
+            while j < len(text) and (text[j].isalnum() or text[j] == "_"):
+                j += 1
+            word = text[i:j]
+            out.append(PYTHON_LITERALS.get(word, word))
+            i = j
+            continue
+        else:
+            out.append(c)
+        i += 1
+    if quote is not None:
+        out.append('"')
+    if stack:
+        _drop_trailing(out, ",")
+        if out and out[-1] == ":":
+            out.append(" null")
+        for closer in reversed(stack):
+            out.append(closer)
+    return "".join(out), quote is not None or bool(stack)
+
+
+def repair_json(text, details=False):
+    """
+    Deterministically repair common breakages of almost-valid JSON produced by the
+    simulator model: code fences or prose around the object, trailing commas,
+    single-quoted strings, Python literals and truncated output (unterminated string
+    or unclosed brackets). Returns the repaired JSON string, or None if it still does
+    not parse. With `details` returns (repaired, truncated), `truncated` telling whether
+    the output was cut off and had to be completed.
+    """
+    if not isinstance(text, str) or not text.strip():
+        return (None, False) if details else None
+    candidate = _strip_wrapping(text)
+    try:
+        json.loads(candidate)
+        return (candidate, False) if details else candidate
+    except json.JSONDecodeError:
+        pass
+    candidate, truncated = _rewrite(candidate)
+    try:
+        json.loads(candidate)
+    except json.JSONDecodeError:
+        return (None, False) if details else None
+    return (candidate, truncated) if details else candidate
@@ -0,0 +1,115 @@
+'''
+Load test for the simulator servers against a local stub model.
+
+1. Start an OpenAI-compatible stub model that answers every completion after a fixed delay:
+    python load_test.py stub --port 12345 --delay 0.5
+2. Point `api_base` of the server config to `http://127.0.0.1:12345/v1` and start the server,
+   e.g. `python main_mirrorapi_cache.py`.
+3. Drive it with concurrent clients (unique inputs, so every request reaches the model):
+    python load_test.py run --url http://127.0.0.1:8080/virtual --tools_folder ../data/toolenv/tools --concurrency 64 --num_requests 640
+'''
+
+import time
+import json
+import random
+import asyncio
+import argparse
+
+import httpx
+
+from tool_index import ToolDocIndex
+
+
+def run_stub(port, delay):
+    import uvicorn
+    from fastapi import FastAPI
+    from fastapi.requests import Request
+
+    app = FastAPI()
+
+    @app.post('/v1/chat/completions')
+    async def chat_completions(request: Request):
+        body = await request.json()
+        await asyncio.sleep(delay)
+        content = json.dumps({"error": "", "response": f"stub response to: {body['messages'][-1]['content'][-80:]}"})
+        return {
+            "id": "stub", "object": "chat.completion", "created": int(time.time()), "model": body["model"],
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120},
+        }
+
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def build_payloads(tools_folder, num_requests):
+    index = ToolDocIndex(tools_folder)
+    index.build()
+    apis = [
+        (category, tool_name, api_name)
+        for (category, tool_name), entry in index._tools.items()
+        for api_name in entry["apis"]
+    ]
+    if not apis:
+        raise ValueError(f"No tools found in {tools_folder}")
+    payloads = []
+    for i in range(num_requests):
+        category, tool_name, api_name = random.choice(apis)
+        payloads.append({
+            "category": category,
+            "tool_name": tool_name,
+            "api_name": api_name,
+            "tool_input": json.dumps({"query": f"load test {i} {random.random()}"}),
+            "strip": "",
+            "toolbench_key": "",
+        })
+    return payloads
+
+
+async def run_load(url, payloads, concurrency, timeout):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+        async def send(payload):
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    response = await client.post(url, json=payload)
+                    response.raise_for_status()
+                    if response.json().get("error"):
+                        errors += 1
+                except Exception:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*[send(payload) for payload in payloads])
+        elapsed = time.perf_counter() - start
+    latencies.sort()
+    print(f"requests: {len(payloads)}, concurrency: {concurrency}, errors: {errors}")
+    print(f"elapsed: {elapsed:.2f}s, throughput: {len(payloads) / elapsed:.1f} req/s")
+    print(f"latency p50: {latencies[len(latencies) // 2]:.3f}s, p95: {latencies[int(len(latencies) * 0.95)]:.3f}s, max: {latencies[-1]:.3f}s")
+    return {"requests": len(payloads), "errors": errors, "elapsed": elapsed, "throughput": len(payloads) / elapsed}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    stub_parser = subparsers.add_parser("stub", help="run an OpenAI-compatible stub model")
+    stub_parser.add_argument('--port', type=int, default=12345, required=False, help='stub model port')
+    stub_parser.add_argument('--delay', type=float, default=0.5, required=False, help='seconds the stub takes per completion')
+    run_parser = subparsers.add_parser("run", help="send concurrent requests to a simulator server")
+    run_parser.add_argument('--url', type=str, default="http://127.0.0.1:8080/virtual", required=False, help='simulator endpoint')
+    run_parser.add_argument('--tools_folder', type=str, default="./tools", required=False, help='tools the requests are drawn from')
+    run_parser.add_argument('--concurrency', type=int, default=64, required=False, help='number of concurrent clients')
+    run_parser.add_argument('--num_requests', type=int, default=640, required=False, help='total number of requests')
+    run_parser.add_argument('--timeout', type=float, default=300, required=False, help='per-request timeout in seconds')
+    args = parser.parse_args()
+
+    if args.command == "stub":
+        run_stub(args.port, args.delay)
+    else:
+        random.seed(42)
+        payloads = build_payloads(args.tools_folder, args.num_requests)
+        asyncio.run(run_load(args.url, payloads, args.concurrency, args.timeout))
@@ -2,15 +2,27 @@ from fastapi import FastAPI
 from pydantic import BaseModel
 from fastapi import FastAPI
 from fastapi.requests import Request
+from fastapi import HTTPException
+from fastapi.responses import PlainTextResponse
 import uvicorn
 import time
 import asyncio
 from datetime import datetime
 import json
-import os, yaml
+import yaml
 import requests
-from typing import Union
+from typing import Union, List
 from utils import standardize, change_name
+from tool_index import ToolDocIndex
+from cache import ApiResponseCache, open_cache_store, cache_key
+from singleflight import SingleFlight
+from upstream import UpstreamClient, UpstreamOverloaded
+from fair_scheduler import FairScheduler
+from metrics import MetricsRegistry
+from examples import ExampleSelector
+from json_repair import repair_json
+from stub_simulator import SchemaStubSimulator
+from cache_maintenance import maintain
 
 from fastapi import FastAPI
 from slowapi.errors import RateLimitExceeded
@@ -19,7 +31,6 @@ from slowapi.util import get_remote_address
 from tenacity import retry, wait_random_exponential, stop_after_attempt
 
 import textwrap
-import aiofiles
 from colorama import init, Fore, Style
 
 # Initialize colorama for cross-platform color support
@@ -46,14 +57,97 @@ config_file='config.yml'
 CONFIG = yaml.load(open(config_file, 'r'), Loader=yaml.FullLoader)
 print(CONFIG)
 CACHE_FOLDER = CONFIG['cache_folder']
-
-# OpenAI API - Use AsyncOpenAI for concurrent requests
-from openai import AsyncOpenAI
+# number of uvicorn worker processes; they share the cache store (file locks or SQLite)
+WORKERS = CONFIG.get('workers', 1)
+# in-memory LRU over the per-API cache files, bounded by resident APIs and bytes
+# the store is either the cache folder tree ("directory") or one SQLite file ("sqlite"),
+# optionally as the writable overlay of a read-only cache pack (`cache_pack`)
+CACHE_BACKEND = CONFIG.get('cache_backend', 'directory')
+RESPONSE_CACHE = ApiResponseCache(
+    open_cache_store(CACHE_BACKEND, CACHE_FOLDER if CACHE_BACKEND == 'directory' else CONFIG['cache_db'], pack=CONFIG.get('cache_pack')),
+    max_entries=CONFIG.get('cache_max_entries', 2048),
+    max_bytes=CONFIG.get('cache_max_bytes', 256 * 1024 * 1024),
+)
+
+# OpenAI API - one shared AsyncOpenAI client (created at startup) for concurrent requests
 if 'api_base' in CONFIG:
     OPENAI_API_BASE=CONFIG['api_base']
 else:
     OPENAI_API_BASE="https://api.openai.com/v1"
 OPENAI_API_KEY=CONFIG['api_key']
+UPSTREAM = None
+
+# few-shot examples for the simulator prompt, pre-serialized per API
+EXAMPLES = ExampleSelector(
+    max_examples=CONFIG.get('example_num', 5),
+    budget=CONFIG.get('example_max_chars', 2048),
+    max_apis=CONFIG.get('cache_max_entries', 2048),
+)
+
+# compiled tool catalog (python -m toolbench.tool_catalog compile), memory-mapped
+if CONFIG.get('tools_catalog'):
+    # the reader is toolbench/tool_catalog.py: run with the repository root on PYTHONPATH
+    from toolbench.tool_catalog import ToolCatalog
+    TOOL_CATALOG = ToolCatalog(CONFIG['tools_catalog'])
+else:
+    TOOL_CATALOG = None
+
+# "llm" asks the simulator model, "stub" answers from response schemas and cached examples
+SIMULATION_MODE = CONFIG.get('simulation_mode', 'llm')
+STUB_SIMULATOR = SchemaStubSimulator(CONFIG.get('response_examples_folder', './response_examples'), catalog=TOOL_CATALOG)
+
+# identical in-flight simulations share one upstream call and one cache write
+SIMULATIONS = SingleFlight()
+
+# in-process metrics, exported in Prometheus text format at /metrics
+METRICS = MetricsRegistry()
+REQUESTS = METRICS.counter("simulator_requests_total", "Tool call requests by outcome.", ["outcome"])
+REQUESTS_IN_FLIGHT = METRICS.gauge("simulator_requests_in_flight", "Tool call requests being processed.")
+UPSTREAM_IN_FLIGHT = METRICS.gauge("simulator_upstream_requests_in_flight", "Upstream completions in flight.")
+UPSTREAM_LATENCY = METRICS.histogram("simulator_upstream_latency_seconds", "Latency of upstream completions.", ["model", "endpoint"])
+UPSTREAM_FAILURES = METRICS.counter("simulator_upstream_failures_total", "Simulations that returned the fake error after all retries.", ["model", "endpoint"])
+UPSTREAM_ERRORS = METRICS.counter("simulator_upstream_errors_total", "Upstream calls that raised an exception.", ["model", "endpoint"])
+JSON_REPAIRS = METRICS.counter("simulator_json_repairs_total", "Local repairs of invalid upstream JSON by result.", ["model", "endpoint", "result"])
+INVALID_JSON_RETRIES = METRICS.counter("simulator_invalid_json_retries_total", "Upstream responses that were not valid JSON.", ["model", "endpoint"])
+TOKENS = METRICS.counter("simulator_upstream_tokens_total", "Upstream token usage.", ["model", "endpoint", "type"])
+COALESCED = METRICS.counter("simulator_coalesced_requests_total", "Requests that joined an identical in-flight simulation.")
+CACHE_STATS = METRICS.gauge("simulator_response_cache", "In-memory response cache statistics.", ["stat"])
+UPSTREAM_POOL = METRICS.gauge("simulator_upstream_pool", "Shared upstream client statistics.", ["stat"])
+UPSTREAM_QUEUE_DEPTH = METRICS.gauge("simulator_upstream_queue_depth", "Upstream calls waiting for a concurrency slot.")
+UPSTREAM_REJECTIONS = METRICS.counter("simulator_upstream_rejections_total", "Requests rejected with HTTP 429 by admission control.", ["reason", "tenant"])
+TENANT_REQUESTS = METRICS.counter("simulator_tenant_upstream_requests_total", "Upstream completions per toolbench key.", ["tenant"])
+TENANT_LATENCY = METRICS.histogram("simulator_tenant_upstream_latency_seconds", "Upstream completion latency per toolbench key, queueing included.", ["tenant"])
+TENANT_TOKENS = METRICS.counter("simulator_tenant_tokens_total", "Upstream token usage per toolbench key.", ["tenant", "type"])
+UPSTREAM_ENDPOINTS = METRICS.gauge("simulator_upstream_endpoint", "Routing statistics per upstream endpoint.", ["endpoint", "stat"])
+TENANT_SCHEDULER = METRICS.gauge("simulator_tenant_scheduler", "Fair scheduler state per toolbench key.", ["tenant", "stat"])
+
+def collect_metrics():
+    # SingleFlight keeps its own running count: catch the counter up with it
+    COALESCED.inc(SIMULATIONS.coalesced - COALESCED.get())
+    for stat, value in RESPONSE_CACHE.stats().items():
+        if not isinstance(value, str):
+            CACHE_STATS.set(value, stat=stat)
+    if UPSTREAM is not None:
+        UPSTREAM_QUEUE_DEPTH.set(UPSTREAM.waiting)
+        for stat, value in UPSTREAM.stats().items():
+            UPSTREAM_POOL.set(value, stat=stat)
+        for endpoint, stats in UPSTREAM.pool.stats().items():
+            for stat, value in stats.items():
+                UPSTREAM_ENDPOINTS.set(value, endpoint=endpoint, stat=stat)
+        for tenant, stats in UPSTREAM.scheduler.stats().items():
+            for stat, value in stats.items():
+                TENANT_SCHEDULER.set(value, tenant=tenant, stat=stat)
+
+METRICS.add_collector(collect_metrics)
+
+def upstream_labels(endpoint):
+    """Metric labels of an upstream call: the endpoint that handled it and the model it served."""
+    if endpoint is None:
+        return {"model": CONFIG['model'], "endpoint": ""}
+    return {"model": endpoint.served_model(CONFIG['model']), "endpoint": endpoint.name}
+
+# tool documentation, indexed by (category, tool) and normalized api name
+TOOL_INDEX = ToolDocIndex(CONFIG['tools_folder'], catalog=TOOL_CATALOG)
 
 limiter = Limiter(key_func=get_remote_address)
 app = FastAPI()
@@ -109,6 +203,21 @@ def prepare_tool_name_and_url(info):
 @app.post('/virtual')
 # @retry(wait=wait_random_exponential(min=1, max=40), stop=stop_after_attempt(1))
 async def get_virtual_response(request: Request, info: Info):
+    REQUESTS_IN_FLIGHT.inc()
+    try:
+        return await simulate_virtual_response(info)
+    except UpstreamOverloaded as e:
+        # fail fast and honestly instead of queueing into a fake "API call failed" response
+        REQUESTS.inc(outcome="rejected")
+        UPSTREAM_REJECTIONS.inc(reason=e.reason, tenant=e.tenant)
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except Exception:
+        REQUESTS.inc(outcome="error")
+        raise
+    finally:
+        REQUESTS_IN_FLIGHT.dec()
+
+async def simulate_virtual_response(info: Info):
     user_key = info.toolbench_key
 
     print('#'*30)
@@ -120,6 +229,7 @@ async def get_virtual_response(request: Request, info: Info):
 
     if api_name == "chat_with_user":
         response_dict = {"error": "", "response": "Chat with user."}
+        REQUESTS.inc(outcome="chat_with_user")
         return response_dict
     
     try:
@@ -134,24 +244,23 @@ async def get_virtual_response(request: Request, info: Info):
             print(type(tool_input))
             print(tool_input)
             response_dict = {"error": f"Tool input parse error...\n", "response": ""}
+            REQUESTS.inc(outcome="parse_error")
             return response_dict
-    if not os.path.exists(CACHE_FOLDER):
-        os.mkdir(CACHE_FOLDER)
-
-    # load from cache (async file I/O)
+    # load from cache (in-memory LRU, falls back to async file I/O on a miss)
     cache = {}
     # prerequisite: to read files correctly, "my_tools_cache" folder and "toolenv/tools/" folder should be available
     try:
-        cache_file_path = os.path.join(CACHE_FOLDER, standard_category, tool_name, api_name+".json")
-        if os.path.exists(cache_file_path):
-            async with aiofiles.open(cache_file_path, 'r') as f:
-                content = await f.read()
-                tools_cache_record = json.loads(content)
-                cache.update(tools_cache_record)
-                if str(tool_input) in cache:
-                    debug_print("using cached real response")
-                    response_dict = cache[str(tool_input)]
-                    return response_dict
+        cache = await RESPONSE_CACHE.get(standard_category, tool_name, api_name)
+        record_key = cache_key(tool_input)
+        if record_key not in cache and WORKERS > 1:
+            # another worker may have simulated it since this API was loaded
+            cache = await RESPONSE_CACHE.refresh(standard_category, tool_name, api_name)
+        if record_key in cache:
+            RESPONSE_CACHE.record_access(standard_category, tool_name, api_name, record_key)
+            debug_print("using cached real response")
+            response_dict = cache[record_key]["output"]
+            REQUESTS.inc(outcome="cache_hit")
+            return response_dict
     except Exception as e:
         error_print(f"Loading cache error: {e}")
 
@@ -164,67 +273,86 @@ async def get_virtual_response(request: Request, info: Info):
         'api_info': "",
     }
     try:
-        tools_json_path = os.path.join(CONFIG['tools_folder'], standard_category, tool_name_original.split("_for_")[0]+".json")
-        debug_print(f"tools_json_path: {tools_json_path}")
-        if os.path.exists(tools_json_path):
-            # read json (async file I/O)
-            async with aiofiles.open(tools_json_path, 'r') as f:
-                content = await f.read()
-                api_intro = json.loads(content)
+        # O(1) lookup in the tool doc index built at startup
+        tool_doc = TOOL_INDEX.get_tool(standard_category, tool_name_original.split("_for_")[0])
+        if tool_doc is not None:
             # get tool_dexcription and api_info
-            tool_description = api_intro['tool_description']
-            api_info = []
-            available_api_names = []
-            for api in api_intro['api_list']:
-                # Match using the same normalization as prepare_tool_name_and_url
-                # which uses change_name(standardize(...))
-                normalized_api_name = change_name(standardize(api['name']))
-                available_api_names.append(f"{api['name']} -> {normalized_api_name}")
-                if api_name == normalized_api_name:
-                    api_info.append(api)
+            # api names are indexed with the same normalization as prepare_tool_name_and_url
+            api_info = tool_doc['apis'].get(api_name, [])
+            available_api_names = tool_doc['available_api_names']
             # check invalid api name
             if len(api_info) == 0:
                 error_print(f"cannot match api name: looking for '{api_name}'. Available APIs (original -> normalized): {available_api_names[:10]}...")
                 # Return error response if API name cannot be matched
+                REQUESTS.inc(outcome="doc_not_found")
                 return {"error": f"Cannot match API name: '{api_name}'. Available APIs (first 5): {[name.split(' -> ')[1] for name in available_api_names[:5]]}", "response": ""}
             api_doc = {
-                'tool_description': tool_description,
+                'tool_description': tool_doc['tool_description'],
                 'api_info': api_info
             }
         else:
             error_print(f"cannot get {tool_name_original}")
             # Return error response if tool file doesn't exist
+            REQUESTS.inc(outcome="doc_not_found")
             return {"error": f"Cannot find tool definition file for: {tool_name_original}", "response": ""}
     except Exception as e:
         error_print(f"loading api_doc error: {e}")
         # Return error response if there's an exception loading api_doc
+        REQUESTS.inc(outcome="doc_not_found")
         return {"error": f"Error loading API documentation: {str(e)}", "response": ""}
 
-    # get several examples from cache
-    example_num = 5
-    # get top example_num examples
-    api_example = list(cache.items())[:example_num]
-    while len(str(api_example)) > 2048 and example_num > 1:
-        example_num -= 1
-        api_example = list(cache.items())[:example_num]
+    if SIMULATION_MODE == 'stub':
+        # deterministic, no model call and nothing written to the cache
+        REQUESTS.inc(outcome="stubbed")
+        return STUB_SIMULATOR.simulate(
+            standard_category, tool_name_original.split("_for_")[0], api_name, api_doc, tool_input, cache, cache_key(tool_input)
+        )
+
+    # get the cached examples most similar to tool_input, serialized under the prompt budget
+    api_example = EXAMPLES.select((standard_category, tool_name, api_name), cache, tool_input)
 
     # Additional check: ensure api_info is not empty before calling the function
     if not api_doc.get('api_info') or len(api_doc['api_info']) == 0:
+        REQUESTS.inc(outcome="doc_not_found")
         return {"error": f"API information is empty for API: {api_name}", "response": ""}
     
     debug_print(f"api example: {api_example}")
     debug_print(f"tool_input: {tool_input}")
     debug_print(f"api_doc: {api_doc}")
         
-    result = await fake_response_function_chat(api_example,tool_input,api_doc)
+    async def simulate_and_save():
+        result, truncated = await fake_response_function_chat(api_example,tool_input,api_doc,user_key)
+        # a truncated response completed locally is served but not cached, so a later call can get a clean one
+        if CONFIG['is_save'] and not truncated:
+            await save_cache(tool_input, result, standard_category, tool_name, api_name)
+        return result
 
-    if CONFIG['is_save']:
-        await save_cache(cache, tool_input, result, standard_category, tool_name, api_name)
+    result = await SIMULATIONS.do((standard_category, tool_name, api_name, cache_key(tool_input)), simulate_and_save)
+    REQUESTS.inc(outcome="simulated")
     if not isinstance(result, dict):
         return json.loads(result)
     else:
         return result
     
+@app.post('/virtual/batch')
+async def get_virtual_batch_response(request: Request, infos: List[Info]):
+    """
+    Simulate a list of tool calls in one request. Cache hits are resolved right away and
+    the misses are sent to the upstream model concurrently; results keep the request order
+    and a failing item gets its own error instead of failing the whole batch.
+    """
+    batch_max_size = CONFIG.get('batch_max_size', 64)
+    if len(infos) > batch_max_size:
+        raise HTTPException(status_code=413, detail=f"Batch size {len(infos)} exceeds batch_max_size={batch_max_size}")
+    results = await asyncio.gather(*[get_virtual_response(request, info) for info in infos], return_exceptions=True)
+    for i, result in enumerate(results):
+        if isinstance(result, HTTPException):
+            results[i] = {"error": f"Simulation error: {result.detail}", "response": ""}
+        elif isinstance(result, Exception):
+            error_print(f"Batch item {i} failed: {result}")
+            results[i] = {"error": f"Simulation error: {str(result)}", "response": ""}
+    return results
+
 def is_valid_json(result):
     """
     Checks if the given string is valid JSON.
@@ -240,63 +368,37 @@ def is_valid_json(result):
         result = json.loads(result)
         return True
     except Exception as e:
-        error_print(f"Can not parse result into json: {result}")
-        return False
-
-def check_result(processes_value: dict):
-    if 'error' not in processes_value or processes_value['error'] != '':
-        return False
-    if 'response' not in processes_value:
-        return False
-    response = str(processes_value['response'])
-    if 'got an unexpected keyword argument' in response.lower():
-        return True
-    elif 'rate limit' in response.lower() or 'time out' in response.lower() or 'timed out' in response.lower() or 'does not exist' in response.lower() or '404' in response.lower() or '504' in response.lower() or '500' in response.lower() or 'internal error' in response.lower() or 'API doesn\'t exists' in response.lower() or "API doesn\'t exists" in response.lower() or response == '{\'message\': "API doesn\'t exists"}' or 'Service Not Found' in response:
-        return False
-    elif 'authoriz' in response.lower() or 'authenticat' in response.lower() or 'unauthorized' in response.lower() or 'blocked user' in response.lower() or 'unsubscribe' in response.lower() or 'blocked' in response.lower() or '401' in response.lower() or '403' in response.lower() or 'credential' in response.lower() or 'unauthenticated' in response.lower() or 'disabled for your subscription' in response.lower() or 'ACCESS_DENIED' in response or 'invalid consumer key' in response.lower():
-        return False
-    elif 'parameter' in response.lower() or 'parse' in response.lower() or 'is not defined' in response.lower():
-        return False
-    elif len(response) == 0:
-        return False
-    elif "status_code=50" in response or "status_code=429" in response:
+        # usually fixed by repair_json, logged as an error only if that fails too
+        debug_print(f"Can not parse result into json: {result}")
         return False
-    return True
 
-async def save_cache(cache, tool_input, result, standard_category, tool_name, api_name, save_folder=CACHE_FOLDER):
-    # save cache (async file I/O)
+async def save_cache(tool_input, result, standard_category, tool_name, api_name):
+    # save cache (write-through the in-memory LRU to the per-API journal)
     try:
         if isinstance(result, dict):
-            cache[str(tool_input)] = result
+            result_dict = result
         elif isinstance(result, str):
             try:
                 result_dict = json.loads(result)
-                cache[str(tool_input)] = result_dict
             except Exception as e:
                 error_print(f"Load result failed: {e}")
                 return
-
-        # Create directories if they don't exist
-        category_dir = os.path.join(save_folder, standard_category)
-        tool_dir = os.path.join(category_dir, tool_name)
-        if not os.path.exists(category_dir):
-            os.makedirs(category_dir, exist_ok=True)
-        if not os.path.exists(tool_dir):
-            os.makedirs(tool_dir, exist_ok=True)
-        
-        # Write cache file asynchronously
-        cache_file_path = os.path.join(tool_dir, api_name+".json")
-        async with aiofiles.open(cache_file_path, 'w') as f:
-            await f.write(json.dumps(cache, indent=4))
+        else:
+            return
+        await RESPONSE_CACHE.put(standard_category, tool_name, api_name, tool_input, result_dict)
+        EXAMPLES.update((standard_category, tool_name, api_name), cache_key(tool_input))
     except Exception as e:
         error_print(f"Save cache failed: {e}")
 
-async def fake_response_function_chat(api_example, tool_input, api_doc):
+async def fake_response_function_chat(api_example, tool_input, api_doc, toolbench_key=""):
     '''
-    api_example: list of tuple, [(input, output), ...]
+    api_example: str, serialized list of tuple, [(input, output), ...]
     tool_input: dict, input of the tool
     api_doc: dict, api document
+    toolbench_key: str, tenant the upstream call is scheduled and accounted for
+    returns (result, truncated): the JSON result string, and whether it was a truncated output completed by repair_json
     '''
+    tenant = UPSTREAM.scheduler.tenant(toolbench_key).name
     system_prompt = textwrap.dedent("""
         You are an advanced API Simulator and Validator. Your role is to act as a real API server, strictly adhering to the provided documentation to process requests.
 
@@ -334,56 +436,82 @@ async def fake_response_function_chat(api_example, tool_input, api_doc):
     )
     system_prompt = {"role": "system", "content": system_prompt}
 
-    # user prompt, truncated to 2048 characters if too long
-    user_prompt = f"API Documentation: \n{str(api_doc)}\n\nAPI Examples: \n{str(api_example)[:2048]}\n\nAPI Input: \n{str(tool_input)}\n"
+    # user prompt, the examples already fit in the example_max_chars budget
+    user_prompt = f"API Documentation: \n{str(api_doc)}\n\nAPI Examples: \n{api_example}\n\nAPI Input: \n{str(tool_input)}\n"
     user_prompt = {"role": "user", "content": user_prompt}
 
-    # Use AsyncOpenAI for concurrent API calls
-    client = AsyncOpenAI(
-        api_key = OPENAI_API_KEY,
-        base_url = OPENAI_API_BASE,
-    )
     max_retries = 3 
+    labels = upstream_labels(None)
     flag = False
+    truncated = False
     result = None
     for attempt in range(max_retries):
         try:
-            response = await client.chat.completions.create(
-                model = CONFIG['model'],
-                messages=[system_prompt, user_prompt],
-                max_tokens = 1024,
-                temperature=CONFIG['temperature'],
-                response_format={"type": "json_object"},
-            )
+            # shared client; waits here for a fair share of the upstream_max_concurrency slots
+            queued = time.monotonic()
+            async with UPSTREAM.slot(toolbench_key) as pool:
+                UPSTREAM_IN_FLIGHT.inc()
+                start = time.monotonic()
+                try:
+                    endpoint, response = await pool.complete(
+                        model = CONFIG['model'],
+                        messages=[system_prompt, user_prompt],
+                        max_tokens = 1024,
+                        temperature=CONFIG['temperature'],
+                        response_format={"type": "json_object"},
+                    )
+                finally:
+                    UPSTREAM_IN_FLIGHT.dec()
+            # an `upstreams` entry may override the model: label with the one that answered
+            labels = upstream_labels(endpoint)
+            UPSTREAM_LATENCY.observe(time.monotonic() - start, **labels)
+            TENANT_LATENCY.observe(time.monotonic() - queued, tenant=tenant)
+            TENANT_REQUESTS.inc(tenant=tenant)
             result = response.choices[0].message.content
             
-            # Print token usage information
+            # Count token usage (exported at /metrics)
             if hasattr(response, 'usage') and response.usage:
                 usage = response.usage
-                prompt_tokens = getattr(usage, 'prompt_tokens', 0)
-                completion_tokens = getattr(usage, 'completion_tokens', 0)
-                total_tokens = getattr(usage, 'total_tokens', 0)
+                prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+                completion_tokens = getattr(usage, 'completion_tokens', 0) or 0
                 
                 # Check for reasoning/thinking tokens (for reasoning models like o1, o3)
                 reasoning_tokens = getattr(usage, 'completion_tokens_details', None)
                 reasoning_tokens = getattr(reasoning_tokens, 'reasoning_tokens', None) if reasoning_tokens else None
                 
+                TOKENS.inc(prompt_tokens, **labels, type="prompt")
+                TOKENS.inc(completion_tokens, **labels, type="completion")
+                TENANT_TOKENS.inc(prompt_tokens, tenant=tenant, type="prompt")
+                TENANT_TOKENS.inc(completion_tokens, tenant=tenant, type="completion")
+                UPSTREAM.charge(toolbench_key, prompt_tokens + completion_tokens)
                 if reasoning_tokens is not None:
-                    # For reasoning models: show reasoning tokens separately
-                    info_print(f"OpenAI API token usage - prompt: {prompt_tokens}, reasoning: {reasoning_tokens}, completion: {completion_tokens}, total: {total_tokens}")
-                else:
-                    # For standard models: show standard token usage
-                    info_print(f"OpenAI API token usage - prompt: {prompt_tokens}, completion: {completion_tokens}, total: {total_tokens}")
+                    TOKENS.inc(reasoning_tokens, **labels, type="reasoning")
+                debug_print(f"OpenAI API token usage - prompt: {prompt_tokens}, reasoning: {reasoning_tokens}, completion: {completion_tokens}")
             
             if "```json" in result:
                 result = result.replace("```json", "").replace("```", "").strip()
             if is_valid_json(result):
                 flag = True
                 break
+            # fix trailing commas, quotes, truncation... locally before paying for a retry
+            repaired, truncated = repair_json(result, details=True)
+            if repaired is not None:
+                JSON_REPAIRS.inc(**labels, result="success")
+                result = repaired
+                flag = True
+                break
+            JSON_REPAIRS.inc(**labels, result="failure")
+            error_print(f"Can not parse or repair result into json: {result}")
+            INVALID_JSON_RETRIES.inc(**labels)
             warn_print(f"Invalid JSON response on attempt {attempt + 1}. Retrying...")
             await asyncio.sleep(1)  # Async sleep instead of time.sleep
+        except UpstreamOverloaded:
+            # not admitted: surfaced to the client as HTTP 429
+            raise
         except Exception as e:
             error_print(f"OpenAI API call failed on attempt {attempt + 1}: {e}")
+            labels = upstream_labels(getattr(e, 'upstream_endpoint', None))
+            UPSTREAM_ERRORS.inc(**labels)
             if attempt < max_retries - 1:
                 await asyncio.sleep(1)
             else:
@@ -392,13 +520,130 @@ async def fake_response_function_chat(api_example, tool_input, api_doc):
     debug_print(f"result: {result}")
 
     if flag:
-        return result
+        return result, truncated
     else:
+        UPSTREAM_FAILURES.inc(**labels)
         fake_error = {
             "error": "The API call failed. Please try again later.",
             "response": "",
         }
-        return json.dumps(fake_error)
+        return json.dumps(fake_error), False
+
+@app.on_event("startup")
+async def build_tool_index():
+    # parse every tool file once; reload the changed ones every tools_reload_interval seconds,
+    # unless a compiled catalog is loaded: that is updated by recompiling it, not by walking the tree
+    indexed = await asyncio.to_thread(TOOL_INDEX.build)
+    info_print(f"Indexed {indexed} tools from {CONFIG['tools_folder']}")
+    async def reload_loop():
+        while True:
+            await asyncio.sleep(CONFIG.get('tools_reload_interval', 60))
+            try:
+                reloaded = await asyncio.to_thread(TOOL_INDEX.refresh)
+                if reloaded:
+                    info_print(f"Reloaded {reloaded} tools")
+            except Exception as e:
+                error_print(f"Reloading tools failed: {e}")
+    if TOOL_CATALOG is None:
+        asyncio.create_task(reload_loop())
+
+@app.on_event("startup")
+async def create_upstream_client():
+    global UPSTREAM
+    if SIMULATION_MODE == 'stub':
+        # no model calls: no upstream client, admission slots or LLM credentials needed
+        info_print("Stub simulation mode, not connecting to the simulator model")
+        return
+    UPSTREAM = UpstreamClient(
+        api_key=OPENAI_API_KEY,
+        base_url=OPENAI_API_BASE,
+        max_concurrency=CONFIG.get('upstream_max_concurrency', 32),
+        max_connections=CONFIG.get('upstream_max_connections', 64),
+        max_keepalive_connections=CONFIG.get('upstream_max_keepalive_connections', 32),
+        timeout=CONFIG.get('upstream_timeout', 120),
+        max_queue_depth=CONFIG.get('upstream_max_queue_depth', 256),
+        queue_timeout=CONFIG.get('upstream_queue_timeout', 60),
+        # several OpenAI-compatible backends balanced by latency and outstanding requests
+        endpoints=CONFIG.get('upstreams'),
+        eject_after_failures=CONFIG.get('upstream_eject_after_failures', 3),
+        eject_seconds=CONFIG.get('upstream_eject_seconds', 30),
+        hedge_after=CONFIG.get('upstream_hedge_after', 0),
+        # weighted fair share of the upstream slots between toolbench keys
+        scheduler=FairScheduler(
+            CONFIG.get('upstream_max_concurrency', 32),
+            tenants=CONFIG.get('tenants'),
+            default_weight=CONFIG.get('tenant_default_weight', 1),
+            default_max_concurrency=CONFIG.get('tenant_default_max_concurrency', 0),
+            default_token_budget=CONFIG.get('tenant_default_token_budget', 0),
+            budget_window=CONFIG.get('tenant_budget_window', 3600),
+        ),
+    )
+
+@app.on_event("shutdown")
+async def close_upstream_client():
+    if UPSTREAM is not None:
+        await UPSTREAM.close()
+
+@app.on_event("startup")
+async def start_cache_compaction():
+    # fold the append-only cache journals into their snapshots in the background
+    async def compaction_loop():
+        while True:
+            await asyncio.sleep(CONFIG.get('cache_compact_interval', 300))
+            try:
+                await RESPONSE_CACHE.flush_access()
+                compacted = await RESPONSE_CACHE.compact_all(CONFIG.get('cache_compact_min_bytes', 0))
+                if compacted:
+                    info_print(f"Compacted {compacted} cache journals")
+            except Exception as e:
+                error_print(f"Cache compaction failed: {e}")
+    asyncio.create_task(compaction_loop())
+
+@app.on_event("startup")
+async def start_cache_maintenance():
+    # prune bad / expired responses and keep the store under cache_max_total_bytes
+    interval = CONFIG.get('cache_maintenance_interval', 0)
+    if not interval:
+        return
+    async def maintenance_loop():
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await RESPONSE_CACHE.flush_access()
+                report, touched = await asyncio.to_thread(
+                    maintain,
+                    RESPONSE_CACHE.store,
+                    prune_invalid=CONFIG.get('cache_prune_invalid', False),
+                    ttl=CONFIG.get('cache_ttl', 0),
+                    max_bytes=CONFIG.get('cache_max_total_bytes', 0),
+                    policy=CONFIG.get('cache_eviction_policy', 'lru'),
+                )
+                for category, tool_name, api_name in touched:
+                    RESPONSE_CACHE.invalidate(category, tool_name, api_name)
+                    EXAMPLES.invalidate((category, tool_name, api_name))
+                if touched:
+                    info_print(f"Cache maintenance: {report}")
+            except Exception as e:
+                error_print(f"Cache maintenance failed: {e}")
+    asyncio.create_task(maintenance_loop())
+
+@app.on_event("shutdown")
+async def flush_cache_access():
+    await RESPONSE_CACHE.flush_access()
+
+@app.get('/metrics', response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(METRICS.render(), media_type="text/plain; version=0.0.4")
+
+@app.get('/cache/stats')
+async def get_cache_stats():
+    return RESPONSE_CACHE.stats()
+
+@app.get('/upstream/stats')
+async def get_upstream_stats():
+    if UPSTREAM is None:
+        return {"simulation_mode": SIMULATION_MODE}
+    return UPSTREAM.stats()
 
 if __name__ == "__main__":
-    uvicorn.run(app="main:app", host="0.0.0.0", port=CONFIG['port'])
\ No newline at end of file
+    uvicorn.run(app="main:app", host="0.0.0.0", port=CONFIG['port'], workers=WORKERS)
\ No newline at end of file
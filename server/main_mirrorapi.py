@@ -1,15 +1,20 @@
-import os, sys
+import sys
 from fastapi import FastAPI
 from pydantic import BaseModel
 from fastapi import FastAPI
 from fastapi.requests import Request
+from fastapi.responses import PlainTextResponse
 import uvicorn
 import time
+import asyncio
 import json
 import yaml
 import requests
 from typing import Union
 from utils import standardize, change_name
+from tool_index import ToolDocIndex
+from json_repair import repair_json
+from metrics import MetricsRegistry
 
 from fastapi import FastAPI
 from slowapi.errors import RateLimitExceeded
@@ -31,6 +36,21 @@ else:
 OPENAI_API_KEY=CONFIG['api_key']
 
 
+# tool documentation, indexed by (category, tool) and normalized api name,
+# read lazily from the compiled tool catalog if there is one
+# compiled tool catalog (python -m toolbench.tool_catalog compile), memory-mapped
+if CONFIG.get('tools_catalog'):
+    # the reader is toolbench/tool_catalog.py: run with the repository root on PYTHONPATH
+    from toolbench.tool_catalog import ToolCatalog
+    TOOL_CATALOG = ToolCatalog(CONFIG['tools_catalog'])
+else:
+    TOOL_CATALOG = None
+TOOL_INDEX = ToolDocIndex(CONFIG['tools_folder'], catalog=TOOL_CATALOG)
+
+# in-process metrics, exported in Prometheus text format at /metrics
+METRICS = MetricsRegistry()
+JSON_REPAIRS = METRICS.counter("simulator_json_repairs_total", "Local repairs of invalid model JSON by result.", ["result"])
+
 limiter = Limiter(key_func=get_remote_address)
 app = FastAPI()
 app.state.limiter = limiter
@@ -142,35 +162,27 @@ def get_virtual_response(request: Request, info: Info):
         'api_info': "",
     }
     try:
-        if os.path.exists(os.path.join(CONFIG['tools_folder'], standard_category)):
-            if os.path.exists(os.path.join(CONFIG['tools_folder'], standard_category, tool_name_original.split("_for_")[0]+".json")):
-                # read json
-                api_intro = json.load(open(os.path.join(CONFIG['tools_folder'], standard_category, tool_name_original.split("_for_")[0]+".json"), "r"))
-                # get tool_dexcription and api_info
-                tool_description = api_intro['tool_description']
-                api_info = []
-                available_api_names = []
-                for api in api_intro['api_list']:
-                    # Match using the same normalization as prepare_tool_name_and_url
-                    # which uses change_name(standardize(...))
-                    normalized_api_name = change_name(standardize(api['name']))
-                    available_api_names.append(f"{api['name']} -> {normalized_api_name}")
-                    if api_name == normalized_api_name:
-                        api_info.append(api)
-                # check invalid api name
-                if len(api_info) == 0:
-                    print(f"cant match api name: looking for '{api_name}'")
-                    print(f"Available APIs (original -> normalized): {available_api_names[:10]}")
-                    # Return error response if API name cannot be matched
-                    return {"error": f"Cannot match API name: '{api_name}'. Available APIs (first 5): {[name.split(' -> ')[1] for name in available_api_names[:5]]}", "response": ""}
-                api_doc = {
-                    'tool_description': tool_description,
-                    'api_info': api_info
-                }
-            else:
-                print(f"cant get {tool_name_original}")
-                # Return error response if tool file doesn't exist
-                return {"error": f"Cannot find tool definition file for: {tool_name_original}", "response": ""}
+        # O(1) lookup in the tool doc index built at startup
+        tool_doc = TOOL_INDEX.get_tool(standard_category, tool_name_original.split("_for_")[0])
+        if tool_doc is not None:
+            # get tool_dexcription and api_info
+            # api names are indexed with the same normalization as prepare_tool_name_and_url
+            api_info = tool_doc['apis'].get(api_name, [])
+            available_api_names = tool_doc['available_api_names']
+            # check invalid api name
+            if len(api_info) == 0:
+                print(f"cant match api name: looking for '{api_name}'")
+                print(f"Available APIs (original -> normalized): {available_api_names[:10]}")
+                # Return error response if API name cannot be matched
+                return {"error": f"Cannot match API name: '{api_name}'. Available APIs (first 5): {[name.split(' -> ')[1] for name in available_api_names[:5]]}", "response": ""}
+            api_doc = {
+                'tool_description': tool_doc['tool_description'],
+                'api_info': api_info
+            }
+        else:
+            print(f"cant get {tool_name_original}")
+            # Return error response if tool file doesn't exist
+            return {"error": f"Cannot find tool definition file for: {tool_name_original}", "response": ""}
     except Exception as e:
         print(f"Loading api_doc error: {e}")
         # Return error response if there's an exception loading api_doc
@@ -210,6 +222,13 @@ def extract_attributes_json(output):
     try:
         output_dict = json.loads(output)
     except:
+        # fix trailing commas, quotes, truncation... locally before falling back to regexes
+        repaired = repair_json(output)
+        repaired_dict = json.loads(repaired) if repaired is not None else None
+        if isinstance(repaired_dict, dict) and 'error' in repaired_dict and 'response' in repaired_dict:
+            JSON_REPAIRS.inc(result="success")
+            return None, repaired_dict['error'], repaired_dict['response']
+        JSON_REPAIRS.inc(result="failure")
         # Regular expression to capture "error" and "response" fields
         if "mechanism_of_the_api" in output:
             pattern = (
@@ -243,27 +262,6 @@ def extract_attributes_json(output):
     return None, error, response
 
 
-def check_result(processes_value: dict):
-    if 'error' not in processes_value or processes_value['error'] != '':
-        return False
-    if 'response' not in processes_value:
-        return False
-    response = str(processes_value['response'])
-    if 'got an unexpected keyword argument' in response.lower():
-        return True
-    elif 'rate limit' in response.lower() or 'time out' in response.lower() or 'timed out' in response.lower() or 'does not exist' in response.lower() or '404' in response.lower() or '504' in response.lower() or '500' in response.lower() or 'internal error' in response.lower() or 'API doesn\'t exists' in response.lower() or "API doesn\'t exists" in response.lower() or response == '{\'message\': "API doesn\'t exists"}' or 'Service Not Found' in response:
-        return False
-    elif 'authoriz' in response.lower() or 'authenticat' in response.lower() or 'unauthorized' in response.lower() or 'blocked user' in response.lower() or 'unsubscribe' in response.lower() or 'blocked' in response.lower() or '401' in response.lower() or '403' in response.lower() or 'credential' in response.lower() or 'unauthenticated' in response.lower() or 'disabled for your subscription' in response.lower() or 'ACCESS_DENIED' in response:
-        return False
-    elif 'parameter' in response.lower() or 'parse' in response.lower() or 'is not defined' in response.lower():
-        return False
-    elif len(response) == 0:
-        return False
-    elif "status_code=50" in response or "status_code=429" in response:
-        return False
-    return True
-
-
 def fake_response_function_with_trained_simulator(tool_input, data, api_doc):
     '''
     api_example: list of tuple, [(input, output), ...]
@@ -327,8 +325,27 @@ Request:
         return json.dumps(fake_error)
 
 
-
-
+@app.get('/metrics', response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(METRICS.render(), media_type="text/plain; version=0.0.4")
+
+@app.on_event("startup")
+async def build_tool_index():
+    # parse every tool file once; reload the changed ones every tools_reload_interval seconds,
+    # unless a compiled catalog is loaded: that is updated by recompiling it, not by walking the tree
+    indexed = await asyncio.to_thread(TOOL_INDEX.build)
+    print(f"Indexed {indexed} tools from {CONFIG['tools_folder']}")
+    async def reload_loop():
+        while True:
+            await asyncio.sleep(CONFIG.get('tools_reload_interval', 60))
+            try:
+                reloaded = await asyncio.to_thread(TOOL_INDEX.refresh)
+                if reloaded:
+                    print(f"Reloaded {reloaded} tools")
+            except Exception as e:
+                print(f"Reloading tools failed: {e}")
+    if TOOL_CATALOG is None:
+        asyncio.create_task(reload_loop())
 
 if __name__ == "__main__":
     uvicorn.run(app="main_mirrorapi:app", host="0.0.0.0", port=CONFIG['port'])
\ No newline at end of file
@@ -1,21 +1,27 @@
-import os, sys
+import sys
 from fastapi import FastAPI
 from pydantic import BaseModel
 from fastapi import FastAPI
 from fastapi.requests import Request
+from fastapi.responses import PlainTextResponse, JSONResponse
 import uvicorn
 import time
+import asyncio
 import json
 import yaml
 import requests
 from typing import Union
 from utils import standardize, change_name
+from tool_index import ToolDocIndex
+from json_repair import repair_json
+from metrics import MetricsRegistry
+from cache import ApiResponseCache, open_cache_store, cache_key
+from upstream import UpstreamClient, UpstreamOverloaded
 
 from fastapi import FastAPI
 from slowapi.errors import RateLimitExceeded
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
-import openai
 import re
 
 
@@ -23,21 +29,64 @@ config_file='config_mirrorapi_cache.yml'
 CONFIG = yaml.load(open(config_file, 'r'), Loader=yaml.FullLoader)
 print(CONFIG)
 CACHE_FOLDER = CONFIG['cache_folder']
-
-
-from openai import OpenAI, AzureOpenAI
+# the store is either the cache folder tree ("directory") or one SQLite file ("sqlite"),
+# optionally as the writable overlay of a read-only cache pack (`cache_pack`)
+CACHE_BACKEND = CONFIG.get('cache_backend', 'directory')
+# in-memory LRU over the cache store; store reads run in worker threads
+RESPONSE_CACHE = ApiResponseCache(
+    open_cache_store(CACHE_BACKEND, CACHE_FOLDER if CACHE_BACKEND == 'directory' else CONFIG['cache_db'], pack=CONFIG.get('cache_pack')),
+    max_entries=CONFIG.get('cache_max_entries', 2048),
+    max_bytes=CONFIG.get('cache_max_bytes', 256 * 1024 * 1024),
+)
+
+
+# one shared AsyncOpenAI client, created at startup
 if 'api_base' in CONFIG:
     OPENAI_API_BASE=CONFIG['api_base']
 else:
     OPENAI_API_BASE="https://api.openai.com/v1"
 OPENAI_API_KEY=CONFIG['api_key']
+UPSTREAM = None
+
+
+# tool documentation, indexed by (category, tool) and normalized api name,
+# read lazily from the compiled tool catalog if there is one
+# compiled tool catalog (python -m toolbench.tool_catalog compile), memory-mapped
+if CONFIG.get('tools_catalog'):
+    # the reader is toolbench/tool_catalog.py: run with the repository root on PYTHONPATH
+    from toolbench.tool_catalog import ToolCatalog
+    TOOL_CATALOG = ToolCatalog(CONFIG['tools_catalog'])
+else:
+    TOOL_CATALOG = None
+TOOL_INDEX = ToolDocIndex(CONFIG['tools_folder'], catalog=TOOL_CATALOG)
+
+# in-process metrics, exported in Prometheus text format at /metrics
+METRICS = MetricsRegistry()
+JSON_REPAIRS = METRICS.counter("simulator_json_repairs_total", "Local repairs of invalid model JSON by result.", ["result"])
+UPSTREAM_QUEUE_DEPTH = METRICS.gauge("simulator_upstream_queue_depth", "Upstream calls waiting for a concurrency slot.")
+UPSTREAM_REJECTIONS = METRICS.counter("simulator_upstream_rejections_total", "Requests rejected with HTTP 429 by admission control.", ["reason"])
+UPSTREAM_ENDPOINTS = METRICS.gauge("simulator_upstream_endpoint", "Routing statistics per upstream endpoint.", ["endpoint", "stat"])
 
+def collect_metrics():
+    if UPSTREAM is not None:
+        UPSTREAM_QUEUE_DEPTH.set(UPSTREAM.waiting)
+        for endpoint, stats in UPSTREAM.pool.stats().items():
+            for stat, value in stats.items():
+                UPSTREAM_ENDPOINTS.set(value, endpoint=endpoint, stat=stat)
+
+METRICS.add_collector(collect_metrics)
 
 limiter = Limiter(key_func=get_remote_address)
 app = FastAPI()
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
+@app.exception_handler(UpstreamOverloaded)
+async def upstream_overloaded_handler(request: Request, exc: UpstreamOverloaded):
+    # fail fast and honestly instead of queueing into a fake "API call failed" response
+    UPSTREAM_REJECTIONS.inc(reason=exc.reason)
+    return JSONResponse(status_code=429, content={"detail": str(exc)}, headers={"Retry-After": str(exc.retry_after)})
+
 class Info(BaseModel):
     category: str
     tool_name: str
@@ -85,7 +134,7 @@ def prepare_tool_name_and_url(info):
 
 @app.post('/virtual')
 # @retry(wait=wait_random_exponential(min=1, max=40), stop=stop_after_attempt(1))
-def get_virtual_response(request: Request, info: Info):
+async def get_virtual_response(request: Request, info: Info):
     user_key = info.toolbench_key
 
     print('#'*30)
@@ -112,23 +161,16 @@ def get_virtual_response(request: Request, info: Info):
             response_dict = {"error": f"Tool input parse error...\n", "response": ""}
             return response_dict
 
-    if not os.path.exists(CACHE_FOLDER):
-        os.mkdir(CACHE_FOLDER)
-
     # --------------------------------------------------------------------------------------------------------------
     # load from cache
-    cache = {}
     # prerequisite: to read files correctly, "my_tools_cache" folder and "toolenv/tools/" folder should be available
     try:
-        if os.path.exists(os.path.join(CACHE_FOLDER, standard_category)):
-            if os.path.exists(os.path.join(CACHE_FOLDER, standard_category, tool_name)):
-                if os.path.exists(os.path.join(CACHE_FOLDER, standard_category, tool_name, api_name+".json")):
-                    tools_cache_record = json.load(open(os.path.join(CACHE_FOLDER, standard_category, tool_name, api_name+".json"), "r"))
-                    cache.update(tools_cache_record)
-                    if str(tool_input) in cache:
-                        print("[DEBUG] using cached real response")
-                        response_dict = cache[str(tool_input)]
-                        return response_dict
+        cache = await RESPONSE_CACHE.get(standard_category, tool_name, api_name)
+        record_key = cache_key(tool_input)
+        if record_key in cache:
+            print("[DEBUG] using cached real response")
+            response_dict = cache[record_key]["output"]
+            return response_dict
     except Exception as e:
         print(f"Loading cache error: {e}")
     
@@ -160,34 +202,26 @@ def get_virtual_response(request: Request, info: Info):
         'api_info': "",
     }
     try:
-        if os.path.exists(os.path.join(CONFIG['tools_folder'], standard_category)):
-            if os.path.exists(os.path.join(CONFIG['tools_folder'], standard_category, tool_name_original.split("_for_")[0]+".json")):
-                # read json
-                api_intro = json.load(open(os.path.join(CONFIG['tools_folder'], standard_category, tool_name_original.split("_for_")[0]+".json"), "r"))
-                # get tool_dexcription and api_info
-                tool_description = api_intro['tool_description']
-                api_info = []
-                available_api_names = []
-                for api in api_intro['api_list']:
-                    # Match using the same normalization as prepare_tool_name_and_url
-                    # which uses change_name(standardize(...))
-                    normalized_api_name = change_name(standardize(api['name']))
-                    available_api_names.append(f"{api['name']} -> {normalized_api_name}")
-                    if api_name == normalized_api_name:
-                        api_info.append(api)
-                # check invalid api name
-                if len(api_info) == 0:
-                    print(f"[ERROR] cannot match api name: looking for '{api_name}'. Available APIs (original -> normalized): {available_api_names[:10]}...")
-                    # Return error response if API name cannot be matched
-                    return {"error": f"Cannot match API name: '{api_name}'. Available APIs (first 5): {[name.split(' -> ')[1] for name in available_api_names[:5]]}", "response": ""}
-                api_doc = {
-                    'tool_description': tool_description,
-                    'api_info': api_info
-                }
-            else:
-                print(f"[ERROR] cannot get {tool_name_original}")
-                # Return error response if tool file doesn't exist
-                return {"error": f"Cannot find tool definition file for: {tool_name_original}", "response": ""}
+        # O(1) lookup in the tool doc index built at startup
+        tool_doc = TOOL_INDEX.get_tool(standard_category, tool_name_original.split("_for_")[0])
+        if tool_doc is not None:
+            # get tool_dexcription and api_info
+            # api names are indexed with the same normalization as prepare_tool_name_and_url
+            api_info = tool_doc['apis'].get(api_name, [])
+            available_api_names = tool_doc['available_api_names']
+            # check invalid api name
+            if len(api_info) == 0:
+                print(f"[ERROR] cannot match api name: looking for '{api_name}'. Available APIs (original -> normalized): {available_api_names[:10]}...")
+                # Return error response if API name cannot be matched
+                return {"error": f"Cannot match API name: '{api_name}'. Available APIs (first 5): {[name.split(' -> ')[1] for name in available_api_names[:5]]}", "response": ""}
+            api_doc = {
+                'tool_description': tool_doc['tool_description'],
+                'api_info': api_info
+            }
+        else:
+            print(f"[ERROR] cannot get {tool_name_original}")
+            # Return error response if tool file doesn't exist
+            return {"error": f"Cannot find tool definition file for: {tool_name_original}", "response": ""}
     except Exception as e:
         print(f"[ERROR] loading api_doc error: {e}")
         # Return error response if there's an exception loading api_doc
@@ -197,7 +231,7 @@ def get_virtual_response(request: Request, info: Info):
     if not api_doc.get('api_info') or len(api_doc['api_info']) == 0:
         return {"error": f"API information is empty for API: {api_name}", "response": ""}
         
-    result = fake_response_function_with_trained_simulator(tool_input, data, api_doc, api_name)
+    result = await fake_response_function_with_trained_simulator(tool_input, data, api_doc, api_name)
     print(f"[DEBUG] Simulated result: {result}")
 
 
@@ -229,6 +263,13 @@ def extract_attributes_json(output):
     try:
         output_dict = json.loads(output)
     except:
+        # fix trailing commas, quotes, truncation... locally before falling back to regexes
+        repaired = repair_json(output)
+        repaired_dict = json.loads(repaired) if repaired is not None else None
+        if isinstance(repaired_dict, dict) and 'error' in repaired_dict and 'response' in repaired_dict:
+            JSON_REPAIRS.inc(result="success")
+            return None, repaired_dict['error'], repaired_dict['response']
+        JSON_REPAIRS.inc(result="failure")
         # Regular expression to capture "error" and "response" fields
         if "mechanism_of_the_api" in output:
             pattern = (
@@ -262,28 +303,7 @@ def extract_attributes_json(output):
     return None, error, response
 
 
-def check_result(processes_value: dict):
-    if 'error' not in processes_value or processes_value['error'] != '':
-        return False
-    if 'response' not in processes_value:
-        return False
-    response = str(processes_value['response'])
-    if 'got an unexpected keyword argument' in response.lower():
-        return True
-    elif 'rate limit' in response.lower() or 'time out' in response.lower() or 'timed out' in response.lower() or 'does not exist' in response.lower() or '404' in response.lower() or '504' in response.lower() or '500' in response.lower() or 'internal error' in response.lower() or 'API doesn\'t exists' in response.lower() or "API doesn\'t exists" in response.lower() or response == '{\'message\': "API doesn\'t exists"}' or 'Service Not Found' in response:
-        return False
-    elif 'authoriz' in response.lower() or 'authenticat' in response.lower() or 'unauthorized' in response.lower() or 'blocked user' in response.lower() or 'unsubscribe' in response.lower() or 'blocked' in response.lower() or '401' in response.lower() or '403' in response.lower() or 'credential' in response.lower() or 'unauthenticated' in response.lower() or 'disabled for your subscription' in response.lower() or 'ACCESS_DENIED' in response:
-        return False
-    elif 'parameter' in response.lower() or 'parse' in response.lower() or 'is not defined' in response.lower():
-        return False
-    elif len(response) == 0:
-        return False
-    elif "status_code=50" in response or "status_code=429" in response:
-        return False
-    return True
-
-
-def fake_response_function_with_trained_simulator(tool_input, data, api_doc, api_name):
+async def fake_response_function_with_trained_simulator(tool_input, data, api_doc, api_name):
     '''
     api_example: list of tuple, [(input, output), ...]
     tool_input: dict, input of the tool
@@ -325,24 +345,23 @@ Request:
         {"role": "user", "content": instruction},
     ]
 
-    client = openai.OpenAI(
-        base_url=OPENAI_API_BASE,
-        api_key=OPENAI_API_KEY,
-    )
-    generate_text = client.chat.completions.create(
-        model=CONFIG.get('model', 'simulation-250123-qwen25-mixed'),
-        messages=messages,
-        temperature=CONFIG['temperature'],
-        max_tokens=2048,
-        seed=42
-    )
+    # shared client; waits here while upstream_max_concurrency calls are in flight
+    async with UPSTREAM.slot() as pool:
+        generate_text = await pool.create(
+            model=CONFIG.get('model', 'simulation-250123-qwen25-mixed'),
+            messages=messages,
+            temperature=CONFIG['temperature'],
+            max_tokens=2048,
+            seed=42
+        )
     generate_text = generate_text.choices[0].message.content
 
 
     model = CONFIG.get('model', 'simulation-250123-qwen25-mixed')
     model = model.split("/")[-1]
     
-    _, error, response = extract_attributes_json(generate_text)
+    # regex fallback on long outputs can be slow, keep it off the event loop
+    _, error, response = await asyncio.to_thread(extract_attributes_json, generate_text)
     if error or response:
         return json.dumps({"error": error, "response": response})
     else:
@@ -356,8 +375,51 @@ Request:
         return json.dumps(fake_error)
 
 
+@app.on_event("startup")
+async def create_upstream_client():
+    global UPSTREAM
+    UPSTREAM = UpstreamClient(
+        api_key=OPENAI_API_KEY,
+        base_url=OPENAI_API_BASE,
+        max_concurrency=CONFIG.get('upstream_max_concurrency', 32),
+        max_connections=CONFIG.get('upstream_max_connections', 64),
+        max_keepalive_connections=CONFIG.get('upstream_max_keepalive_connections', 32),
+        timeout=CONFIG.get('upstream_timeout', 120),
+        max_queue_depth=CONFIG.get('upstream_max_queue_depth', 256),
+        queue_timeout=CONFIG.get('upstream_queue_timeout', 60),
+        # several OpenAI-compatible backends balanced by latency and outstanding requests
+        endpoints=CONFIG.get('upstreams'),
+        eject_after_failures=CONFIG.get('upstream_eject_after_failures', 3),
+        eject_seconds=CONFIG.get('upstream_eject_seconds', 30),
+        hedge_after=CONFIG.get('upstream_hedge_after', 0),
+    )
 
-
+@app.on_event("shutdown")
+async def close_upstream_client():
+    if UPSTREAM is not None:
+        await UPSTREAM.close()
+
+@app.get('/metrics', response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(METRICS.render(), media_type="text/plain; version=0.0.4")
+
+@app.on_event("startup")
+async def build_tool_index():
+    # parse every tool file once; reload the changed ones every tools_reload_interval seconds,
+    # unless a compiled catalog is loaded: that is updated by recompiling it, not by walking the tree
+    indexed = await asyncio.to_thread(TOOL_INDEX.build)
+    print(f"Indexed {indexed} tools from {CONFIG['tools_folder']}")
+    async def reload_loop():
+        while True:
+            await asyncio.sleep(CONFIG.get('tools_reload_interval', 60))
+            try:
+                reloaded = await asyncio.to_thread(TOOL_INDEX.refresh)
+                if reloaded:
+                    print(f"Reloaded {reloaded} tools")
+            except Exception as e:
+                print(f"Reloading tools failed: {e}")
+    if TOOL_CATALOG is None:
+        asyncio.create_task(reload_loop())
 
 if __name__ == "__main__":
     uvicorn.run(app="main_mirrorapi_cache:app", host="0.0.0.0", port=CONFIG['port'])
@@ -0,0 +1,45 @@
+'''
+Rewrite a tool_response_cache tree to canonical cache keys.
+
+Legacy cache files are keyed by `str(tool_input)`, so inputs that only differ in key order,
+quoting or number formatting are stored several times. This folds every `<api>.json`
+snapshot and its `<api>.jsonl` journal into a snapshot keyed by `cache.cache_key` and
+reports how many duplicate entries collapsed.
+
+Usage: python migrate_cache.py --cache_folder ./tool_response_cache [--dry_run]
+'''
+
+import argparse
+
+from cache import DirectoryCacheStore
+
+
+def migrate_api_cache(store, category, tool_name, api_name, dry_run=False):
+    """Rewrite one API's cache to canonical keys; returns (raw entries, canonical entries)."""
+    records, _, count = store.load_api(category, tool_name, api_name)
+    if not dry_run:
+        store.write_api(category, tool_name, api_name, records)
+    return count, len(records)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cache_folder', type=str, default="./tool_response_cache", required=False, help='cache folder to migrate in place')
+    parser.add_argument('--dry_run', action="store_true", help="only report, do not rewrite any file")
+    args = parser.parse_args()
+
+    store = DirectoryCacheStore(args.cache_folder)
+    total_apis, total_entries, total_records, failed = 0, 0, 0, 0
+    for category, tool_name, api_name in store.iter_apis():
+        try:
+            count, num_records = migrate_api_cache(store, category, tool_name, api_name, dry_run=args.dry_run)
+        except Exception as e:
+            print(f"[ERROR] migrating {category}/{tool_name}/{api_name} failed: {e}")
+            failed += 1
+            continue
+        total_apis += 1
+        total_entries += count
+        total_records += num_records
+
+    print(f"APIs migrated: {total_apis} (failed: {failed})")
+    print(f"Entries before: {total_entries}, after: {total_records}, duplicates collapsed: {total_entries - total_records}")
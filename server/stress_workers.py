@@ -0,0 +1,126 @@
+'''
+Multi-worker stress test of the simulator with a shared cache.
+
+For every worker count, starts `main.py` with `workers: N` on a fresh cache (directory tree
+with file locks, or SQLite) against a local stub model, drives it with unique requests and
+then counts the cache entries: every successful request must have been written exactly once,
+whichever worker served it and however the journal compactions interleaved.
+
+    python stress_workers.py --tools_folder ../data/toolenv/tools --workers 1 2 4 --num_requests 2000
+'''
+
+import os
+import sys
+import time
+import shutil
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+import httpx
+import yaml
+
+from cache import open_cache_store
+from load_test import build_payloads, run_load
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def wait_until_up(url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError(f"{url} did not come up in {timeout}s")
+
+
+def count_entries(backend, path):
+    store = open_cache_store(backend, path)
+    try:
+        return sum(len(store.load_api(*api)[0]) for api in store.iter_apis())
+    finally:
+        store.close()
+
+
+def run_workers(args, workers, payloads, work_dir):
+    run_dir = os.path.join(work_dir, f"workers_{workers}")
+    os.makedirs(run_dir)
+    cache_path = os.path.join(run_dir, "tool_response_cache" if args.cache_backend == "directory" else "tool_response_cache.db")
+    with open(os.path.join(SERVER_DIR, "config.yml"), 'r') as f:
+        config = yaml.load(f, Loader=yaml.FullLoader)
+    config.update({
+        "api_key": "EMPTY",
+        "api_base": f"http://127.0.0.1:{args.stub_port}/v1",
+        "tools_folder": os.path.abspath(args.tools_folder),
+        "cache_backend": args.cache_backend,
+        "cache_folder": cache_path,
+        "cache_db": cache_path,
+        "is_save": True,
+        # compact often, so compactions race with the appends of the other workers
+        "cache_compact_interval": 1,
+        "upstream_max_queue_depth": 0,
+        "workers": workers,
+        "port": args.port,
+    })
+    with open(os.path.join(run_dir, "config.yml"), 'w') as f:
+        yaml.dump(config, f)
+
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(SERVER_DIR, "main.py")],
+        cwd=run_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_until_up(f"http://127.0.0.1:{args.port}/metrics")
+        print(f"--- workers: {workers}")
+        result = asyncio.run(run_load(f"http://127.0.0.1:{args.port}/virtual", payloads, args.concurrency, args.timeout))
+    finally:
+        server.terminate()
+        server.wait()
+    stored = count_entries(args.cache_backend, cache_path)
+    succeeded = result["requests"] - result["errors"]
+    print(f"stored entries: {stored}, successful requests: {succeeded}, lost writes: {max(succeeded - stored, 0)}")
+    return result["throughput"], max(succeeded - stored, 0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tools_folder', type=str, default="./tools", required=False, help='tools the requests are drawn from')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], required=False, help='worker counts to compare')
+    parser.add_argument('--cache_backend', type=str, default="directory", choices=["directory", "sqlite"], required=False, help='shared cache store')
+    parser.add_argument('--num_requests', type=int, default=2000, required=False, help='requests per worker count')
+    parser.add_argument('--concurrency', type=int, default=128, required=False, help='number of concurrent clients')
+    parser.add_argument('--delay', type=float, default=0.05, required=False, help='seconds the stub model takes per completion')
+    parser.add_argument('--timeout', type=float, default=300, required=False, help='per-request timeout in seconds')
+    parser.add_argument('--port', type=int, default=18080, required=False, help='simulator port')
+    parser.add_argument('--stub_port', type=int, default=12345, required=False, help='stub model port')
+    args = parser.parse_args()
+    random.seed(42)
+
+    work_dir = tempfile.mkdtemp(prefix="stress_workers_")
+    stub = subprocess.Popen(
+        [sys.executable, os.path.join(SERVER_DIR, "load_test.py"), "stub", "--port", str(args.stub_port), "--delay", str(args.delay)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        time.sleep(2)
+        baseline = None
+        summary = []
+        for workers in args.workers:
+            # fresh unique inputs per run, so every request is a cache miss and a write
+            payloads = build_payloads(args.tools_folder, args.num_requests)
+            throughput, lost = run_workers(args, workers, payloads, work_dir)
+            baseline = baseline or throughput / workers
+            summary.append((workers, throughput, throughput / (baseline * workers), lost))
+        print(f"{'workers':>7} {'req/s':>8} {'scaling':>8} {'lost':>5}")
+        for workers, throughput, efficiency, lost in summary:
+            print(f"{workers:>7} {throughput:>8.1f} {efficiency:>8.0%} {lost:>5}")
+    finally:
+        stub.terminate()
+        stub.wait()
+        shutil.rmtree(work_dir)
@@ -0,0 +1,121 @@
+import os
+import json
+import random
+
+from utils import standardize, change_name
+from examples import _input_features, _jaccard
+
+# leaf type names used by the response_examples schemas (and JSON Schema)
+# and parameter types used by the tool documents (STRING / NUMBER / BOOLEAN)
+PLACEHOLDER_TYPES = {
+    "str": "string", "string": "string", "STRING": "string",
+    "int": "integer", "integer": "integer",
+    "float": "number", "number": "number", "NUMBER": "integer",
+    "bool": "boolean", "boolean": "boolean", "BOOLEAN": "boolean",
+    "NoneType": "null", "null": "null",
+}
+
+
+class SchemaStubSimulator:
+    """
+    Deterministic, LLM-free stand-in for the simulator model, for load tests and smoke runs.
+
+    For a cache miss it answers, in order of preference, with:
+    1. the output of the cached example whose input is most similar to the request,
+    2. a response generated from the API's schema in `response_examples_folder`
+       (the same `<category>/<tool>.json` files `observation_shorten` reads), with
+       type-correct placeholder values,
+    3. an echo of the declared parameters with type-correct values.
+    Missing required parameters are reported in `error`. Values are seeded by the request,
+    so the same request always gets the same response. Schemas compiled into the tool
+    `catalog` are used before the response example files.
+    """
+
+    def __init__(self, response_examples_folder, catalog=None):
+        self.response_examples_folder = response_examples_folder
+        self.catalog = catalog
+        # (category, tool) -> {normalized api name: schema}
+        self._schemas = {}
+
+    def get_schema(self, category, tool_name, api_name):
+        key = (category, tool_name)
+        if key not in self._schemas:
+            schemas = {}
+            record = self.catalog.get_tool(category, tool_name) if self.catalog is not None else None
+            if record is not None and record.get("schemas"):
+                self._schemas[key] = record["schemas"]
+                return self._schemas[key].get(api_name)
+            schema_file_path = os.path.join(self.response_examples_folder, category, tool_name + ".json")
+            if os.path.exists(schema_file_path):
+                with open(schema_file_path, 'r') as f:
+                    for schema_dict in json.load(f).get("api_list", []):
+                        if schema_dict.get("schema"):
+                            schemas.setdefault(change_name(standardize(schema_dict["name"])), schema_dict["schema"])
+            self._schemas[key] = schemas
+        return self._schemas[key].get(api_name)
+
+    def _placeholder(self, type_name, name, rng, tool_input):
+        kind = PLACEHOLDER_TYPES.get(type_name, "string")
+        if isinstance(tool_input, dict) and name in tool_input:
+            return tool_input[name]
+        if kind == "integer":
+            return rng.randint(1, 1000)
+        if kind == "number":
+            return round(rng.uniform(0, 1000), 2)
+        if kind == "boolean":
+            return rng.random() < 0.5
+        if kind == "null":
+            return None
+        return f"{name or 'value'}_{rng.randint(1000, 9999)}"
+
+    def _fill(self, schema, name, rng, tool_input, depth=0):
+        if depth > 8:
+            return None
+        if isinstance(schema, dict):
+            # JSON Schema style
+            if schema.get("type") == "object" and isinstance(schema.get("properties"), dict):
+                return {k: self._fill(v, k, rng, tool_input, depth + 1) for k, v in schema["properties"].items()}
+            if schema.get("type") == "array" and "items" in schema:
+                return [self._fill(schema["items"], name, rng, tool_input, depth + 1)]
+            if isinstance(schema.get("type"), str) and schema["type"] in PLACEHOLDER_TYPES:
+                return self._placeholder(schema["type"], name, rng, tool_input)
+            # response_examples style: the schema mirrors the response structure
+            return {k: self._fill(v, k, rng, tool_input, depth + 1) for k, v in schema.items()}
+        if isinstance(schema, list):
+            return [self._fill(schema[0], name, rng, tool_input, depth + 1)] if schema else []
+        if isinstance(schema, str) and schema in PLACEHOLDER_TYPES:
+            return self._placeholder(schema, name, rng, tool_input)
+        # a literal example value
+        return schema
+
+    def simulate(self, category, tool_name, api_name, api_doc, tool_input, records, seed):
+        """Return a `{"error", "response"}` dict for one request; `seed` makes it deterministic."""
+        api_info = api_doc['api_info'][0]
+        if isinstance(tool_input, dict):
+            missing = [
+                change_name(standardize(param['name'])) for param in api_info.get('required_parameters', [])
+                if change_name(standardize(param['name'])) not in tool_input
+            ]
+            if missing:
+                return {"error": f"Missing required parameters: {', '.join(missing)}", "response": ""}
+
+        if records:
+            keys, tokens = _input_features(tool_input)
+            best = max(
+                records.values(),
+                key=lambda record: sum(
+                    _jaccard(a, b) for a, b in zip((keys, tokens), _input_features(record["input"]))
+                ),
+            )
+            return best["output"]
+
+        rng = random.Random(seed)
+        schema = self.get_schema(category, tool_name, api_name)
+        if schema is not None:
+            return {"error": "", "response": self._fill(schema, "", rng, tool_input)}
+
+        response = {}
+        for param in api_info.get('required_parameters', []) + api_info.get('optional_parameters', []):
+            name = change_name(standardize(param['name']))
+            response[name] = self._placeholder(param.get('type', 'STRING'), name, rng, tool_input)
+        return {"error": "", "response": response}
@@ -0,0 +1,130 @@
+import os
+import json
+
+from utils import standardize, change_name
+
+
+class ToolDocIndex:
+    """
+    In-memory index of the tool documentation under `tools_folder/<category>/<tool>.json`.
+
+    Every tool file is parsed once and its `api_list` is grouped by the normalized api name
+    (`change_name(standardize(name))`, the same normalization as `prepare_tool_name_and_url`),
+    so looking up the doc of one API is a dict access instead of a file read and a scan.
+    `refresh` re-parses the files whose mtime changed and drops deleted ones; tools that are
+    not indexed yet are loaded lazily on first lookup.
+
+    With a compiled `catalog` (`toolbench.tool_catalog.ToolCatalog`), `build` only reads the catalog
+    index and tools are decoded from it on first lookup; `refresh` still re-parses the tool
+    files that changed since the catalog was compiled, but the servers do not call it
+    periodically then.
+    """
+
+    def __init__(self, tools_folder, catalog=None):
+        self.tools_folder = tools_folder
+        self.catalog = catalog
+        # (category, tool) -> tool entry, see `_load_tool`
+        self._tools = {}
+        # (category, tool) -> tool file mtime of the catalog tools not decoded yet
+        self._catalog_tools = {}
+
+    def tool_file_path(self, category, tool_name):
+        return os.path.join(self.tools_folder, category, tool_name + ".json")
+
+    def _load_tool(self, category, tool_name):
+        tool_file_path = self.tool_file_path(category, tool_name)
+        mtime = os.path.getmtime(tool_file_path)
+        with open(tool_file_path, 'r') as f:
+            api_intro = json.load(f)
+        apis = {}
+        available_api_names = []
+        for api in api_intro['api_list']:
+            normalized_api_name = change_name(standardize(api['name']))
+            available_api_names.append(f"{api['name']} -> {normalized_api_name}")
+            apis.setdefault(normalized_api_name, []).append(api)
+        entry = {
+            "mtime": mtime,
+            "tool_description": api_intro['tool_description'],
+            "apis": apis,
+            "available_api_names": available_api_names,
+        }
+        self._tools[(category, tool_name)] = entry
+        return entry
+
+    def _load_catalog_tool(self, category, tool_name):
+        mtime = self._catalog_tools.pop((category, tool_name))
+        record = self.catalog.get_tool(category, tool_name)
+        apis = {}
+        available_api_names = []
+        for api, normalized_api_name in zip(record["api_list"], record["api_names"]):
+            available_api_names.append(f"{api['name']} -> {normalized_api_name}")
+            apis.setdefault(normalized_api_name, []).append(api)
+        entry = {
+            "mtime": mtime,
+            "tool_description": record["tool_description"],
+            "apis": apis,
+            "available_api_names": available_api_names,
+        }
+        self._tools[(category, tool_name)] = entry
+        return entry
+
+    def _scan(self):
+        """Yield (category, tool_name, mtime) of every tool file on disk."""
+        if not os.path.isdir(self.tools_folder):
+            return
+        for category in os.listdir(self.tools_folder):
+            category_dir = os.path.join(self.tools_folder, category)
+            if not os.path.isdir(category_dir):
+                continue
+            for file in os.listdir(category_dir):
+                if not file.endswith(".json"):
+                    continue
+                yield category, file[:-len(".json")], os.path.getmtime(os.path.join(category_dir, file))
+
+    def refresh(self):
+        """(Re)load new or modified tool files and forget deleted ones; returns the number reloaded."""
+        if self.catalog is not None and not os.path.isdir(self.tools_folder):
+            # deployed with the catalog only
+            return 0
+        reloaded = 0
+        seen = set()
+        for category, tool_name, mtime in self._scan():
+            key = (category, tool_name)
+            seen.add(key)
+            entry = self._tools.get(key)
+            if entry is not None and entry["mtime"] == mtime:
+                continue
+            if self._catalog_tools.get(key) == mtime:
+                continue
+            self._catalog_tools.pop(key, None)
+            try:
+                self._load_tool(category, tool_name)
+                reloaded += 1
+            except Exception as e:
+                print(f"[ERROR] indexing tool {category}/{tool_name} failed: {e}")
+        for key in list(self._tools):
+            if key not in seen:
+                del self._tools[key]
+        for key in list(self._catalog_tools):
+            if key not in seen:
+                del self._catalog_tools[key]
+        return reloaded
+
+    def build(self):
+        """Index every tool, from the catalog if there is one; returns the number of tools."""
+        if self.catalog is None:
+            return self.refresh()
+        self._catalog_tools = {(category, tool_name): mtime for category, tool_name, mtime in self.catalog.tools()}
+        return len(self._catalog_tools)
+
+    def get_tool(self, category, tool_name):
+        """Return the indexed entry of one tool, or None if the tool file does not exist."""
+        entry = self._tools.get((category, tool_name))
+        if entry is None and (category, tool_name) in self._catalog_tools:
+            entry = self._load_catalog_tool(category, tool_name)
+        if entry is None and os.path.exists(self.tool_file_path(category, tool_name)):
+            entry = self._load_tool(category, tool_name)
+        return entry
+
+    def __len__(self):
+        return len(self._tools) + len(self._catalog_tools)
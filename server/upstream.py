@@ -0,0 +1,138 @@
+import math
+import time
+import asyncio
+from contextlib import asynccontextmanager
+
+import httpx
+from openai import AsyncOpenAI
+
+from fair_scheduler import FairScheduler
+from upstream_pool import Endpoint, UpstreamPool
+
+
+class UpstreamOverloaded(Exception):
+    """Raised when an upstream call is not admitted; `retry_after` is a hint in seconds."""
+
+    def __init__(self, reason, retry_after, tenant=""):
+        super().__init__(f"Upstream is overloaded ({reason}), retry after {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+        self.tenant = tenant
+
+
+class UpstreamClient:
+    """
+    Application-scoped AsyncOpenAI clients shared by all simulator requests.
+
+    `endpoints` (`[{"api_base", "api_key", "model", "weight", "name"}, ...]`) are balanced by
+    an `UpstreamPool`; without it the single `base_url` / `api_key` endpoint is used.
+    The underlying httpx pool keeps connections alive across requests, and a
+    `FairScheduler` caps the number of concurrent upstream completions so the server can
+    be tuned to the upstream's concurrency limit, sharing the slots fairly between
+    toolbench keys. Must be created from inside the running event loop.
+
+    Calls waiting for a slot form a bounded queue: once `max_queue_depth` calls are
+    waiting, or a call has waited `queue_timeout` seconds, `slot()` raises
+    `UpstreamOverloaded` instead of queueing further (0 / None disables either bound).
+    """
+
+    def __init__(self, api_key, base_url, max_concurrency=32, max_connections=64,
+                 max_keepalive_connections=32, timeout=120, max_queue_depth=256, queue_timeout=60,
+                 scheduler=None, endpoints=None, eject_after_failures=3, eject_seconds=30, hedge_after=0):
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+            ),
+            timeout=timeout,
+        )
+        endpoints = endpoints or [{"api_base": base_url, "api_key": api_key}]
+        self.pool = UpstreamPool(
+            [
+                Endpoint(
+                    AsyncOpenAI(api_key=endpoint.get("api_key", api_key), base_url=endpoint["api_base"], http_client=self.http_client),
+                    name=endpoint.get("name", endpoint["api_base"]),
+                    model=endpoint.get("model"),
+                    weight=endpoint.get("weight", 1),
+                )
+                for endpoint in endpoints
+            ],
+            eject_after_failures=eject_after_failures,
+            eject_seconds=eject_seconds,
+            hedge_after=hedge_after,
+        )
+        self.max_concurrency = max_concurrency
+        self.scheduler = scheduler or FairScheduler(max_concurrency)
+        self.in_use = 0
+        self.waiting = 0
+        self.acquired = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.max_queue_depth = max_queue_depth
+        self.queue_timeout = queue_timeout
+        self.rejected = {"queue_full": 0, "queue_timeout": 0, "token_budget": 0}
+        # moving average of how long a slot is held, for the Retry-After hint
+        self.avg_hold_seconds = 1.0
+
+    def retry_after(self):
+        """Seconds until the current queue is expected to drain, at least 1."""
+        return max(1, math.ceil(self.avg_hold_seconds * (self.waiting + 1) / self.max_concurrency))
+
+    def charge(self, tenant, tokens):
+        """Count upstream tokens against the tenant's token budget."""
+        self.scheduler.charge(tenant, tokens)
+
+    @asynccontextmanager
+    async def slot(self, tenant=""):
+        """Wait for a free concurrency slot for `tenant` (a toolbench key) and yield the endpoint pool.
+
+        `pool.complete(...)` reports the endpoint that served the call, whose `name` and
+        `served_model()` are the labels of its metrics.
+        """
+        budget_retry_after = self.scheduler.budget_retry_after(tenant)
+        if budget_retry_after is not None:
+            self.rejected["token_budget"] += 1
+            raise UpstreamOverloaded("token_budget", budget_retry_after, self.scheduler.tenant(tenant).name)
+        # calls that have not got a slot yet count towards the queue, whoever is scheduled first
+        if self.max_queue_depth and self.waiting + self.in_use >= self.max_concurrency + self.max_queue_depth:
+            self.rejected["queue_full"] += 1
+            raise UpstreamOverloaded("queue_full", self.retry_after(), self.scheduler.tenant(tenant).name)
+        start = time.monotonic()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self.scheduler.acquire(tenant), timeout=self.queue_timeout or None)
+        except asyncio.TimeoutError:
+            self.rejected["queue_timeout"] += 1
+            raise UpstreamOverloaded("queue_timeout", self.retry_after(), self.scheduler.tenant(tenant).name)
+        finally:
+            self.waiting -= 1
+        wait = time.monotonic() - start
+        self.acquired += 1
+        self.total_wait_seconds += wait
+        self.max_wait_seconds = max(self.max_wait_seconds, wait)
+        self.in_use += 1
+        held_since = time.monotonic()
+        try:
+            yield self.pool
+        finally:
+            self.in_use -= 1
+            self.scheduler.release(tenant)
+            self.avg_hold_seconds = 0.9 * self.avg_hold_seconds + 0.1 * (time.monotonic() - held_since)
+
+    async def close(self):
+        await self.http_client.aclose()
+
+    def stats(self):
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_use": self.in_use,
+            "utilisation": self.in_use / self.max_concurrency,
+            "waiting": self.waiting,
+            "acquired": self.acquired,
+            "avg_wait_seconds": self.total_wait_seconds / self.acquired if self.acquired else 0.0,
+            "max_wait_seconds": self.max_wait_seconds,
+            "max_queue_depth": self.max_queue_depth or 0,
+            "rejected_queue_full": self.rejected["queue_full"],
+            "rejected_queue_timeout": self.rejected["queue_timeout"],
+            "rejected_token_budget": self.rejected["token_budget"],
+        }
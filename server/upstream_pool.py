@@ -0,0 +1,137 @@
+import time
+import asyncio
+
+
+class Endpoint:
+    """One OpenAI-compatible backend of the upstream pool and its routing statistics."""
+
+    def __init__(self, client, name, model=None, weight=1.0, initial_latency=1.0):
+        self.client = client
+        self.name = name
+        # overrides the model requested by the caller, e.g. the served name of a vLLM instance
+        self.model = model
+        self.weight = max(weight, 1e-6)
+        self.ewma_latency = initial_latency
+        self.outstanding = 0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.requests = 0
+        self.failures = 0
+        self.ejections = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    @property
+    def healthy(self):
+        return time.monotonic() >= self.ejected_until
+
+    def served_model(self, requested):
+        """The model this endpoint is actually asked for when the caller requests `requested`."""
+        return self.model or requested
+
+    def score(self):
+        """Expected completion time of one more request, scaled down by the weight."""
+        return (self.outstanding + 1) * self.ewma_latency / self.weight
+
+
+class UpstreamPool:
+    """
+    Spreads completions over several OpenAI-compatible endpoints (OpenAI, vLLM instances...).
+
+    Each call goes to the healthy endpoint with the lowest `(outstanding + 1) * latency / weight`,
+    i.e. least outstanding requests weighted by the EWMA of its latency and its configured
+    weight. An endpoint that fails `eject_after_failures` times in a row is ejected for
+    `eject_seconds`; if every endpoint is ejected the one coming back first is used anyway.
+    With `hedge_after` > 0, a call still running after that many seconds is duplicated on a
+    second endpoint and the first successful response wins.
+    """
+
+    def __init__(self, endpoints, eject_after_failures=3, eject_seconds=30, hedge_after=0, ewma_alpha=0.2):
+        if not endpoints:
+            raise ValueError("The upstream pool needs at least one endpoint")
+        self.endpoints = endpoints
+        self.eject_after_failures = eject_after_failures
+        self.eject_seconds = eject_seconds
+        self.hedge_after = hedge_after
+        self.ewma_alpha = ewma_alpha
+
+    def pick(self, exclude=()):
+        candidates = [endpoint for endpoint in self.endpoints if endpoint not in exclude]
+        if not candidates:
+            return None
+        healthy = [endpoint for endpoint in candidates if endpoint.healthy]
+        if not healthy:
+            return min(candidates, key=lambda endpoint: endpoint.ejected_until)
+        return min(healthy, key=Endpoint.score)
+
+    async def _call(self, endpoint, kwargs):
+        kwargs = {**kwargs, "model": endpoint.served_model(kwargs.get("model"))}
+        endpoint.outstanding += 1
+        endpoint.requests += 1
+        start = time.monotonic()
+        try:
+            response = await endpoint.client.chat.completions.create(**kwargs)
+        except Exception as error:
+            # lets the caller label the failure with the endpoint that raised it
+            error.upstream_endpoint = endpoint
+            endpoint.failures += 1
+            endpoint.consecutive_failures += 1
+            if endpoint.consecutive_failures >= self.eject_after_failures and endpoint.healthy:
+                endpoint.ejected_until = time.monotonic() + self.eject_seconds
+                endpoint.ejections += 1
+            raise
+        finally:
+            endpoint.outstanding -= 1
+        endpoint.consecutive_failures = 0
+        endpoint.ewma_latency += self.ewma_alpha * (time.monotonic() - start - endpoint.ewma_latency)
+        return response
+
+    async def create(self, **kwargs):
+        """`chat.completions.create` on the best endpoint, hedged if configured."""
+        _, response = await self.complete(**kwargs)
+        return response
+
+    async def complete(self, **kwargs):
+        """Like `create`, but returns `(endpoint, response)` with the endpoint that served it."""
+        primary = self.pick()
+        if not self.hedge_after or len(self.endpoints) < 2:
+            return primary, await self._call(primary, kwargs)
+
+        tasks = {asyncio.create_task(self._call(primary, kwargs)): primary}
+        done, _ = await asyncio.wait(tasks, timeout=self.hedge_after)
+        if not done:
+            backup = self.pick(exclude=(primary,))
+            if backup is not None and backup.healthy:
+                backup.hedges += 1
+                tasks[asyncio.create_task(self._call(backup, kwargs))] = backup
+        pending, error = set(tasks), None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if tasks[task] is not primary:
+                            tasks[task].hedge_wins += 1
+                        return tasks[task], task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # the losing request of a hedge
+            for task in pending:
+                task.cancel()
+
+    def stats(self):
+        return {
+            endpoint.name: {
+                "weight": endpoint.weight,
+                "healthy": int(endpoint.healthy),
+                "outstanding": endpoint.outstanding,
+                "ewma_latency_seconds": endpoint.ewma_latency,
+                "requests": endpoint.requests,
+                "failures": endpoint.failures,
+                "ejections": endpoint.ejections,
+                "hedges": endpoint.hedges,
+                "hedge_wins": endpoint.hedge_wins,
+            }
+            for endpoint in self.endpoints
+        }
@@ -0,0 +1,192 @@
+'''
+Prefill the simulator cache from existing answer trees.
+
+Walks the DFS / CoT outputs under `--answer_dir` (e.g. `data/answer/<method>/<query_id>_<method>.json`)
+in parallel, extracts every successful tool call from `tree` and `answer_generation.train_messages`,
+resolves its function name to (category, tool, api) with the tool documents and appends the
+observations that are not cached yet under their canonical keys. Running it twice adds nothing.
+
+    python warm_cache.py --answer_dir ../data/answer --tools_folder ../data/toolenv/tools --cache_folder ./tool_response_cache
+    python warm_cache.py --answer_dir ../data/answer --tools_folder ../data/toolenv/tools --cache_backend sqlite --cache_db ./tool_response_cache.db
+'''
+
+import os
+import re
+import json
+import argparse
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from cache import open_cache_store, cache_key, canonical_tool_input
+from tool_index import ToolDocIndex
+
+TOOL_DESCRIPTION_PATTERN = re.compile(r'This is the subfunction for tool "([^"]+)"')
+
+# standardized tool name -> [(category, {normalized api name, ...}), ...], set in every worker
+TOOL_APIS = {}
+
+
+def init_worker(tool_apis):
+    global TOOL_APIS
+    TOOL_APIS = tool_apis
+
+
+def build_tool_apis(tools_folder):
+    index = ToolDocIndex(tools_folder)
+    index.build()
+    tool_apis = defaultdict(list)
+    for (category, tool_name), entry in index._tools.items():
+        tool_apis[tool_name].append((category, set(entry["apis"])))
+    return dict(tool_apis)
+
+
+def resolve_function(name, description):
+    """Map a function name (`<api>_for_<tool>`, cut to 64 chars) to (category, tool, api), or None."""
+    tool_candidates = []
+    match = TOOL_DESCRIPTION_PATTERN.search(description or "")
+    if match:
+        tool_candidates.append(match.group(1))
+    parts = name.split("_for_")
+    tool_candidates.extend("_for_".join(parts[i:]) for i in range(1, len(parts)))
+    for tool_name in tool_candidates:
+        # a tool name shared by several categories is ambiguous
+        if len(TOOL_APIS.get(tool_name, [])) != 1:
+            continue
+        category, api_names = TOOL_APIS[tool_name][0]
+        for api_name in api_names:
+            if f"{api_name}_for_{tool_name}"[-64:] == name:
+                return category, tool_name, api_name
+    return None
+
+
+def parse_observation(observation):
+    """The `{"error", "response"}` dict of a successful observation, or None."""
+    try:
+        output = json.loads(observation)
+    except (TypeError, json.JSONDecodeError):
+        # shortened ("...") or otherwise broken observations
+        return None
+    if not isinstance(output, dict) or output.get("error", None) != "" or output.get("response") in (None, "", {}, []):
+        return None
+    return output
+
+
+def iter_tree_calls(node):
+    """Yield (function name, arguments, observation) of the successful calls in a DFS tree."""
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        children = node.get("children") or []
+        if node.get("node_type") == "Action":
+            for child in children:
+                if child.get("node_type") == "Action Input" and child.get("observation_code") == 0:
+                    yield node["description"], child["description"], child.get("observation", "")
+        stack.extend(children)
+
+
+def iter_message_calls(messages):
+    """Yield (function name, arguments, observation) of the calls in one train_messages conversation."""
+    pending = {}
+    for i, message in enumerate(messages):
+        if message.get("role") != "assistant":
+            if message.get("role") == "tool" and message.get("tool_call_id") in pending:
+                name, arguments = pending.pop(message["tool_call_id"])
+                yield name, arguments, message.get("content", "")
+            continue
+        if message.get("function_call"):
+            if i + 1 < len(messages) and messages[i + 1].get("role") == "function":
+                yield message["function_call"]["name"], message["function_call"]["arguments"], messages[i + 1].get("content", "")
+        for tool_call in message.get("tool_calls") or []:
+            pending[tool_call["id"]] = (tool_call["function"]["name"], tool_call["function"]["arguments"])
+
+
+def extract_answer_file(path):
+    """Return ([(category, tool, api, record_key, tool_input, output), ...], unresolved call count)."""
+    try:
+        with open(path, 'r') as f:
+            data = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return [], 0
+    answer_generation = data.get("answer_generation") or {}
+    descriptions = {}
+    for function in answer_generation.get("function") or []:
+        function = function.get("function", function)
+        descriptions[function.get("name")] = function.get("description", "")
+
+    calls = []
+    if isinstance(data.get("tree"), dict):
+        calls.extend(iter_tree_calls(data["tree"].get("tree") or {}))
+    for messages in answer_generation.get("train_messages") or []:
+        calls.extend(iter_message_calls(messages))
+
+    entries, unresolved = [], 0
+    for name, arguments, observation in calls:
+        if name == "Finish":
+            continue
+        output = parse_observation(observation)
+        if output is None:
+            continue
+        try:
+            tool_input = json.loads(arguments) if arguments.strip() else {}
+        except (AttributeError, json.JSONDecodeError):
+            continue
+        resolved = resolve_function(name, descriptions.get(name))
+        if resolved is None:
+            unresolved += 1
+            continue
+        category, tool_name, api_name = resolved
+        tool_input = canonical_tool_input(tool_input)
+        entries.append((category, f"{tool_name}_for_{category}", api_name, cache_key(tool_input), tool_input, output))
+    return entries, unresolved
+
+
+def find_answer_files(answer_dir):
+    answer_files = []
+    for root, _, files in os.walk(answer_dir):
+        answer_files.extend(os.path.join(root, file) for file in files if file.endswith(".json"))
+    return sorted(answer_files)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--answer_dir', type=str, default="../data/answer", required=False, help='answer directory, walked recursively')
+    parser.add_argument('--tools_folder', type=str, default="./tools", required=False, help='tool documents used to resolve function names')
+    parser.add_argument('--cache_backend', type=str, default="directory", choices=["directory", "sqlite"], required=False, help='cache store to fill')
+    parser.add_argument('--cache_folder', type=str, default="./tool_response_cache", required=False, help='cache folder of the directory backend')
+    parser.add_argument('--cache_db', type=str, default="./tool_response_cache.db", required=False, help='database file of the sqlite backend')
+    parser.add_argument('--num_workers', type=int, default=os.cpu_count(), required=False, help='parallel answer file parsers')
+    parser.add_argument('--dry_run', action='store_true', help='only report what would be written')
+    args = parser.parse_args()
+
+    tool_apis = build_tool_apis(args.tools_folder)
+    answer_files = find_answer_files(args.answer_dir)
+    print(f"{len(answer_files)} answer files, {len(tool_apis)} tools")
+
+    # first occurrence wins, in file order, so reruns and duplicates write nothing new
+    found = {}
+    observations, unresolved = 0, 0
+    with ProcessPoolExecutor(max_workers=args.num_workers, initializer=init_worker, initargs=(tool_apis,)) as executor:
+        for entries, file_unresolved in executor.map(extract_answer_file, answer_files, chunksize=64):
+            observations += len(entries)
+            unresolved += file_unresolved
+            for category, tool_name, api_name, record_key, tool_input, output in entries:
+                found.setdefault((category, tool_name, api_name), {}).setdefault(record_key, (tool_input, output))
+
+    store = open_cache_store(args.cache_backend, args.cache_folder if args.cache_backend == "directory" else args.cache_db)
+    written, cached = 0, 0
+    try:
+        for (category, tool_name, api_name), records in sorted(found.items()):
+            existing, _, _ = store.load_api(category, tool_name, api_name)
+            new_records = {key: record for key, record in records.items() if key not in existing}
+            cached += len(records) - len(new_records)
+            if args.dry_run or not new_records:
+                continue
+            for record_key, (tool_input, output) in new_records.items():
+                store.append(category, tool_name, api_name, record_key, tool_input, output)
+            store.compact(category, tool_name, api_name)
+            written += len(new_records)
+    finally:
+        store.close()
+    unique = sum(len(records) for records in found.values())
+    print(f"successful observations: {observations}, unresolved function names: {unresolved}")
+    print(f"unique: {unique} over {len(found)} APIs, already cached: {cached}, written: {written if not args.dry_run else 0}")
@@ -31,3 +31,7 @@ class base_search_method:
         """This is the entry point of the searching process"""
         raise NotImplementedError
 
+    async def astart(self, **args):
+        """`start` as a coroutine, for the asyncio engine"""
+        raise NotImplementedError
+
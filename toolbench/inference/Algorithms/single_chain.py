@@ -206,3 +206,138 @@ class single_chain(base_search_method):
                 return now_node
 
     
+    async def astart(self,single_chain_max_step,pass_at=1,answer=1):
+        """`start` for --engine asyncio: LLM queries and tool calls are awaited (aparse / astep)"""
+        self.forward_args = locals()
+        if "self" in self.forward_args.keys():
+            self.forward_args.pop("self")
+
+        for i in range(pass_at):
+            if self.process_id == 0:
+                print(f"[single_chain]try for the {i+1} time")
+            self.tree = my_tree()
+            self.tree.root.node_type = "Action Input"
+            self.tree.root.io_state = deepcopy(self.io_func)
+            out_node = await self.ado_chain(self.tree.root, single_chain_max_step)
+            self.terminal_node.append(out_node)
+            self.try_list.append(self.to_json_single())
+            if out_node.io_state.check_success() == 1:
+                self.status = 1
+                self.success_count += 1
+                if self.success_count >= answer:
+                    return 1
+        return 0
+
+
+    async def ado_chain(self,now_node,single_chain_max_step):
+
+        if self.start_message_list == None:
+            system = FORMAT_INSTRUCTIONS_SYSTEM_FUNCTION
+            system = system.replace("{task_description}",self.io_func.task_description)
+            self.tree.root.messages.append({"role":"system","content":system})
+
+            user = FORMAT_INSTRUCTIONS_USER_FUNCTION
+            user = user.replace("{input_description}",self.io_func.input_description)
+            self.tree.root.messages.append({"role":"user","content":user})
+        else:
+            """In Reflection Algo, we startswith former trials and reflections, so the caller will give the start messages"""
+            self.tree.root.messages = self.start_message_list
+        
+        now_node = self.tree.root
+        while True:
+            # recursively parse message into nodes
+            new_message, error_code, total_tokens = await self.llm.aparse(tools=self.io_func.functions,
+                                                                          process_id=self.process_id,
+                                                                          messages=now_node.messages)
+            self.total_tokens += total_tokens
+            self.query_count += 1
+            assert new_message["role"] == "assistant"
+            if "content" in new_message.keys() and new_message["content"] != None:
+                temp_node = tree_node()
+                temp_node.node_type = "Thought"
+                temp_node.description = new_message["content"]
+                child_io_state = deepcopy(now_node.io_state)
+                
+                temp_node.io_state = child_io_state
+                temp_node.is_terminal = child_io_state.check_success() != 0 
+                temp_node.messages = now_node.messages.copy()
+                temp_node.father = now_node
+                now_node.children.append(temp_node)
+                temp_node.print(self.process_id)
+                now_node = temp_node
+
+                if error_code != 0:
+                    now_node.observation_code = error_code
+                    now_node.pruned = True
+
+
+            if "tool_calls" in new_message.keys() and new_message["tool_calls"] != None and len(new_message["tool_calls"]) > 0:
+                tool_calls = new_message["tool_calls"]
+                if self.process_id == 0:
+                    print("number of parallel calls:",len(tool_calls))
+
+                # lastnode = now_node
+                for i in range(len(tool_calls)):
+                    function_name = tool_calls[i]["function"]["name"]
+                    temp_node = tree_node()
+                    temp_node.node_type = "Action"
+                    temp_node.description = function_name
+                    child_io_state = deepcopy(now_node.io_state)
+                    
+                    temp_node.io_state = child_io_state
+                    temp_node.is_terminal = child_io_state.check_success() != 0 
+                    temp_node.messages = now_node.messages.copy()
+                    temp_node.father = now_node
+                    now_node.children.append(temp_node)
+
+                    temp_node.print(self.process_id)
+                    now_node = temp_node
+
+                    # function_input = new_message["function_call"]["arguments"]
+                    function_input = tool_calls[i]["function"]["arguments"]
+                    temp_node = tree_node()
+                    temp_node.node_type = "Action Input"
+                    temp_node.description = function_input
+                    child_io_state = deepcopy(now_node.io_state)
+                    
+
+                    observation, status = await child_io_state.astep(action_name=now_node.description, action_input=function_input)
+                    temp_node.observation = observation
+                    temp_node.observation_code = status
+
+                    temp_node.io_state = child_io_state
+                    temp_node.is_terminal = child_io_state.check_success() != 0 
+                    temp_node.messages = now_node.messages.copy()
+                    temp_node.father = now_node
+                    now_node.children.append(temp_node)
+                    temp_node.print(self.process_id)
+                    now_node = temp_node
+
+                    if status != 0:
+                        # return code refers to Downstream_tasks/rapidapi
+                        if status == 4:
+                            now_node.pruned = True
+                        elif status == 1: # hallucination api name
+                            assert "tool_calls" in new_message.keys() and len(new_message["tool_calls"]) > 0
+                            tool_calls[i]["function"]["name"] = "invalid_hallucination_function_name"
+
+
+                    if i==0:
+                        now_node.messages.append(new_message)
+                    if now_node.node_type == "Action Input":
+                        now_node.messages.append({
+                            "role":"tool",
+                            # "name": new_message["function_call"]["name"],
+                            "name": tool_calls[i]["function"]["name"],
+                            "content": now_node.observation,
+                            "tool_call_id": tool_calls[i]['id'],
+                        })
+            else:
+                now_node.messages.append(new_message)
+            
+            if now_node.get_depth() >= single_chain_max_step and not (now_node.is_terminal):
+                now_node.pruned = True
+            # import pdb; pdb.set_trace()
+            
+            if now_node.pruned or now_node.is_terminal:
+                return now_node
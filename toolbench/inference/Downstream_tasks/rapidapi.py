@@ -6,6 +6,7 @@ import requests
 from tqdm import tqdm
 from termcolor import colored
 import random
+from copy import deepcopy
 from toolbench.inference.LLM.chatgpt_function_model import ChatGPTFunction
 from toolbench.inference.LLM.davinci_model import Davinci
 from toolbench.inference.LLM.tool_llama_lora_model import ToolLLaMALoRA
@@ -14,6 +15,7 @@ from toolbench.inference.LLM.retriever import ToolRetriever
 from toolbench.inference.Algorithms.single_chain import single_chain
 from toolbench.inference.Algorithms.DFS import DFS_tree_search
 from toolbench.inference.server import get_rapidapi_response
+from toolbench.tool_catalog import load_tool_catalog
 from toolbench.utils import (
     standardize,
     change_name,
@@ -24,8 +26,11 @@ from toolbench.inference.Downstream_tasks.base_env import base_env
 
 
 # For pipeline environment preparation
-def get_white_list(tool_root_dir):
+def get_white_list(tool_root_dir, tool_catalog=""):
     # print(tool_root_dir)
+    if tool_catalog:
+        # looked up lazily in the compiled catalog instead of parsing every tool file
+        return load_tool_catalog(tool_catalog).white_list()
     white_list_dir = os.path.join(tool_root_dir)
     white_list = {}
     for cate in tqdm(os.listdir(white_list_dir)):
@@ -53,10 +58,14 @@ def contain(candidate_list, white_list):
 
 # rapidapi env wrapper
 class rapidapi_wrapper(base_env):
+    # process-wide resources, shared by the copies of the env in every search tree node
+    SHARED_ATTRIBUTES = ("tool_catalog",)
+
     def __init__(self, query_json, tool_descriptions, retriever, args, process_id=0):
         super(rapidapi_wrapper).__init__()
 
         self.tool_root_dir = args.tool_root_dir
+        self.tool_catalog = load_tool_catalog(args.tool_catalog) if getattr(args, "tool_catalog", "") else None
         self.toolbench_key = args.toolbench_key
         self.rapidapi_key = args.rapidapi_key
         self.use_rapidapi_key = args.use_rapidapi_key
@@ -136,8 +145,15 @@ You have access of the following tools:\n'''
 
         self.success = 0
 
+    def __deepcopy__(self, memo):
+        copied = self.__class__.__new__(self.__class__)
+        memo[id(self)] = copied
+        for key, value in self.__dict__.items():
+            setattr(copied, key, value if key in self.SHARED_ATTRIBUTES else deepcopy(value, memo))
+        return copied
+
     def build_tool_description(self, data_dict):
-        white_list = get_white_list(self.tool_root_dir)
+        white_list = self.tool_catalog.white_list() if self.tool_catalog is not None else get_white_list(self.tool_root_dir)
         origin_tool_names = [standardize(cont["tool_name"]) for cont in data_dict["api_list"]]
         tool_des = contain(origin_tool_names,white_list)
         tool_descriptions = [[cont["standard_tool_name"], cont["description"]] for cont in tool_des]
@@ -152,7 +168,14 @@ You have access of the following tools:\n'''
             category = tool_dict["category"]
             tool_name = tool_dict["tool_name"]
             api_name = tool_dict["api_name"]
-            if os.path.exists(jsons_path):
+            if self.tool_catalog is not None:
+                if (category, tool_name) in self.tool_catalog:
+                    query_json["api_list"].append({
+                        "category_name": category,
+                        "tool_name": tool_name,
+                        "api_name": api_name
+                    })
+            elif os.path.exists(jsons_path):
                 if os.path.exists(os.path.join(jsons_path, category)):
                     if os.path.exists(os.path.join(jsons_path, category, tool_name+".json")):
                         query_json["api_list"].append({
@@ -168,7 +191,9 @@ You have access of the following tools:\n'''
             cate_name = item["category_name"]
             tool_name = standardize(item["tool_name"])
             api_name = change_name(standardize(item["api_name"]))
-            tool_json = json.load(open(os.path.join(self.tool_root_dir, cate_name, tool_name + ".json"), "r"))
+            tool_json = self.tool_catalog.get_tool(cate_name, tool_name) if self.tool_catalog is not None else None
+            if tool_json is None:
+                tool_json = json.load(open(os.path.join(self.tool_root_dir, cate_name, tool_name + ".json"), "r"))
             append_flag = False
             api_dict_names = []
             for api_dict in tool_json["api_list"]:
@@ -430,7 +455,8 @@ class pipeline_runner:
         return backbone_model
 
     def get_retriever(self):
-        return ToolRetriever(corpus_tsv_path=self.args.corpus_tsv_path, model_path=self.args.retrieval_model_path)
+        return ToolRetriever(corpus_tsv_path=self.args.corpus_tsv_path, model_path=self.args.retrieval_model_path,
+                             tool_catalog=getattr(self.args, "tool_catalog", ""))
 
     def get_args(self):
         return self.args
@@ -443,7 +469,7 @@ class pipeline_runner:
             os.mkdir(answer_dir)
         method = args.method
         backbone_model = self.get_backbone_model()
-        white_list = get_white_list(args.tool_root_dir)
+        white_list = get_white_list(args.tool_root_dir, getattr(args, "tool_catalog", ""))
         task_list = []
         querys = json.load(open(query_dir, "r"))
         for query_id, data_dict in enumerate(querys):
@@ -2,10 +2,16 @@ import re
 import os
 import json
 import time
+import httpx
+import asyncio
+import hashlib
+import tempfile
 import requests
 from tqdm import tqdm
 from termcolor import colored
 import random
+from copy import deepcopy
+from openai import AsyncOpenAI
 from toolbench.inference.LLM.chatgpt_function_model import ChatGPTFunction
 from toolbench.inference.LLM.davinci_model import Davinci
 from toolbench.inference.LLM.tool_llama_lora_model import ToolLLaMALoRA
@@ -15,6 +21,9 @@ from toolbench.inference.LLM.retriever import ToolRetriever
 from toolbench.inference.Algorithms.single_chain import single_chain
 from toolbench.inference.Algorithms.DFS import DFS_tree_search
 from toolbench.inference.server import get_rapidapi_response
+from toolbench.inference.http_session import get_http_session, get_async_http_client, async_timeout, tool_call_timeout, AsyncClientPool
+from toolbench.inference.rate_limiter import get_rate_limiter, parse_retry_after, rate_limiter_stats
+from toolbench.tool_catalog import load_tool_catalog
 from toolbench.utils import (
     standardize,
     change_name,
@@ -26,8 +35,13 @@ from concurrent.futures import ThreadPoolExecutor
 
 
 # For pipeline environment preparation
-def get_white_list(tool_root_dir):
+def get_white_list(tool_root_dir, tool_catalog=""):
     # print(tool_root_dir)
+    if tool_catalog:
+        # looked up lazily in the compiled catalog instead of parsing every tool file
+        return load_tool_catalog(tool_catalog).white_list()
+    if tool_root_dir in _WHITE_LISTS:
+        return _WHITE_LISTS[tool_root_dir]
     white_list_dir = os.path.join(tool_root_dir)
     white_list = {}
     for cate in tqdm(os.listdir(white_list_dir)):
@@ -42,8 +56,12 @@ def get_white_list(tool_root_dir):
                 js_data = json.load(reader)
             origin_tool_name = js_data["tool_name"]
             white_list[standardize(origin_tool_name)] = {"description": js_data["tool_description"], "standard_tool_name": standard_tool_name}
+    _WHITE_LISTS[tool_root_dir] = white_list
     return white_list
 
+# tool_root_dir -> white list, scanned once per process
+_WHITE_LISTS = {}
+
 def contain(candidate_list, white_list):
     output = []
     for cand in candidate_list:
@@ -53,97 +71,277 @@ def contain(candidate_list, white_list):
     return output
 
 
+def env_spec_key(data_dict, tool_des, args):
+    """Env spec cache key of a query: its api_list, tool descriptions and tool file versions."""
+    tool_versions = []
+    for item in data_dict["api_list"]:
+        tool_path = os.path.join(args.tool_root_dir, item["category_name"], standardize(item["tool_name"]) + ".json")
+        tool_versions.append(os.path.getmtime(tool_path) if os.path.exists(tool_path) else 0)
+    if getattr(args, "tool_catalog", ""):
+        tool_versions.append(os.path.getmtime(args.tool_catalog))
+    content = json.dumps([data_dict["api_list"], tool_des, tool_versions], sort_keys=True)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def build_tool_description(data_dict, tool_root_dir, tool_catalog=None):
+    white_list = tool_catalog.white_list() if tool_catalog is not None else get_white_list(tool_root_dir)
+    origin_tool_names = [standardize(cont["tool_name"]) for cont in data_dict["api_list"]]
+    tool_des = contain(origin_tool_names,white_list)
+    tool_descriptions = [[cont["standard_tool_name"], cont["description"]] for cont in tool_des]
+    return tool_descriptions
+
+
+def fetch_api_json(query_json, tool_root_dir, tool_catalog=None):
+    data_dict = {"api_list":[]}
+    for item in query_json["api_list"]:
+        cate_name = item["category_name"]
+        tool_name = standardize(item["tool_name"])
+        api_name = change_name(standardize(item["api_name"]))
+        tool_json = tool_catalog.get_tool(cate_name, tool_name) if tool_catalog is not None else None
+        if tool_json is None:
+            tool_json = json.load(open(os.path.join(tool_root_dir, cate_name, tool_name + ".json"), "r"))
+        append_flag = False
+        api_dict_names = []
+        for api_dict in tool_json["api_list"]:
+            api_dict_names.append(api_dict["name"])
+            pure_api_name = change_name(standardize(api_dict["name"]))
+            if pure_api_name != api_name:
+                continue
+            api_json = {}
+            api_json["category_name"] = cate_name
+            api_json["api_name"] = api_dict["name"]
+            api_json["api_description"] = api_dict["description"]
+            api_json["required_parameters"] = api_dict["required_parameters"]
+            api_json["optional_parameters"] = api_dict["optional_parameters"]
+            api_json["tool_name"] = tool_json["tool_name"]
+            data_dict["api_list"].append(api_json)
+            append_flag = True
+            break
+        if not append_flag:
+            print(api_name, api_dict_names)
+    return data_dict
+
+
+def api_json_to_openai_json(api_json,standard_tool_name):
+    description_max_length=256
+    function_templete = {
+        "type": "function",
+        "function": {
+            "name": "",
+            "description": "",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                },
+                "required": [""],
+                "optional": [""],
+            }
+        }
+    }
+    templete = function_templete['function']
+    
+    map_type = {
+        "NUMBER": "integer",
+        "STRING": "string",
+        "BOOLEAN": "boolean"
+    }
+
+    pure_api_name = change_name(standardize(api_json["api_name"]))
+    templete["name"] = pure_api_name+ f"_for_{standard_tool_name}"
+    templete["name"] = templete["name"][-64:]
+
+    templete["description"] = f"This is the subfunction for tool \"{standard_tool_name}\", you can use this tool."
+    
+    if api_json["api_description"].strip() != "":
+        tuncated_description = api_json['api_description'].strip().replace(api_json['api_name'],templete['name'])[:description_max_length]
+        templete["description"] = templete["description"] + f"The description of this function is: \"{tuncated_description}\""
+    if "required_parameters" in api_json.keys() and len(api_json["required_parameters"]) > 0:
+        for para in api_json["required_parameters"]:
+            name = standardize(para["name"])
+            name = change_name(name)
+            if para["type"] in map_type:
+                param_type = map_type[para["type"]]
+            else:
+                param_type = "string"
+            prompt = {
+                "type":param_type,
+                "description":para["description"][:description_max_length],
+            }
+
+            default_value = para['default']
+            if len(str(default_value)) != 0:    
+                prompt = {
+                    "type":param_type,
+                    "description":para["description"][:description_max_length],
+                    "example_value": default_value
+                }
+            else:
+                prompt = {
+                    "type":param_type,
+                    "description":para["description"][:description_max_length]
+                }
+
+            templete["parameters"]["properties"][name] = prompt
+            templete["parameters"]["required"].append(name)
+        for para in api_json["optional_parameters"]:
+            name = standardize(para["name"])
+            name = change_name(name)
+            if para["type"] in map_type:
+                param_type = map_type[para["type"]]
+            else:
+                param_type = "string"
+
+            default_value = para['default']
+            if len(str(default_value)) != 0:    
+                prompt = {
+                    "type":param_type,
+                    "description":para["description"][:description_max_length],
+                    "example_value": default_value
+                }
+            else:
+                prompt = {
+                    "type":param_type,
+                    "description":para["description"][:description_max_length]
+                }
+
+            templete["parameters"]["properties"][name] = prompt
+            templete["parameters"]["optional"].append(name)
+
+    return function_templete, api_json["category_name"],  pure_api_name
+
+
+def build_env_spec(query_json, args, tool_descriptions=None):
+    """
+    Build the immutable per-query part of the environment (functions, api_name_reflect,
+    tool_names, cate_names, task_description) without creating a rapidapi_wrapper.
+    `tool_descriptions` are rebuilt from the white list if missing or not matching the api_list.
+    """
+    tool_catalog = load_tool_catalog(args.tool_catalog) if getattr(args, "tool_catalog", "") else None
+    tool_names = []
+    cate_names = []
+    functions = []
+    api_name_reflect = {}
+
+    data_dict = fetch_api_json(query_json, args.tool_root_dir, tool_catalog)
+    if tool_descriptions is None or len(data_dict["api_list"])!= len(tool_descriptions):
+        tool_descriptions = build_tool_description(data_dict, args.tool_root_dir, tool_catalog)
+
+    for k,api_json in enumerate(data_dict["api_list"]):
+        standard_tool_name = tool_descriptions[k][0]
+        openai_function_json,cate_name, pure_api_name = api_json_to_openai_json(api_json,standard_tool_name)
+        functions.append(openai_function_json)
+        api_name_reflect[openai_function_json["function"]["name"]] = pure_api_name
+        tool_names.append(standard_tool_name)
+        cate_names.append(cate_name)
+
+    finish_func = {
+        "type": "function",
+        "function": {
+            "name": "Finish",
+            "description": "If you believe that you have obtained a result that can answer the task, please call this function to provide the final answer. Alternatively, if you recognize that you are unable to proceed with the task in the current state, call this function to restart. Remember: you must ALWAYS call this function at the end of your attempt, and the only part that will be shown to the user is the final answer, so it should contain sufficient information.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "return_type": {
+                        "type": "string",
+                        "enum": ["give_answer","give_up_and_restart"],
+                    },
+                    "final_answer": {
+                        "type": "string",
+                        "description": "The final answer you want to give the user. You should have this field if \"return_type\"==\"give_answer\"",
+                    }
+                },
+                "required": ["return_type"],
+            },
+        }
+    }
+
+    functions.append(finish_func)
+    task_description = f'''You should use functions to help handle the real time user querys. Remember:
+1.ALWAYS call \"Finish\" function at the end of the task. And the final answer should contain enough information to show to the user,If you can't handle the task, or you find that function calls always fail(the function is not valid now), use function Finish->give_up_and_restart.
+2.Do not use origin tool names, use only subfunctions' names.
+You have access of the following tools:\n'''
+    
+    unduplicated_reflection = {}
+    for standardize_tool_name, tool_des in tool_descriptions:
+        unduplicated_reflection[standardize_tool_name] = tool_des
+
+    for k,(standardize_tool_name, tool_des) in enumerate(unduplicated_reflection.items()):
+        try:
+            striped = tool_des[:512].replace('\n','').strip()
+        except:
+            striped = ""
+        if striped == "":
+            striped = "None"
+        task_description += f"{k+1}.{standardize_tool_name}: {striped}\n"
+
+    return {
+        "functions": functions,
+        "api_name_reflect": api_name_reflect,
+        "tool_names": tool_names,
+        "cate_names": cate_names,
+        "task_description": task_description,
+    }
+
+
 # rapidapi env wrapper
 class rapidapi_wrapper(base_env):
-    def __init__(self, query_json, tool_descriptions, retriever, args, process_id=0):
+    # process-wide resources, shared by the copies of the env in every search tree node
+    SHARED_ATTRIBUTES = ("tool_catalog", "rate_limiter", "session", "async_client", "tool_semaphore")
+
+    def __init__(self, query_json, tool_descriptions, retriever, args, process_id=0, env_spec=None, async_client=None, tool_semaphore=None):
         super(rapidapi_wrapper).__init__()
 
         self.tool_root_dir = args.tool_root_dir
+        self.tool_catalog = load_tool_catalog(args.tool_catalog) if getattr(args, "tool_catalog", "") else None
         self.toolbench_key = args.toolbench_key
         self.rapidapi_key = args.rapidapi_key
         self.use_rapidapi_key = args.use_rapidapi_key
         self.api_customization = args.api_customization
         self.service_url = os.getenv("SERVICE_URL", "http://8.130.32.149:8080/rapidapi")
+        # shared by every thread of the process calling the same service url
+        self.rate_limiter = get_rate_limiter(self.service_url, getattr(args, "rate_limit", ""))
+        self.max_throttle_retries = getattr(args, "max_throttle_retries", 3)
+        # keep-alive connections shared by all threads, one per thread
+        self.session = get_http_session(getattr(args, "num_thread", 1))
+        self.timeout = tool_call_timeout(
+            self.service_url,
+            connect_timeout=getattr(args, "connect_timeout", 10),
+            read_timeout=getattr(args, "read_timeout", 15),
+            virtual_read_timeout=getattr(args, "virtual_read_timeout", 600),
+        )
+        # --engine asyncio: shared httpx client and tool call concurrency limit of `astep`
+        self.async_client = async_client
+        self.tool_semaphore = tool_semaphore
         self.max_observation_length = args.max_observation_length
         self.observ_compress_method = args.observ_compress_method
         self.retriever = retriever
         self.process_id = process_id
 
-        self.tool_names = []
-        self.cate_names = []
-
         self.input_description = query_json["query"]
-        self.functions = []
-        self.api_name_reflect = {}
-
-        if self.retriever is not None:
-            query_json = self.retrieve_rapidapi_tools(self.input_description, args.retrieved_api_nums, args.tool_root_dir)
-            data_dict = self.fetch_api_json(query_json)
-            tool_descriptions = self.build_tool_description(data_dict)
-        else:
-            data_dict = self.fetch_api_json(query_json)
-            if len(data_dict["api_list"])!= len(tool_descriptions):
-                tool_descriptions = self.build_tool_description(data_dict)
-
-        for k,api_json in enumerate(data_dict["api_list"]):
-            standard_tool_name = tool_descriptions[k][0]
-            openai_function_json,cate_name, pure_api_name = self.api_json_to_openai_json(api_json,standard_tool_name)
-            self.functions.append(openai_function_json)
-            self.api_name_reflect[openai_function_json["function"]["name"]] = pure_api_name
-            self.tool_names.append(standard_tool_name)
-            self.cate_names.append(cate_name)
-
-        finish_func = {
-            "type": "function",
-            "function": {
-                "name": "Finish",
-                "description": "If you believe that you have obtained a result that can answer the task, please call this function to provide the final answer. Alternatively, if you recognize that you are unable to proceed with the task in the current state, call this function to restart. Remember: you must ALWAYS call this function at the end of your attempt, and the only part that will be shown to the user is the final answer, so it should contain sufficient information.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "return_type": {
-                            "type": "string",
-                            "enum": ["give_answer","give_up_and_restart"],
-                        },
-                        "final_answer": {
-                            "type": "string",
-                            "description": "The final answer you want to give the user. You should have this field if \"return_type\"==\"give_answer\"",
-                        }
-                    },
-                    "required": ["return_type"],
-                },
-            }
-        }
-
-        self.functions.append(finish_func)
         self.CALL_MAX_TIME = 3
-        self.task_description = f'''You should use functions to help handle the real time user querys. Remember:
-1.ALWAYS call \"Finish\" function at the end of the task. And the final answer should contain enough information to show to the user,If you can't handle the task, or you find that function calls always fail(the function is not valid now), use function Finish->give_up_and_restart.
-2.Do not use origin tool names, use only subfunctions' names.
-You have access of the following tools:\n'''
-        
-        unduplicated_reflection = {}
-        for standardize_tool_name, tool_des in tool_descriptions:
-            unduplicated_reflection[standardize_tool_name] = tool_des
-
-        for k,(standardize_tool_name, tool_des) in enumerate(unduplicated_reflection.items()):
-            try:
-                striped = tool_des[:512].replace('\n','').strip()
-            except:
-                striped = ""
-            if striped == "":
-                striped = "None"
-            self.task_description += f"{k+1}.{standardize_tool_name}: {striped}\n"
+        # functions, api_name_reflect, tool_names, cate_names and task_description; the spec dict
+        # itself is not kept, so the search tree nodes only copy these attributes
+        if env_spec is None:
+            if self.retriever is not None:
+                query_json = self.retrieve_rapidapi_tools(query_json["query"], args.retrieved_api_nums, args.tool_root_dir)
+                tool_descriptions = None
+            env_spec = build_env_spec(query_json, args, tool_descriptions)
+        self.functions = env_spec["functions"]
+        self.api_name_reflect = env_spec["api_name_reflect"]
+        self.tool_names = env_spec["tool_names"]
+        self.cate_names = env_spec["cate_names"]
+        self.task_description = env_spec["task_description"]
 
         self.success = 0
 
-    def build_tool_description(self, data_dict):
-        white_list = get_white_list(self.tool_root_dir)
-        origin_tool_names = [standardize(cont["tool_name"]) for cont in data_dict["api_list"]]
-        tool_des = contain(origin_tool_names,white_list)
-        tool_descriptions = [[cont["standard_tool_name"], cont["description"]] for cont in tool_des]
-        return tool_descriptions
-    
+    def __deepcopy__(self, memo):
+        copied = self.__class__.__new__(self.__class__)
+        memo[id(self)] = copied
+        for key, value in self.__dict__.items():
+            setattr(copied, key, value if key in self.SHARED_ATTRIBUTES else deepcopy(value, memo))
+        return copied
+
     def retrieve_rapidapi_tools(self, query, top_k, jsons_path):
         retrieved_tools = self.retriever.retrieving(query, top_k=top_k)
         query_json = {"api_list":[]}
@@ -153,7 +351,14 @@ You have access of the following tools:\n'''
             category = tool_dict["category"]
             tool_name = tool_dict["tool_name"]
             api_name = tool_dict["api_name"]
-            if os.path.exists(jsons_path):
+            if self.tool_catalog is not None:
+                if (category, tool_name) in self.tool_catalog:
+                    query_json["api_list"].append({
+                        "category_name": category,
+                        "tool_name": tool_name,
+                        "api_name": api_name
+                    })
+            elif os.path.exists(jsons_path):
                 if os.path.exists(os.path.join(jsons_path, category)):
                     if os.path.exists(os.path.join(jsons_path, category, tool_name+".json")):
                         query_json["api_list"].append({
@@ -163,122 +368,6 @@ You have access of the following tools:\n'''
                         })
         return query_json
     
-    def fetch_api_json(self, query_json):
-        data_dict = {"api_list":[]}
-        for item in query_json["api_list"]:
-            cate_name = item["category_name"]
-            tool_name = standardize(item["tool_name"])
-            api_name = change_name(standardize(item["api_name"]))
-            tool_json = json.load(open(os.path.join(self.tool_root_dir, cate_name, tool_name + ".json"), "r"))
-            append_flag = False
-            api_dict_names = []
-            for api_dict in tool_json["api_list"]:
-                api_dict_names.append(api_dict["name"])
-                pure_api_name = change_name(standardize(api_dict["name"]))
-                if pure_api_name != api_name:
-                    continue
-                api_json = {}
-                api_json["category_name"] = cate_name
-                api_json["api_name"] = api_dict["name"]
-                api_json["api_description"] = api_dict["description"]
-                api_json["required_parameters"] = api_dict["required_parameters"]
-                api_json["optional_parameters"] = api_dict["optional_parameters"]
-                api_json["tool_name"] = tool_json["tool_name"]
-                data_dict["api_list"].append(api_json)
-                append_flag = True
-                break
-            if not append_flag:
-                print(api_name, api_dict_names)
-        return data_dict
-
-
-    def api_json_to_openai_json(self, api_json,standard_tool_name):
-        description_max_length=256
-        function_templete = {
-            "type": "function",
-            "function": {
-                "name": "",
-                "description": "",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                    },
-                    "required": [""],
-                    "optional": [""],
-                }
-            }
-        }
-        templete = function_templete['function']
-        
-        map_type = {
-            "NUMBER": "integer",
-            "STRING": "string",
-            "BOOLEAN": "boolean"
-        }
-
-        pure_api_name = change_name(standardize(api_json["api_name"]))
-        templete["name"] = pure_api_name+ f"_for_{standard_tool_name}"
-        templete["name"] = templete["name"][-64:]
-
-        templete["description"] = f"This is the subfunction for tool \"{standard_tool_name}\", you can use this tool."
-        
-        if api_json["api_description"].strip() != "":
-            tuncated_description = api_json['api_description'].strip().replace(api_json['api_name'],templete['name'])[:description_max_length]
-            templete["description"] = templete["description"] + f"The description of this function is: \"{tuncated_description}\""
-        if "required_parameters" in api_json.keys() and len(api_json["required_parameters"]) > 0:
-            for para in api_json["required_parameters"]:
-                name = standardize(para["name"])
-                name = change_name(name)
-                if para["type"] in map_type:
-                    param_type = map_type[para["type"]]
-                else:
-                    param_type = "string"
-                prompt = {
-                    "type":param_type,
-                    "description":para["description"][:description_max_length],
-                }
-
-                default_value = para['default']
-                if len(str(default_value)) != 0:    
-                    prompt = {
-                        "type":param_type,
-                        "description":para["description"][:description_max_length],
-                        "example_value": default_value
-                    }
-                else:
-                    prompt = {
-                        "type":param_type,
-                        "description":para["description"][:description_max_length]
-                    }
-
-                templete["parameters"]["properties"][name] = prompt
-                templete["parameters"]["required"].append(name)
-            for para in api_json["optional_parameters"]:
-                name = standardize(para["name"])
-                name = change_name(name)
-                if para["type"] in map_type:
-                    param_type = map_type[para["type"]]
-                else:
-                    param_type = "string"
-
-                default_value = para['default']
-                if len(str(default_value)) != 0:    
-                    prompt = {
-                        "type":param_type,
-                        "description":para["description"][:description_max_length],
-                        "example_value": default_value
-                    }
-                else:
-                    prompt = {
-                        "type":param_type,
-                        "description":para["description"][:description_max_length]
-                    }
-
-                templete["parameters"]["properties"][name] = prompt
-                templete["parameters"]["optional"].append(name)
-
-        return function_templete, api_json["category_name"],  pure_api_name
-
     def check_success(self):
         return self.success
 
@@ -297,6 +386,13 @@ You have access of the following tools:\n'''
             obs = obs[:self.max_observation_length] + "..."
         return obs, code
 
+    async def astep(self,**args):
+        """`step` for the asyncio engine: the tool call is awaited on the event loop."""
+        obs, code = await self._astep(**args)
+        if len(obs) > self.max_observation_length:
+            obs = obs[:self.max_observation_length] + "..."
+        return obs, code
+
     def _step(self, action_name="", action_input=""):
         """Need to return an observation string and status code:
             0 means normal response
@@ -314,98 +410,152 @@ You have access of the following tools:\n'''
             12 error sending request
         """
         if action_name == "Finish":
-            try:
-                json_data = json.loads(action_input,strict=False)
-            except:
-                json_data = {}
-                if '"return_type": "' in action_input:
-                    if '"return_type": "give_answer"' in action_input:
-                        return_type = "give_answer"
-                    elif '"return_type": "give_up_and_restart"' in action_input:
-                        return_type = "give_up_and_restart"
-                    else:
-                        return_type = action_input[action_input.find('"return_type": "')+len('"return_type": "'):action_input.find('",')]
-                    json_data["return_type"] = return_type
-                if '"final_answer": "' in action_input:
-                    final_answer = action_input[action_input.find('"final_answer": "')+len('"final_answer": "'):]
-                    json_data["final_answer"] = final_answer
-            if "return_type" not in json_data.keys():
-                return "{error:\"must have \"return_type\"\"}", 2
-            if json_data["return_type"] == "give_up_and_restart":
-                return "{\"response\":\"chose to give up and restart\"}",4
-            elif json_data["return_type"] == "give_answer":
-                if "final_answer" not in json_data.keys():
-                    return "{error:\"must have \"final_answer\"\"}", 2
-                
-                self.success = 1 # succesfully return final_answer
-                return "{\"response\":\"successfully giving the final answer.\"}", 3
-            else:
-                return "{error:\"\"return_type\" is not a valid choice\"}", 2
+            return self._finish(action_input)
+        k, payload = self._tool_payload(action_name, action_input)
+        if payload is None:
+            return json.dumps({"error": f"No such function name: {action_name}", "response": ""}), 1
+        if self.use_rapidapi_key or self.api_customization:
+            payload["rapidapi_key"] = self.rapidapi_key
+            response = get_rapidapi_response(payload, api_customization=self.api_customization)
         else:
-
-            for k, function_dict in enumerate(self.functions):
-                function = function_dict['function']
-                # import pdb; pdb.set_trace()
-                if function["name"].endswith(action_name):
-                    pure_api_name = self.api_name_reflect[function["name"]]
-                    payload = {
-                        "category": self.cate_names[k],
-                        "tool_name": self.tool_names[k],
-                        "api_name": pure_api_name,
-                        "tool_input": action_input,
-                        "strip": self.observ_compress_method,
-                        "toolbench_key": self.toolbench_key
-                    }
-                    if self.process_id == 0:
-                        print(colored(f"query to {self.cate_names[k]}-->{self.tool_names[k]}-->{action_name}",color="yellow"))
-                    if self.use_rapidapi_key or self.api_customization:
-                        payload["rapidapi_key"] = self.rapidapi_key
-                        response = get_rapidapi_response(payload, api_customization=self.api_customization)
-                    else:
-                        time.sleep(2) # rate limit: 30 per minute
-                        headers = {"toolbench_key": self.toolbench_key}
-                        timeout = None if self.service_url.endswith("virtual") else 15
-                        try:
-                            response = requests.post(self.service_url, json=payload, headers=headers, timeout=timeout)
-                        except requests.exceptions.Timeout:
-                            return json.dumps({"error": f"Timeout error...", "response": ""}), 5
-                        if response.status_code != 200:
-                            return json.dumps({"error": f"request invalid, data error. status_code={response.status_code}", "response": ""}), 12
-                        try:
-                            response = response.json()
-                        except:
-                            print(response)
-                            return json.dumps({"error": f"request invalid, data error", "response": ""}), 12
-                    # 1 Hallucinating function names
-                    # 4 means that the model decides to pruning by itself
-                    # 5 represents api call timeout
-                    # 6 for 404
-                    # 7 means not subscribed
-                    # 8 represents unauthorized
-                    # 9 represents too many requests
-                    # 10 stands for rate limit
-                    # 11 message contains "error" field
-                    # 12 error sending request
-                    if response["error"] == "API not working error...":
-                        status_code = 6
-                    elif response["error"] == "Unauthorized error...":
-                        status_code = 7
-                    elif response["error"] == "Unsubscribed error...":
-                        status_code = 8
-                    elif response["error"] == "Too many requests error...":
-                        status_code = 9
-                    elif response["error"] == "Rate limit per minute error...":
-                        print("Reach api calling limit per minute, sleeping...")
-                        time.sleep(10)
-                        status_code = 10
-                    elif response["error"] == "Message error...":
-                        status_code = 11
-                    else:
-                        status_code = 0
-                    return json.dumps(response), status_code
-                    # except Exception as e:
-                    #     return json.dumps({"error": f"Timeout error...{e}", "response": ""}), 5
+            headers = {"toolbench_key": self.toolbench_key}
+            for attempt in range(self.max_throttle_retries + 1):
+                self.rate_limiter.acquire()
+                try:
+                    response = self.session.post(self.service_url, json=payload, headers=headers, timeout=self.timeout)
+                except requests.exceptions.Timeout:
+                    return json.dumps({"error": f"Timeout error...", "response": ""}), 5
+                if response.status_code != 429:
+                    break
+                # the server is overloaded: slow down every thread and try again
+                self.rate_limiter.throttle(parse_retry_after(response.headers.get("Retry-After")))
+            response = self._service_response(response.status_code, response.json, response)
+            if isinstance(response, tuple):
+                return response
+        return self._observation(response)
+
+    async def _astep(self, action_name="", action_input=""):
+        """`_step` with the service call awaited, see `_step` for the status codes."""
+        if action_name == "Finish":
+            return self._finish(action_input)
+        k, payload = self._tool_payload(action_name, action_input)
+        if payload is None:
             return json.dumps({"error": f"No such function name: {action_name}", "response": ""}), 1
+        if self.use_rapidapi_key or self.api_customization:
+            payload["rapidapi_key"] = self.rapidapi_key
+            response = await asyncio.to_thread(get_rapidapi_response, payload, api_customization=self.api_customization)
+        else:
+            headers = {"toolbench_key": self.toolbench_key}
+            async with self.tool_semaphore:
+                for attempt in range(self.max_throttle_retries + 1):
+                    await self.rate_limiter.aacquire()
+                    try:
+                        response = await self.async_client.post(self.service_url, json=payload, headers=headers, timeout=async_timeout(self.timeout))
+                    except httpx.TimeoutException:
+                        return json.dumps({"error": f"Timeout error...", "response": ""}), 5
+                    if response.status_code != 429:
+                        break
+                    # the server is overloaded: slow down every caller and try again
+                    self.rate_limiter.throttle(parse_retry_after(response.headers.get("Retry-After")))
+            response = self._service_response(response.status_code, response.json, response)
+            if isinstance(response, tuple):
+                return response
+        return self._observation(response)
+
+    def _finish(self, action_input):
+        try:
+            json_data = json.loads(action_input,strict=False)
+        except:
+            json_data = {}
+            if '"return_type": "' in action_input:
+                if '"return_type": "give_answer"' in action_input:
+                    return_type = "give_answer"
+                elif '"return_type": "give_up_and_restart"' in action_input:
+                    return_type = "give_up_and_restart"
+                else:
+                    return_type = action_input[action_input.find('"return_type": "')+len('"return_type": "'):action_input.find('",')]
+                json_data["return_type"] = return_type
+            if '"final_answer": "' in action_input:
+                final_answer = action_input[action_input.find('"final_answer": "')+len('"final_answer": "'):]
+                json_data["final_answer"] = final_answer
+        if "return_type" not in json_data.keys():
+            return "{error:\"must have \"return_type\"\"}", 2
+        if json_data["return_type"] == "give_up_and_restart":
+            return "{\"response\":\"chose to give up and restart\"}",4
+        elif json_data["return_type"] == "give_answer":
+            if "final_answer" not in json_data.keys():
+                return "{error:\"must have \"final_answer\"\"}", 2
+            
+            self.success = 1 # succesfully return final_answer
+            return "{\"response\":\"successfully giving the final answer.\"}", 3
+        else:
+            return "{error:\"\"return_type\" is not a valid choice\"}", 2
+
+    def _tool_payload(self, action_name, action_input):
+        """Index of the called function and the service payload, or (None, None) for an unknown name."""
+        for k, function_dict in enumerate(self.functions):
+            function = function_dict['function']
+            # import pdb; pdb.set_trace()
+            if function["name"].endswith(action_name):
+                pure_api_name = self.api_name_reflect[function["name"]]
+                payload = {
+                    "category": self.cate_names[k],
+                    "tool_name": self.tool_names[k],
+                    "api_name": pure_api_name,
+                    "tool_input": action_input,
+                    "strip": self.observ_compress_method,
+                    "toolbench_key": self.toolbench_key
+                }
+                if self.process_id == 0:
+                    print(colored(f"query to {self.cate_names[k]}-->{self.tool_names[k]}-->{action_name}",color="yellow"))
+                return k, payload
+        return None, None
+
+    def _service_response(self, status_code, parse_json, response):
+        """The decoded service response, or the (observation, status code) of a failed call."""
+        if status_code == 429:
+            return json.dumps({"error": f"Too many requests error...", "response": ""}), 9
+        if status_code != 200:
+            return json.dumps({"error": f"request invalid, data error. status_code={status_code}", "response": ""}), 12
+        try:
+            return parse_json()
+        except:
+            print(response)
+            return json.dumps({"error": f"request invalid, data error", "response": ""}), 12
+
+    def _observation(self, response):
+        # 1 Hallucinating function names
+        # 4 means that the model decides to pruning by itself
+        # 5 represents api call timeout
+        # 6 for 404
+        # 7 means not subscribed
+        # 8 represents unauthorized
+        # 9 represents too many requests
+        # 10 stands for rate limit
+        # 11 message contains "error" field
+        # 12 error sending request
+        if response["error"] == "API not working error...":
+            status_code = 6
+        elif response["error"] == "Unauthorized error...":
+            status_code = 7
+        elif response["error"] == "Unsubscribed error...":
+            status_code = 8
+        elif response["error"] == "Too many requests error...":
+            status_code = 9
+        elif response["error"] == "Rate limit per minute error...":
+            print("Reach api calling limit per minute, slowing down...")
+            self.rate_limiter.throttle(10)
+            status_code = 10
+        elif response["error"] == "Message error...":
+            status_code = 11
+        else:
+            status_code = 0
+        if status_code != 10:
+            self.rate_limiter.success()
+        return json.dumps(response), status_code
+
+# backbones with an `aparse`, i.e. usable with --engine asyncio
+ASYNC_BACKBONES = ("chatgpt_function", "toolllama_vllm")
 
 
 class pipeline_runner:
@@ -414,6 +564,13 @@ class pipeline_runner:
         self.add_retrieval = add_retrieval
         self.process_id = process_id
         self.server = server
+        # query_id -> precomputed env spec, see precompute_env_specs
+        self.env_specs = {}
+        # shared by the queries of `arun` (--engine asyncio)
+        self.async_http_client = None
+        self.tool_semaphore = None
+        self.llm_client = None
+        self.llm_semaphore = None
         if not self.server: self.task_list = self.generate_task_list()
         else: self.task_list = []
 
@@ -434,7 +591,8 @@ class pipeline_runner:
         return backbone_model
 
     def get_retriever(self):
-        return ToolRetriever(corpus_tsv_path=self.args.corpus_tsv_path, model_path=self.args.retrieval_model_path)
+        return ToolRetriever(corpus_tsv_path=self.args.corpus_tsv_path, model_path=self.args.retrieval_model_path,
+                             tool_catalog=getattr(self.args, "tool_catalog", ""))
 
     def get_args(self):
         return self.args
@@ -447,7 +605,7 @@ class pipeline_runner:
             os.mkdir(answer_dir)
         method = args.method
         backbone_model = self.get_backbone_model()
-        white_list = get_white_list(args.tool_root_dir)
+        white_list = get_white_list(args.tool_root_dir, getattr(args, "tool_catalog", ""))
         task_list = []
         querys = json.load(open(query_dir, "r"))
         for query_id, data_dict in enumerate(querys):
@@ -462,15 +620,73 @@ class pipeline_runner:
             else:
                 tool_des = None
             task_list.append((method, backbone_model, query_id, data_dict, args, answer_dir, tool_des))
+        if not self.add_retrieval:
+            self.env_specs = self.precompute_env_specs(task_list)
         return task_list
+
+    def precompute_env_specs(self, task_list):
+        """
+        Build the env spec (functions, api_name_reflect, tool_names, cate_names, task_description)
+        of every undone task in parallel, so creating its rapidapi_wrapper is a lookup. With
+        --env_spec_cache the specs are also kept on disk, keyed by `env_spec_key`.
+        """
+        args = self.args
+        cache_dir = getattr(args, "env_spec_cache", "")
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+        def load_or_build(task):
+            method, _, query_id, data_dict, _, answer_dir, tool_des = task
+            if tool_des is None or os.path.exists(os.path.join(answer_dir, f"{query_id}_{method}.json")):
+                return query_id, None
+            cache_path = os.path.join(cache_dir, env_spec_key(data_dict, tool_des, args) + ".json") if cache_dir else None
+            if cache_path and os.path.exists(cache_path):
+                try:
+                    with open(cache_path, "r") as reader:
+                        return query_id, json.load(reader)
+                except (OSError, json.JSONDecodeError):
+                    pass
+            try:
+                env_spec = build_env_spec(data_dict, args, tool_des)
+            except Exception as e:
+                # built (and reported) again when the task runs
+                print(f"precomputing the env of query {query_id} failed: {e}")
+                return query_id, None
+            if cache_path:
+                fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+                with os.fdopen(fd, "w") as writer:
+                    json.dump(env_spec, writer)
+                os.replace(tmp_path, cache_path)
+            return query_id, env_spec
+
+        start = time.time()
+        env_specs = {}
+        with ThreadPoolExecutor(max(args.num_thread, 1)) as executor:
+            for query_id, env_spec in executor.map(load_or_build, task_list):
+                if env_spec is not None:
+                    env_specs[query_id] = env_spec
+        print(f"precomputed {len(env_specs)} env specs in {time.time() - start:.1f}s")
+        return env_specs
     
     def method_converter(self, backbone_model, openai_key, method, env, process_id, single_chain_max_step=12, max_query_count=60, callbacks=None):
+        chain, start_args = self.build_chain(backbone_model, openai_key, method, env, process_id, single_chain_max_step, max_query_count, callbacks)
+        result = chain.start(**start_args)
+        return chain, result
+
+    async def amethod_converter(self, backbone_model, openai_key, method, env, process_id, single_chain_max_step=12, max_query_count=60, callbacks=None):
+        chain, start_args = self.build_chain(backbone_model, openai_key, method, env, process_id, single_chain_max_step, max_query_count, callbacks)
+        result = await chain.astart(**start_args)
+        return chain, result
+
+    def build_chain(self, backbone_model, openai_key, method, env, process_id, single_chain_max_step=12, max_query_count=60, callbacks=None):
+        """The search algorithm of `method` and the arguments of its `start` / `astart`"""
         if callbacks is None: callbacks = []
         if backbone_model == "chatgpt_function":
             # model = "gpt-3.5-turbo-16k-0613"
             # model = os.getenv('CHAT_MODEL', "gpt-3.5-turbo-16k-0613")
             # base_url = os.getenv('OPENAI_API_BASE', None)
-            llm_forward = ChatGPTFunction(model=self.args.chatgpt_model, openai_key=openai_key, base_url=self.args.base_url)
+            llm_forward = ChatGPTFunction(model=self.args.chatgpt_model, openai_key=openai_key, base_url=self.args.base_url,
+                                          async_client=self.llm_client, semaphore=self.llm_semaphore)
         elif backbone_model == "davinci":
             model = os.getenv('CHAT_MODEL', "gpt-3.5-turbo-16k-0613")
             base_url = os.getenv('OPENAI_API_BASE', None)
@@ -482,7 +698,7 @@ class pipeline_runner:
         if method.startswith("CoT"):
             passat = int(method.split("@")[-1])
             chain = single_chain(llm=llm_forward, io_func=env,process_id=process_id)
-            result = chain.start(
+            start_args = dict(
                                 pass_at=passat,
                                 single_chain_max_step=single_chain_max_step,
                                 answer=1)
@@ -495,7 +711,7 @@ class pipeline_runner:
             if "woFilter" in method:
                 with_filter = False
             chain = DFS_tree_search(llm=llm_forward, io_func=env,process_id=process_id, callbacks=callbacks)
-            result = chain.start(
+            start_args = dict(
                                 single_chain_max_step=single_chain_max_step,
                                 tree_beam_size = width,
                                 max_query_count = max_query_count,
@@ -504,7 +720,7 @@ class pipeline_runner:
         else:
             print("invalid method")
             raise NotImplementedError
-        return chain, result
+        return chain, start_args
     
     def run_single_task(self, method, backbone_model, query_id, data_dict, args, output_dir_path, tool_des, retriever=None, process_id=0, callbacks=None, server= None):
         if server is None:
@@ -512,14 +728,54 @@ class pipeline_runner:
         if callbacks is None:
             if server: print("Warning: no callbacks are defined for server mode")
             callbacks = []
+        output_file_path = self.output_file_path(method, query_id, output_dir_path)
+        if (not server) and os.path.exists(output_file_path):
+            return
+        env = self.prepare_env(method, query_id, data_dict, args, tool_des, retriever, process_id, callbacks)
+        chain,result = self.method_converter(
+            backbone_model=backbone_model,
+            openai_key=args.openai_key,
+            method=method,
+            env=env,
+            process_id=process_id,
+            single_chain_max_step=args.single_chain_max_step,
+            # max_query_count=200,
+            max_query_count=args.max_query_count,
+            callbacks=callbacks
+        )
+        self.save_result(chain, data_dict, output_dir_path, output_file_path, process_id, callbacks)
+        return result
+
+    async def arun_single_task(self, method, backbone_model, query_id, data_dict, args, output_dir_path, tool_des, retriever=None, process_id=0):
+        """`run_single_task` as a coroutine of `arun`"""
+        output_file_path = self.output_file_path(method, query_id, output_dir_path)
+        if os.path.exists(output_file_path):
+            return
+        # blocking file and CPU work runs on worker threads, off the event loop
+        env = await asyncio.to_thread(self.prepare_env, method, query_id, data_dict, args, tool_des, retriever, process_id, [])
+        chain,result = await self.amethod_converter(
+            backbone_model=backbone_model,
+            openai_key=args.openai_key,
+            method=method,
+            env=env,
+            process_id=process_id,
+            single_chain_max_step=args.single_chain_max_step,
+            max_query_count=args.max_query_count,
+        )
+        await asyncio.to_thread(self.save_result, chain, data_dict, output_dir_path, output_file_path, process_id, [])
+        return result
+
+    def output_file_path(self, method, query_id, output_dir_path):
         splits = output_dir_path.split("/")
         os.makedirs("/".join(splits[:-1]),exist_ok=True)
         os.makedirs("/".join(splits),exist_ok=True)
-        output_file_path = os.path.join(output_dir_path,f"{query_id}_{method}.json")
-        if (not server) and os.path.exists(output_file_path):
-            return
+        return os.path.join(output_dir_path,f"{query_id}_{method}.json")
+
+    def prepare_env(self, method, query_id, data_dict, args, tool_des, retriever, process_id, callbacks):
         [callback.on_tool_retrieval_start() for callback in callbacks]
-        env = rapidapi_wrapper(data_dict, tool_des, retriever, args, process_id=process_id)
+        env_spec = self.env_specs.get(query_id) if retriever is None else None
+        env = rapidapi_wrapper(data_dict, tool_des, retriever, args, process_id=process_id, env_spec=env_spec,
+                               async_client=self.async_http_client, tool_semaphore=self.tool_semaphore)
         [callback.on_tool_retrieval_end(
             tools=env.functions
         ) for callback in callbacks]
@@ -530,17 +786,10 @@ class pipeline_runner:
             user_input=query,
             method=method,
         ) for callback in callbacks]
-        chain,result = self.method_converter(
-            backbone_model=backbone_model,
-            openai_key=args.openai_key,
-            method=method,
-            env=env,
-            process_id=process_id,
-            single_chain_max_step=args.single_chain_max_step,
-            # max_query_count=200,
-            max_query_count=args.max_query_count,
-            callbacks=callbacks
-        )
+        return env
+
+    def save_result(self, chain, data_dict, output_dir_path, output_file_path, process_id, callbacks):
+        query = data_dict["query"]
         [callback.on_request_end(
             chain=chain.terminal_node[0].messages,
             outputs=chain.terminal_node[0].description,
@@ -553,7 +802,6 @@ class pipeline_runner:
                 success = data["answer_generation"]["valid_data"] and "give_answer" in data["answer_generation"]["final_answer"]
                 if process_id == 0:
                     print(colored(f"[process({process_id})]valid={success}", "green"))
-        return result
         
     def run(self):
         task_list = self.task_list
@@ -573,7 +821,9 @@ class pipeline_runner:
             retriever = self.get_retriever()
         else:
             retriever = None
-        if self.args.num_thread == 1:
+        if getattr(self.args, "engine", "thread") == "asyncio":
+            asyncio.run(self.arun(task_list, retriever))
+        elif self.args.num_thread == 1:
             for k, task in enumerate(task_list):
                 print(f"process[{self.process_id}] doing task {k}/{len(task_list)}: real_task_id_{task[2]}")
                 result = self.run_single_task(*task, retriever=retriever, process_id=self.process_id)
@@ -589,3 +839,37 @@ class pipeline_runner:
                     disable=self.args.disable_tqdm
                 ):
                     pass
+        for service_url, stats in rate_limiter_stats().items():
+            print(f"rate limiter {service_url}: {stats}")
+
+    async def arun(self, task_list, retriever=None):
+        """
+        --engine asyncio: every query is a coroutine on one event loop, up to `num_thread` in
+        flight. LLM calls share one AsyncOpenAI client and tool calls one httpx client; each
+        kind has its own concurrency limit (--llm_concurrency, --tool_concurrency) and is
+        spread over a few clients, see `AsyncClientPool`.
+        """
+        args = self.args
+        if args.backbone_model not in ASYNC_BACKBONES:
+            raise ValueError(f"--engine asyncio supports the {', '.join(ASYNC_BACKBONES)} backbones, not {args.backbone_model}")
+        self.llm_semaphore = asyncio.Semaphore(max(args.llm_concurrency, 1))
+        self.tool_semaphore = asyncio.Semaphore(max(args.tool_concurrency, 1))
+        self.async_http_client = get_async_http_client(args.tool_concurrency)
+        self.llm_client = AsyncClientPool(lambda: AsyncOpenAI(base_url=args.base_url, api_key=args.openai_key), args.llm_concurrency)
+        if task_list and isinstance(task_list[0][1], ToolLLaMA_vllm):
+            # one backbone for every query
+            task_list[0][1].async_client = self.llm_client
+            task_list[0][1].semaphore = self.llm_semaphore
+        in_flight = asyncio.Semaphore(max(args.num_thread, 1))
+
+        async def distribute_single_task(id, task):
+            async with in_flight:
+                return await self.arun_single_task(*task, retriever=retriever, process_id=id + self.process_id)
+
+        try:
+            pending = [distribute_single_task(id, task) for id, task in enumerate(task_list)]
+            for finished in tqdm(asyncio.as_completed(pending), total=len(task_list), disable=args.disable_tqdm):
+                await finished
+        finally:
+            await self.async_http_client.aclose()
+            await self.llm_client.aclose()
@@ -1,6 +1,8 @@
 import os
+import asyncio
+from contextlib import nullcontext
 
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 import httpx
 from tenacity import retry, wait_random_exponential, stop_after_attempt
 from termcolor import colored
@@ -8,9 +10,7 @@ import time
 import json
 import traceback
 
-@retry(wait=wait_random_exponential(min=1, max=40), stop=stop_after_attempt(3))
-def chat_completion_request(key, base_url, messages, tools=None, tool_choice=None, key_pos=None,
-                            model="gpt-3.5-turbo", stop=None, process_id=0, **args):
+def chat_completion_json(messages, tools=None, tool_choice=None, model="gpt-3.5-turbo", stop=None, **args):
     use_messages = []
     for message in messages:
         if not ("valid" in message.keys() and message["valid"] == False):
@@ -34,6 +34,12 @@ def chat_completion_request(key, base_url, messages, tools=None, tool_choice=Non
         json_data.update({"tools": tools})
     if tool_choice is not None:
         json_data.update({"tool_choice": tool_choice})
+    return json_data
+
+@retry(wait=wait_random_exponential(min=1, max=40), stop=stop_after_attempt(3))
+def chat_completion_request(key, base_url, messages, tools=None, tool_choice=None, key_pos=None,
+                            model="gpt-3.5-turbo", stop=None, process_id=0, **args):
+    json_data = chat_completion_json(messages, tools=tools, tool_choice=tool_choice, model=model, stop=stop, **args)
 
     try:
         if model.startswith("gpt"):
@@ -50,14 +56,34 @@ def chat_completion_request(key, base_url, messages, tools=None, tool_choice=Non
         import pdb;  pdb.set_trace()
         return {"error": str(e), "total_tokens": 0}
 
+@retry(wait=wait_random_exponential(min=1, max=40), stop=stop_after_attempt(3))
+async def async_chat_completion_request(client, messages, tools=None, tool_choice=None, key_pos=None,
+                                        model="gpt-3.5-turbo", stop=None, process_id=0, **args):
+    """`chat_completion_request` on a shared `AsyncOpenAI` client, for the asyncio engine."""
+    json_data = chat_completion_json(messages, tools=tools, tool_choice=tool_choice, model=model, stop=stop, **args)
+
+    try:
+        if not model.startswith("gpt"):
+            raise NotImplementedError("Model not supported")
+        openai_response = await client.chat.completions.create(**json_data)
+        return openai_response.dict()
+
+    except Exception as e:
+        print("Unable to generate ChatCompletion response")
+        traceback.print_exc()
+        return {"error": str(e), "total_tokens": 0}
+
 class ChatGPTFunction:
-    def __init__(self, model="gpt-4-turbo-2024-04-09", openai_key="", base_url=None):
+    def __init__(self, model="gpt-4-turbo-2024-04-09", openai_key="", base_url=None, async_client=None, semaphore=None):
+        """async_client (AsyncOpenAI) and semaphore (limit of concurrent LLM calls) are shared by the asyncio engine"""
         self.model = model
         self.conversation_history = []
         self.openai_key = openai_key
         self.base_url = base_url
         self.time = time.time()
         self.TRY_TIME = 6
+        self.async_client = async_client
+        self.semaphore = semaphore
 
     def add_message(self, message):
         self.conversation_history.append(message)
@@ -109,23 +135,49 @@ class ChatGPTFunction:
                 response = chat_completion_request(
                     self.openai_key, self.base_url, conversation_history, process_id=process_id, key_pos=key_pos, model=self.model, **args
                 )
-            try:
-                total_tokens = response['usage']['total_tokens']
-                message = response["choices"][0]["message"]
-
+            parsed = self.parse_response(response, process_id)
+            if parsed is not None:
+                return parsed
 
-                if process_id == 0:
-                    print(f"[process({process_id})]total tokens: {total_tokens}")
+        return {"role": "assistant", "content": str(response)}, -1, 0
 
-                return message, 0, total_tokens
-            except BaseException as e:
-                print(f"[process({process_id})]Parsing Exception: {repr(e)}. Try again.")
-                traceback.print_exc()
-                if response is not None:
-                    print(f"[process({process_id})]OpenAI return: {response}")
+    async def aparse(self, tools, process_id, messages=None, key_pos=None, **args):
+        """`parse` as a coroutine on `messages` (default: the conversation history)"""
+        if self.async_client is None:
+            self.async_client = AsyncOpenAI(base_url=self.base_url, api_key=self.openai_key) if self.base_url else AsyncOpenAI(api_key=self.openai_key)
+        self.time = time.time()
+        conversation_history = self.conversation_history if messages is None else messages
+        for _ in range(self.TRY_TIME):
+            if _ != 0:
+                await asyncio.sleep(15)
+            async with self.semaphore or nullcontext():
+                response = await async_chat_completion_request(
+                    self.async_client, conversation_history, tools=tools if tools != [] else None, process_id=process_id,
+                    key_pos=key_pos, model=self.model, **args
+                )
+            parsed = self.parse_response(response, process_id)
+            if parsed is not None:
+                return parsed
 
         return {"role": "assistant", "content": str(response)}, -1, 0
 
+    def parse_response(self, response, process_id):
+        """(message, 0, total_tokens) of a completion response, or None to try again"""
+        try:
+            total_tokens = response['usage']['total_tokens']
+            message = response["choices"][0]["message"]
+
+
+            if process_id == 0:
+                print(f"[process({process_id})]total tokens: {total_tokens}")
+
+            return message, 0, total_tokens
+        except BaseException as e:
+            print(f"[process({process_id})]Parsing Exception: {repr(e)}. Try again.")
+            traceback.print_exc()
+            if response is not None:
+                print(f"[process({process_id})]OpenAI return: {response}")
+
 def get_current_weather(location, unit="fahrenheit"):
     """Get the current weather in a given location"""
     if "tokyo" in location.lower():
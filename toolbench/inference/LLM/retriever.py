@@ -4,12 +4,16 @@ from sentence_transformers import SentenceTransformer, util
 import json
 import re
 import os, torch
-from toolbench.utils import standardize, standardize_category, change_name, process_retrieval_ducoment
+from toolbench.utils import standardize, standardize_category, change_name, process_retrieval_ducoment, process_retrieval_documents
+from toolbench.tool_catalog import load_tool_catalog
 
 
 class ToolRetriever:
-    def __init__(self, corpus_tsv_path = "", model_path=""):
+    def __init__(self, corpus_tsv_path = "", model_path="", tool_catalog=""):
+        """The corpus is read from `corpus_tsv_path`, or if that file does not exist from every
+        API of the compiled `tool_catalog` (python -m toolbench.tool_catalog compile)."""
         self.corpus_tsv_path = corpus_tsv_path
+        self.tool_catalog = tool_catalog if tool_catalog and not os.path.isfile(corpus_tsv_path) else ""
         self.model_path = model_path
         self.model_name = model_path.split('/')[-1]
         self.corpus, self.corpus2tool = self.build_retrieval_corpus()
@@ -18,12 +22,33 @@ class ToolRetriever:
         
     def build_retrieval_corpus(self):
         print("Building corpus...")
-        documents_df = pd.read_csv(self.corpus_tsv_path, sep='\t')
-        corpus, corpus2tool = process_retrieval_ducoment(documents_df)
+        if self.tool_catalog:
+            corpus, corpus2tool = process_retrieval_documents(self.catalog_documents())
+        else:
+            documents_df = pd.read_csv(self.corpus_tsv_path, sep='\t')
+            corpus, corpus2tool = process_retrieval_ducoment(documents_df)
         corpus_ids = list(corpus.keys())
         corpus = [corpus[cid] for cid in corpus_ids]
         return corpus, corpus2tool
 
+    def catalog_documents(self):
+        """(docid, document) of every API in the catalog, with the fields of the corpus TSV documents."""
+        catalog = load_tool_catalog(self.tool_catalog)
+        docid = 0
+        for category, tool_name, _ in catalog.tools():
+            record = catalog.get_tool(category, tool_name)
+            for api in record["api_list"]:
+                yield docid, {
+                    "category_name": category,
+                    "tool_name": record["tool_name"],
+                    "api_name": api["name"],
+                    "api_description": api.get("description", ""),
+                    "required_parameters": api.get("required_parameters", []),
+                    "optional_parameters": api.get("optional_parameters", []),
+                    "template_response": api.get("template_response", ""),
+                }
+                docid += 1
+
     def build_retrieval_embedder(self):
         print("Building embedder...")
         embedder = SentenceTransformer(self.model_path)
@@ -31,7 +56,12 @@ class ToolRetriever:
     
     def build_corpus_embeddings(self):
         print("Building corpus embeddings with embedder...")
-        embedding_save_path = self.corpus_tsv_path.replace('.tsv', f'_{self.model_name}_embeddings.pt')
+        if self.tool_catalog:
+            # a recompiled catalog gets new embeddings
+            catalog_version = int(os.path.getmtime(self.tool_catalog))
+            embedding_save_path = f"{os.path.splitext(self.tool_catalog)[0]}_{self.model_name}_{catalog_version}_embeddings.pt"
+        else:
+            embedding_save_path = self.corpus_tsv_path.replace('.tsv', f'_{self.model_name}_embeddings.pt')
         if os.path.exists(embedding_save_path):
             print("Loading pre-computed corpus embeddings...")
             corpus_embeddings = torch.load(embedding_save_path)
@@ -1,6 +1,8 @@
 # import os
+import asyncio
+from contextlib import nullcontext
 
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 # import httpx
 from tenacity import retry, wait_random_exponential, stop_after_attempt
 from termcolor import colored
@@ -12,10 +14,8 @@ from toolbench.model.model_adapter import get_conversation_template
 from toolbench.inference.utils import react_parser
 import string, random, json
 
-@retry(wait=wait_random_exponential(min=1, max=40), stop=stop_after_attempt(3))
-def completion_request(key, base_url, prompt,
-                        model="ToolBench/ToolLLaMA-2-7b-v2", process_id=0, **args):
-    json_data = {
+def completion_json(prompt, model="ToolBench/ToolLLaMA-2-7b-v2", **args):
+    return {
         "model": model,
         "prompt": prompt,
         "temperature": 0,
@@ -28,6 +28,11 @@ def completion_request(key, base_url, prompt,
         **args
     }
 
+@retry(wait=wait_random_exponential(min=1, max=40), stop=stop_after_attempt(3))
+def completion_request(key, base_url, prompt,
+                        model="ToolBench/ToolLLaMA-2-7b-v2", process_id=0, **args):
+    json_data = completion_json(prompt, model=model, **args)
+
     try:
         client = OpenAI(base_url=base_url, api_key=key)
         vllm_response = client.completions.create(**json_data)
@@ -40,14 +45,32 @@ def completion_request(key, base_url, prompt,
         import pdb;  pdb.set_trace()
         return {"error": str(e), "total_tokens": 0}
 
+@retry(wait=wait_random_exponential(min=1, max=40), stop=stop_after_attempt(3))
+async def async_completion_request(client, prompt,
+                                   model="ToolBench/ToolLLaMA-2-7b-v2", process_id=0, **args):
+    """`completion_request` on a shared `AsyncOpenAI` client, for the asyncio engine."""
+    json_data = completion_json(prompt, model=model, **args)
+
+    try:
+        vllm_response = await client.completions.create(**json_data)
+        return vllm_response.dict()
+
+    except Exception as e:
+        print("Unable to generate ChatCompletion response")
+        traceback.print_exc()
+        return {"error": str(e), "total_tokens": 0}
+
 class ToolLLaMA_vllm:
     def __init__(
             self, 
             model="ToolBench/ToolLLaMA-2-7b-v2", 
             template:str="tool-llama-single-round",
             openai_key="", 
-            base_url=None
+            base_url=None,
+            async_client=None,
+            semaphore=None,
             ):
+        """async_client (AsyncOpenAI) and semaphore (limit of concurrent LLM calls) are shared by the asyncio engine"""
         self.model = model
         self.template = template
         self.conversation_history = []
@@ -55,6 +78,8 @@ class ToolLLaMA_vllm:
         self.base_url = base_url
         self.time = time.time()
         self.TRY_TIME = 6
+        self.async_client = async_client
+        self.semaphore = semaphore
 
     def add_message(self, message):
         self.conversation_history.append(message)
@@ -90,86 +115,112 @@ class ToolLLaMA_vllm:
             )
         print("end_print" + "*" * 50)
 
-    def parse(self, tools, process_id, **args):
+    def build_prompt(self, conversation_history, tools):
         conv = get_conversation_template(self.template)
         if self.template == "tool-llama":
             roles = {"human": conv.roles[0], "gpt": conv.roles[1]}
         elif self.template == "tool-llama-single-round" or self.template == "tool-llama-multi-rounds":
             roles = {"system": conv.roles[0], "user": conv.roles[1], "tool": conv.roles[2], "assistant": conv.roles[3]}
 
-        self.time = time.time()
         if tools != []:
             functions = [tool['function'] for tool in tools]
+        prompt = ''
+        for message in conversation_history:
+            role = roles[message['role']]
+            content = message['content']
+            if role == "System" and tools != []:
+                content = process_system_message(content, functions)
+            # if role == "Assistant":
+            #     content = react_deparser(message['content'], message['tool_calls'][0]['function']["name"], message['tool_calls'][0]['function']['arguments']) #debug
+            prompt += f"{role}: {content}\n"
+        prompt += "Assistant:\n"
+        return prompt
+
+    def parse(self, tools, process_id, **args):
+        self.time = time.time()
         conversation_history = self.conversation_history
         for _ in range(self.TRY_TIME):
             if _ != 0:
                 time.sleep(15)
-            prompt = ''
-            for message in conversation_history:
-                role = roles[message['role']]
-                content = message['content']
-                if role == "System" and tools != []:
-                    content = process_system_message(content, functions)
-                # if role == "Assistant":
-                #     content = react_deparser(message['content'], message['tool_calls'][0]['function']["name"], message['tool_calls'][0]['function']['arguments']) #debug
-                prompt += f"{role}: {content}\n"
-            prompt += "Assistant:\n"
+            prompt = self.build_prompt(conversation_history, tools)
             response = completion_request(self.openai_key, self.base_url, prompt,
                                           model=self.model, process_id=process_id, **args)
             # import pdb; pdb.set_trace()
+            parsed = self.parse_response(response, process_id)
+            if parsed is not None:
+                return parsed
 
-            try:
-                total_tokens = response['usage']['total_tokens']
-                message = response["choices"][0]["text"]
-                if process_id == 0:
-                    print(f"[process({process_id})]total tokens: {total_tokens}")
-
-                if total_tokens >= 8192:
-                    message = {
-                        "role": "assistant",
-                        "content": "The response is too long, please try again.\nOrignal response: " + message,
-                        "tool_calls": [
-                        {
-                            "id": 0,  
-                            "function": {
-                                "name": 'Finish',
-                                "arguments": json.dumps({'return_type': 'give_up_and_restart'}) 
-                            },
-                            "type": "function"
-                        }
-                    ]
-                    }
-                    return message, 0, total_tokens
+        return {"role": "assistant", "content": str(response)}, -1, 0
+
+    async def aparse(self, tools, process_id, messages=None, **args):
+        """`parse` as a coroutine on `messages` (default: the conversation history)"""
+        if self.async_client is None:
+            self.async_client = AsyncOpenAI(base_url=self.base_url, api_key=self.openai_key)
+        self.time = time.time()
+        conversation_history = self.conversation_history if messages is None else messages
+        prompt = self.build_prompt(conversation_history, tools)
+        for _ in range(self.TRY_TIME):
+            if _ != 0:
+                await asyncio.sleep(15)
+            async with self.semaphore or nullcontext():
+                response = await async_completion_request(self.async_client, prompt,
+                                                          model=self.model, process_id=process_id, **args)
+            parsed = self.parse_response(response, process_id)
+            if parsed is not None:
+                return parsed
+
+        return {"role": "assistant", "content": str(response)}, -1, 0
+
+    def parse_response(self, response, process_id):
+        """(message, 0, total_tokens) of a completion response, or None to try again"""
+        try:
+            total_tokens = response['usage']['total_tokens']
+            message = response["choices"][0]["text"]
+            if process_id == 0:
+                print(f"[process({process_id})]total tokens: {total_tokens}")
 
-                thought, action, action_input = react_parser(message)
-                # print(message)
-                # import pdb; pdb.set_trace()
-                random_id = ''.join([random.choice(string.ascii_letters + string.digits) for _ in range(8)])
+            if total_tokens >= 8192:
                 message = {
                     "role": "assistant",
-                    "content": message,
+                    "content": "The response is too long, please try again.\nOrignal response: " + message,
                     "tool_calls": [
-                        {
-                            "id": random_id,  # 可能在conver_to_answer_format处有bug
-                            "function": {
-                                "name": action,
-                                "arguments": action_input 
-                            },
-                            "type": "function"
-                        }
-                    ]
+                    {
+                        "id": 0,  
+                        "function": {
+                            "name": 'Finish',
+                            "arguments": json.dumps({'return_type': 'give_up_and_restart'}) 
+                        },
+                        "type": "function"
+                    }
+                ]
                 }
-                # breakpoint()
                 return message, 0, total_tokens
-            except BaseException as e:
-                print(f"[process({process_id})]Parsing Exception: {repr(e)}. Try again.")
-                traceback.print_exc()
-                if response is not None:
-                    print(f"[process({process_id})]OpenAI return: {response}")
-            
-
-        return {"role": "assistant", "content": str(response)}, -1, 0
 
+            thought, action, action_input = react_parser(message)
+            # print(message)
+            # import pdb; pdb.set_trace()
+            random_id = ''.join([random.choice(string.ascii_letters + string.digits) for _ in range(8)])
+            message = {
+                "role": "assistant",
+                "content": message,
+                "tool_calls": [
+                    {
+                        "id": random_id,  # 可能在conver_to_answer_format处有bug
+                        "function": {
+                            "name": action,
+                            "arguments": action_input 
+                        },
+                        "type": "function"
+                    }
+                ]
+            }
+            # breakpoint()
+            return message, 0, total_tokens
+        except BaseException as e:
+            print(f"[process({process_id})]Parsing Exception: {repr(e)}. Try again.")
+            traceback.print_exc()
+            if response is not None:
+                print(f"[process({process_id})]OpenAI return: {response}")
 
 if __name__ == "__main__":
     llm = ToolLLaMA_vllm(
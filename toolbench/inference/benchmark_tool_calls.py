@@ -0,0 +1,60 @@
+'''
+Tool calls per second against a (local) simulator, with a new connection per call
+(`requests.post`, as the runner used to) and with the pooled keep-alive session.
+Use a cached call so the simulator model does not dominate the timing.
+
+    python toolbench/inference/benchmark_tool_calls.py --service_url http://localhost:8080/virtual --num_thread 20 --num_calls 2000 \
+        --category Data --tool_name weather_tool --api_name get_forecast --tool_input '{"city": "Oslo"}'
+'''
+
+import time
+import argparse
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from toolbench.inference.http_session import get_http_session, tool_call_timeout
+
+
+def run(post, args, payload, timeout):
+    headers = {"toolbench_key": args.toolbench_key}
+    failures = 0
+
+    def call(_):
+        response = post(args.service_url, json=payload, headers=headers, timeout=timeout)
+        return response.status_code == 200
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.num_thread) as executor:
+        for ok in executor.map(call, range(args.num_calls)):
+            failures += not ok
+    elapsed = time.perf_counter() - start
+    return args.num_calls / elapsed, failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--service_url', type=str, default="http://localhost:8080/virtual", required=False, help='simulator url')
+    parser.add_argument('--num_thread', type=int, default=20, required=False, help='number of calling threads')
+    parser.add_argument('--num_calls', type=int, default=2000, required=False, help='number of calls per mode')
+    parser.add_argument('--category', type=str, default="Data", required=False, help='category of the called api')
+    parser.add_argument('--tool_name', type=str, default="", required=False, help='standardized tool name of the called api')
+    parser.add_argument('--api_name', type=str, default="", required=False, help='standardized api name of the called api')
+    parser.add_argument('--tool_input', type=str, default="{}", required=False, help='tool input json')
+    parser.add_argument('--toolbench_key', type=str, default="", required=False, help='toolbench key sent with the calls')
+    parser.add_argument('--connect_timeout', type=float, default=10, required=False, help='connect timeout in seconds')
+    parser.add_argument('--virtual_read_timeout', type=float, default=600, required=False, help='read timeout in seconds')
+    args = parser.parse_args()
+
+    payload = {
+        "category": args.category,
+        "tool_name": args.tool_name,
+        "api_name": args.api_name,
+        "tool_input": args.tool_input,
+        "strip": "truncate",
+        "toolbench_key": args.toolbench_key,
+    }
+    timeout = tool_call_timeout(args.service_url, args.connect_timeout, virtual_read_timeout=args.virtual_read_timeout)
+    # warm up the simulator cache
+    requests.post(args.service_url, json=payload, headers={"toolbench_key": args.toolbench_key}, timeout=timeout)
+    for name, post in [("requests.post", requests.post), ("pooled session", get_http_session(args.num_thread).post)]:
+        calls_per_second, failures = run(post, args, payload, timeout)
+        print(f"{name:<16} {calls_per_second:>8.1f} calls/s  ({failures} failed)")
@@ -0,0 +1,81 @@
+import itertools
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from toolbench.inference.rate_limiter import is_virtual_service
+
+_SESSIONS = {}
+_SESSIONS_LOCK = threading.Lock()
+
+
+def get_http_session(pool_size=10):
+    """
+    Process-wide `requests.Session` for the tool calls of every runner thread. Its adapter
+    keeps up to `pool_size` (the number of threads) connections per host alive, so calls
+    reuse sockets instead of opening a TCP connection each; a thread waits for a free
+    connection rather than opening one that would be thrown away.
+    """
+    pool_size = max(pool_size, 1)
+    with _SESSIONS_LOCK:
+        session = _SESSIONS.get(pool_size)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, pool_block=True)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _SESSIONS[pool_size] = session
+        return session
+
+
+def tool_call_timeout(service_url, connect_timeout=10, read_timeout=15, virtual_read_timeout=600):
+    """(connect, read) timeout of the tool calls; simulated (/virtual) calls wait for the simulator model."""
+    if is_virtual_service(service_url):
+        return connect_timeout, virtual_read_timeout or None
+    return connect_timeout, read_timeout or None
+
+
+class AsyncClientPool:
+    """
+    Round robin over `async client`s, each serving about `shard_size` of the `concurrency`
+    concurrent calls. The connection pool of one httpx client costs CPU per request that grows
+    with its number of connections, so one client per few connections keeps a process with
+    hundreds of concurrent calls from being bound by pool bookkeeping. Attributes are those of
+    the next client, e.g. `pool.post(...)` or `pool.chat.completions.create(...)`.
+    """
+
+    def __init__(self, make_client, concurrency, shard_size=8):
+        self.clients = [make_client() for _ in range(max(1, -(-concurrency // shard_size)))]
+        self._next = itertools.cycle(self.clients)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(next(self._next), name)
+
+    async def aclose(self):
+        for client in self.clients:
+            close = getattr(client, "aclose", None) or client.close
+            await close()
+
+
+def get_async_http_client(pool_size=10):
+    """
+    `AsyncClientPool` of `httpx.AsyncClient`s for the tool calls of the asyncio engine, keeping
+    up to `pool_size` (the tool call concurrency) connections alive. Timeouts are given per call,
+    see `async_timeout`.
+    """
+    import httpx
+
+    pool_size = max(pool_size, 1)
+    return AsyncClientPool(
+        lambda: httpx.AsyncClient(limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=8)),
+        pool_size,
+    )
+
+
+def async_timeout(timeout):
+    """`httpx.Timeout` of a (connect, read) `tool_call_timeout`; waiting for a pooled connection is not limited."""
+    import httpx
+
+    connect_timeout, read_timeout = timeout
+    return httpx.Timeout(read_timeout, connect=connect_timeout, pool=None)
@@ -15,6 +15,7 @@ if __name__ == "__main__":
     parser.add_argument('--openai_key', type=str, default="", required=False, help='openai key for chatgpt_function or davinci model')
     parser.add_argument('--model_path', type=str, default="your_model_path/", required=False, help='')
     parser.add_argument('--tool_root_dir', type=str, default="your_tools_path/", required=True, help='')
+    parser.add_argument('--tool_catalog', type=str, default="", required=False, help='compiled tool catalog (python -m toolbench.tool_catalog compile), read instead of walking tool_root_dir')
     parser.add_argument("--lora", action="store_true", help="Load lora model or not.")
     parser.add_argument('--lora_path', type=str, default="your_lora_path if lora", required=False, help='')
     parser.add_argument('--max_observation_length', type=int, default=1024, required=False, help='maximum observation length')
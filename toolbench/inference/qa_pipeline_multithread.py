@@ -3,7 +3,7 @@ Close-domain QA Pipeline
 '''
 
 import argparse, os
-from toolbench.inference.Downstream_tasks.rapidapi_multithread import pipeline_runner
+from toolbench.inference.Downstream_tasks.rapidapi_multithread import pipeline_runner, ASYNC_BACKBONES
 
 
 if __name__ == "__main__":
@@ -15,6 +15,8 @@ if __name__ == "__main__":
     parser.add_argument('--openai_key', type=str, default="", required=False, help='openai key for chatgpt_function or davinci model')
     parser.add_argument('--model_path', type=str, default="your_model_path/", required=False, help='')
     parser.add_argument('--tool_root_dir', type=str, default="your_tools_path/", required=True, help='')
+    parser.add_argument('--tool_catalog', type=str, default="", required=False, help='compiled tool catalog (python -m toolbench.tool_catalog compile), read instead of walking tool_root_dir')
+    parser.add_argument('--env_spec_cache', type=str, default="", required=False, help='directory caching the precomputed per-query environments (function schemas, task description) across runs')
     parser.add_argument("--lora", action="store_true", help="Load lora model or not.")
     parser.add_argument('--lora_path', type=str, default="your_lora_path if lora", required=False, help='')
     parser.add_argument('--max_observation_length', type=int, default=1024, required=False, help='maximum observation length')
@@ -30,11 +32,21 @@ if __name__ == "__main__":
     parser.add_argument('--rapidapi_key', type=str, default="",required=False, help='your rapidapi key to request rapidapi service')
     parser.add_argument('--use_rapidapi_key', action="store_true", help="To use customized rapidapi service or not.")
     parser.add_argument('--api_customization', action="store_true", help="To use customized api or not.")
-    parser.add_argument('--num_thread', type=int, default=1, required=False, help='number of threads')
+    parser.add_argument('--num_thread', type=int, default=1, required=False, help='number of threads, or of queries in flight with --engine asyncio')
+    parser.add_argument('--engine', type=str, default="thread", choices=["thread", "asyncio"], required=False, help='run queries on a thread pool, or as coroutines on one event loop (chatgpt_function / toolllama_vllm backbones)')
+    parser.add_argument('--llm_concurrency', type=int, default=32, required=False, help='concurrent LLM calls with --engine asyncio')
+    parser.add_argument('--tool_concurrency', type=int, default=64, required=False, help='concurrent tool calls with --engine asyncio')
+    parser.add_argument('--rate_limit', type=str, default="", required=False, help='tool calls per second shared by all threads, "<rate>[:<burst>]" or comma separated "<service url>=<rate>[:<burst>]"; defaults to 0.5 for remote service urls and unlimited for the /virtual simulator, slowed down on 429 / Retry-After')
+    parser.add_argument('--max_throttle_retries', type=int, default=3, required=False, help='retries of a tool call answered with 429')
+    parser.add_argument('--connect_timeout', type=float, default=10, required=False, help='connect timeout of tool calls in seconds')
+    parser.add_argument('--read_timeout', type=float, default=15, required=False, help='read timeout of real tool calls in seconds, 0 for none')
+    parser.add_argument('--virtual_read_timeout', type=float, default=600, required=False, help='read timeout of simulated (/virtual) tool calls in seconds, 0 for none')
     parser.add_argument('--disable_tqdm', action="store_true", help="disable tqdm or not.")
     parser.add_argument('--overwrite', action='store_true', help='overwrite existing runs')
     
     args = parser.parse_args()
+    if args.engine == "asyncio" and args.backbone_model not in ASYNC_BACKBONES:
+        parser.error(f"--engine asyncio supports the {', '.join(ASYNC_BACKBONES)} backbones, not {args.backbone_model}")
     if args.overwrite:
         os.system(f"rm -rf {args.output_answer_file}")
 
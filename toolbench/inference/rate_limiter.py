@@ -0,0 +1,167 @@
+import time
+import asyncio
+import threading
+from collections import deque
+from urllib.parse import urlparse
+
+
+class TokenBucket:
+    """
+    Token bucket shared by every runner thread calling one service URL.
+
+    `acquire` returns at once while tokens are available (always, with `rate` 0 = unlimited)
+    and otherwise sleeps until the next token. When the server pushes back (HTTP 429 with
+    Retry-After, or a rate limit error in the response) `throttle` blocks every caller for the
+    retry delay and halves the rate, starting from the rate actually observed if the bucket
+    was unlimited. Successful calls then raise it back step by step to the rate in use before
+    the throttle, and from there to the configured one.
+    """
+
+    def __init__(self, rate=0, burst=1, min_rate=0.05, recovery=0.05):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.min_rate = min_rate
+        self.recovery = recovery
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        # rate in use when last throttled, recovered to before going back to max_rate
+        self.ceiling = 0.0
+        self.recent = deque(maxlen=1024)
+        self.lock = threading.Lock()
+        self.granted = 0
+        self.throttled = 0
+        self.waited = 0.0
+
+    def _grant(self, now):
+        self.granted += 1
+        self.recent.append(now)
+
+    def _try_acquire(self):
+        """Take one token if available and return 0, else return the seconds to wait for one."""
+        with self.lock:
+            now = time.monotonic()
+            wait = self.blocked_until - now
+            if wait > 0:
+                return wait
+            if self.rate:
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens < 1:
+                    return (1 - self.tokens) / self.rate
+                self.tokens -= 1
+            self._grant(now)
+            return 0
+
+    def _add_waited(self, waited):
+        if waited:
+            with self.lock:
+                self.waited += waited
+        return waited
+
+    def acquire(self):
+        """Take one token, sleeping only if none is available; returns the seconds waited."""
+        waited = 0.0
+        while (wait := self._try_acquire()) > 0:
+            time.sleep(wait)
+            waited += wait
+        return self._add_waited(waited)
+
+    async def aacquire(self):
+        """`acquire` for coroutines (`--engine asyncio`): waits without blocking the event loop."""
+        waited = 0.0
+        while (wait := self._try_acquire()) > 0:
+            await asyncio.sleep(wait)
+            waited += wait
+        return self._add_waited(waited)
+
+    def observed_rate(self, now, window=10.0):
+        calls = sum(1 for t in self.recent if now - t <= window)
+        return calls / window
+
+    def throttle(self, retry_after=None):
+        """The server asked to slow down: pause every caller for `retry_after` seconds and halve the rate."""
+        with self.lock:
+            now = time.monotonic()
+            self.throttled += 1
+            self.blocked_until = max(self.blocked_until, now + (retry_after if retry_after is not None else 1.0))
+            current = self.rate or max(self.observed_rate(now), self.min_rate * 2)
+            self.ceiling = current
+            self.rate = max(self.min_rate, current / 2)
+            self.tokens = 0
+            self.updated = now
+
+    def success(self):
+        """A call went through: recover the rate lost to throttling."""
+        with self.lock:
+            if not self.rate or self.rate == self.max_rate:
+                return
+            if self.rate < self.ceiling:
+                self.rate = min(self.ceiling, self.rate + self.ceiling * self.recovery)
+            elif self.max_rate:
+                self.rate = min(self.max_rate, self.rate * (1 + self.recovery))
+            else:
+                # back where the server pushed back before, without a configured limit
+                self.rate = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                "rate": self.rate,
+                "granted": self.granted,
+                "throttled": self.throttled,
+                "waited_seconds": round(self.waited, 2),
+            }
+
+
+def parse_rate_limits(spec):
+    """
+    Parse `--rate_limit`: comma separated `[<service url>=]<calls per second>[:<burst>]` entries.
+    An entry without url applies to every service URL. Returns {url or "": (rate, burst)}.
+    """
+    limits = {}
+    for entry in filter(None, (part.strip() for part in (spec or "").split(","))):
+        url, _, value = entry.rpartition("=")
+        rate, _, burst = value.partition(":")
+        limits[url] = (float(rate), int(burst) if burst else 1)
+    return limits
+
+
+def parse_retry_after(value, default=1.0):
+    """Seconds of a Retry-After header given in seconds; `default` if missing or an HTTP date."""
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        return default
+
+
+# (rate, burst) of a service URL without a `--rate_limit` entry: about 30 calls per minute for
+# the remote rapidapi service, unlimited for the local simulator (/virtual)
+DEFAULT_RATE_LIMIT = (0.5, 1)
+VIRTUAL_RATE_LIMIT = (0, 1)
+
+_LIMITERS = {}
+_LIMITERS_LOCK = threading.Lock()
+
+
+def is_virtual_service(service_url):
+    """Whether `service_url` is the local simulator, i.e. its path ends with /virtual."""
+    return urlparse(service_url).path.rstrip("/").endswith("/virtual")
+
+
+def get_rate_limiter(service_url, spec=""):
+    """The process-wide bucket of `service_url`, created from the `--rate_limit` spec on first use."""
+    with _LIMITERS_LOCK:
+        limiter = _LIMITERS.get(service_url)
+        if limiter is None:
+            limits = parse_rate_limits(spec)
+            default = VIRTUAL_RATE_LIMIT if is_virtual_service(service_url) else DEFAULT_RATE_LIMIT
+            rate, burst = limits.get(service_url, limits.get("", default))
+            limiter = _LIMITERS[service_url] = TokenBucket(rate, burst)
+        return limiter
+
+
+def rate_limiter_stats():
+    with _LIMITERS_LOCK:
+        return {url: limiter.stats() for url, limiter in _LIMITERS.items()}
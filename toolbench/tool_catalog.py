@@ -0,0 +1,296 @@
+'''
+Compiled tool catalog: the whole `toolenv/tools/<category>/<tool>.json` tree in one binary file.
+
+Every tool is stored as one JSON record (category, standardized file name, original tool name,
+description, raw `api_list` with the normalized api names alongside, and the response schemas
+of `--response_examples_folder` if given). Two sorted fixed-width indexes, by
+`category\\ttool` and by standardized original tool name, point into the records. The file is
+memory-mapped, so opening it reads only the footer and a lookup is a binary search plus the
+decoding of one record, instead of walking and parsing thousands of files.
+
+    python -m toolbench.tool_catalog compile --tool_root_dir data/toolenv/tools --output data/toolenv/tools.catalog
+    python -m toolbench.tool_catalog benchmark --tool_root_dir data/toolenv/tools
+
+The runner uses it with `--tool_catalog`, `ToolRetriever` as its corpus and the simulator
+servers with `tools_catalog` in their config. The module needs only the standard library at
+import time, so the servers import `ToolCatalog` from here.
+
+Layout: MAGIC | records | names | tool index | origin index | footer, where index entries are
+(name offset, name length, record offset, record length, tool file mtime) and the footer is
+(tool index offset, tool count, origin index offset, origin count, MAGIC).
+'''
+
+import os
+import mmap
+import json
+import time
+import struct
+import shutil
+import argparse
+import tempfile
+from collections.abc import Mapping
+
+MAGIC = b"TBCATLG1"
+INDEX_ENTRY = struct.Struct("<QIQId")
+FOOTER = struct.Struct("<QQQQ8s")
+
+
+def _tool_key(category, tool_name):
+    return f"{category}\t{tool_name}".encode("utf-8")
+
+
+def _scan_tools(tool_root_dir):
+    """Yield (category, standard tool name, path) of every tool file."""
+    for category in sorted(os.listdir(tool_root_dir)):
+        category_dir = os.path.join(tool_root_dir, category)
+        if not os.path.isdir(category_dir):
+            continue
+        for file in sorted(os.listdir(category_dir)):
+            if file.endswith(".json"):
+                yield category, file[:-len(".json")], os.path.join(category_dir, file)
+
+
+def _load_schemas(response_examples_folder, category, tool_name):
+    from toolbench.utils import standardize, change_name
+
+    schemas = {}
+    schema_file_path = os.path.join(response_examples_folder, category, tool_name + ".json")
+    if os.path.exists(schema_file_path):
+        with open(schema_file_path, 'r') as f:
+            for schema_dict in json.load(f).get("api_list", []):
+                if schema_dict.get("schema"):
+                    schemas.setdefault(change_name(standardize(schema_dict["name"])), schema_dict["schema"])
+    return schemas
+
+
+def compile_catalog(tool_root_dir, output, response_examples_folder=None):
+    """Compile every tool file under `tool_root_dir` into a catalog at `output`; returns the tool count."""
+    from toolbench.utils import standardize, change_name
+
+    records = []
+    for category, tool_name, path in _scan_tools(tool_root_dir):
+        try:
+            with open(path, 'r') as f:
+                tool_json = json.load(f)
+            record = {
+                "category": category,
+                "standard_tool_name": tool_name,
+                "tool_name": tool_json["tool_name"],
+                "tool_description": tool_json["tool_description"],
+                "api_list": tool_json["api_list"],
+                "api_names": [change_name(standardize(api["name"])) for api in tool_json["api_list"]],
+            }
+        except Exception as e:
+            print(f"skipping {path}: {e}")
+            continue
+        if response_examples_folder:
+            record["schemas"] = _load_schemas(response_examples_folder, category, tool_name)
+        records.append((_tool_key(category, tool_name), standardize(record["tool_name"]).encode("utf-8"),
+                        json.dumps(record, separators=(",", ":")).encode("utf-8"), os.path.getmtime(path)))
+
+    tmp_path = output + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        offsets = []
+        for _, _, content, _ in records:
+            offsets.append(f.tell())
+            f.write(content)
+        tool_entries, origin_entries = [], {}
+        for (key, origin, content, mtime), record_offset in zip(records, offsets):
+            tool_entries.append((key, f.tell(), record_offset, len(content), mtime))
+            f.write(key)
+            # a tool name shared by several categories resolves to the first one, by category
+            if origin not in origin_entries:
+                origin_entries[origin] = (origin, f.tell(), record_offset, len(content), mtime)
+                f.write(origin)
+        index_offsets = []
+        for entries in (sorted(tool_entries), sorted(origin_entries.values())):
+            index_offsets.append(f.tell())
+            for name, name_offset, record_offset, record_length, mtime in entries:
+                f.write(INDEX_ENTRY.pack(name_offset, len(name), record_offset, record_length, mtime))
+        f.write(FOOTER.pack(index_offsets[0], len(tool_entries), index_offsets[1], len(origin_entries), MAGIC))
+    os.replace(tmp_path, output)
+    return len(records)
+
+
+class ToolCatalog:
+    """Memory-mapped reader of a compiled tool catalog, see the module docstring."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a tool catalog")
+        self.tool_index, self.num_tools, self.origin_index, self.num_origins, magic = FOOTER.unpack_from(
+            self._mmap, len(self._mmap) - FOOTER.size
+        )
+        if magic != MAGIC:
+            raise ValueError(f"{path} is truncated")
+
+    def _entry(self, index_offset, i):
+        name_offset, name_length, record_offset, record_length, mtime = INDEX_ENTRY.unpack_from(
+            self._mmap, index_offset + i * INDEX_ENTRY.size
+        )
+        return self._mmap[name_offset:name_offset + name_length], record_offset, record_length, mtime
+
+    def _search(self, index_offset, count, name):
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._entry(index_offset, mid)[0] < name:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < count:
+            entry = self._entry(index_offset, lo)
+            if entry[0] == name:
+                return entry
+        return None
+
+    def _record(self, entry):
+        if entry is None:
+            return None
+        _, record_offset, record_length, _ = entry
+        return json.loads(self._mmap[record_offset:record_offset + record_length])
+
+    def get_tool(self, category, tool_name):
+        """The record of `<category>/<tool_name>.json`, or None."""
+        return self._record(self._search(self.tool_index, self.num_tools, _tool_key(category, tool_name)))
+
+    def find_tool(self, origin_tool_name):
+        """The record of the tool whose `standardize(tool_name)` is `origin_tool_name`, or None."""
+        return self._record(self._search(self.origin_index, self.num_origins, origin_tool_name.encode("utf-8")))
+
+    def __contains__(self, key):
+        return self._search(self.tool_index, self.num_tools, _tool_key(*key)) is not None
+
+    def tools(self):
+        """Yield (category, tool_name, mtime) of every tool without decoding the records."""
+        for i in range(self.num_tools):
+            name, _, _, mtime = self._entry(self.tool_index, i)
+            category, tool_name = name.decode("utf-8").split("\t")
+            yield category, tool_name, mtime
+
+    def white_list(self):
+        return CatalogWhiteList(self)
+
+    def __len__(self):
+        return self.num_tools
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
+
+
+class CatalogWhiteList(Mapping):
+    """Lazy `get_white_list` result: standardized tool name -> {"description", "standard_tool_name"}."""
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+    def __getitem__(self, origin_tool_name):
+        record = self.catalog.find_tool(origin_tool_name)
+        if record is None:
+            raise KeyError(origin_tool_name)
+        return {"description": record["tool_description"], "standard_tool_name": record["standard_tool_name"]}
+
+    def __iter__(self):
+        for i in range(self.catalog.num_origins):
+            yield self.catalog._entry(self.catalog.origin_index, i)[0].decode("utf-8")
+
+    def __len__(self):
+        return self.catalog.num_origins
+
+
+_CATALOGS = {}
+
+
+def load_tool_catalog(path):
+    """One shared `ToolCatalog` per path and process."""
+    if path not in _CATALOGS:
+        _CATALOGS[path] = ToolCatalog(path)
+    return _CATALOGS[path]
+
+
+def _build_synthetic_tools(tool_root_dir, num_tools, apis_per_tool):
+    for i in range(num_tools):
+        category_dir = os.path.join(tool_root_dir, f"Category_{i % 49}")
+        os.makedirs(category_dir, exist_ok=True)
+        tool_json = {
+            "tool_name": f"Tool {i}",
+            "tool_description": f"Synthetic tool number {i}. " * 4,
+            "api_list": [
+                {
+                    "name": f"Get Item {j}",
+                    "url": f"https://tool-{i}.p.rapidapi.com/items/{j}",
+                    "description": f"Returns item {j} of tool {i}. " * 4,
+                    "method": "GET",
+                    "required_parameters": [{"name": "id", "type": "STRING", "description": "item id", "default": "1"}],
+                    "optional_parameters": [{"name": "limit", "type": "NUMBER", "description": "page size", "default": 10}],
+                }
+                for j in range(apis_per_tool)
+            ],
+        }
+        with open(os.path.join(category_dir, f"tool_{i}.json"), 'w') as f:
+            json.dump(tool_json, f)
+
+
+def benchmark(tool_root_dir, num_tools, apis_per_tool, num_lookups):
+    from toolbench.inference.Downstream_tasks.rapidapi_multithread import get_white_list
+
+    work_dir = tempfile.mkdtemp(prefix="tool_catalog_benchmark_")
+    try:
+        if not tool_root_dir:
+            tool_root_dir = os.path.join(work_dir, "tools")
+            _build_synthetic_tools(tool_root_dir, num_tools, apis_per_tool)
+        catalog_path = os.path.join(work_dir, "tools.catalog")
+        start = time.perf_counter()
+        compiled = compile_catalog(tool_root_dir, catalog_path)
+        print(f"compiled {compiled} tools in {time.perf_counter() - start:.2f}s")
+        tools = [(category, tool_name) for category, tool_name, _ in _scan_tools(tool_root_dir)]
+        sample = [tools[i * len(tools) // num_lookups] for i in range(min(num_lookups, len(tools)))]
+
+        start = time.perf_counter()
+        white_list = get_white_list(tool_root_dir)
+        walk_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        for category, tool_name in sample:
+            with open(os.path.join(tool_root_dir, category, tool_name + ".json"), 'r') as f:
+                json.load(f)
+        file_lookup_ms = (time.perf_counter() - start) * 1000 / len(sample)
+
+        start = time.perf_counter()
+        catalog = ToolCatalog(catalog_path)
+        catalog_white_list = catalog.white_list()
+        catalog_white_list[next(iter(white_list))]
+        open_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        for category, tool_name in sample:
+            catalog.get_tool(category, tool_name)
+        catalog_lookup_ms = (time.perf_counter() - start) * 1000 / len(sample)
+        catalog.close()
+
+        print(f"{'source':<10} {'startup ms':>11} {'lookup ms':>10}")
+        print(f"{'tree':<10} {walk_seconds * 1000:>11.1f} {file_lookup_ms:>10.3f}")
+        print(f"{'catalog':<10} {open_seconds * 1000:>11.1f} {catalog_lookup_ms:>10.3f}")
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('command', choices=["compile", "benchmark"], help='compile a catalog or compare its startup with walking the tool tree')
+    parser.add_argument('--tool_root_dir', type=str, default="", required=False, help='tool tree to compile; the benchmark builds a synthetic one if empty')
+    parser.add_argument('--output', type=str, default="tools.catalog", required=False, help='catalog file to write')
+    parser.add_argument('--response_examples_folder', type=str, default="", required=False, help='response examples whose schemas are compiled in')
+    parser.add_argument('--num_tools', type=int, default=5000, required=False, help='number of synthetic benchmark tools')
+    parser.add_argument('--apis_per_tool', type=int, default=5, required=False, help='number of apis per synthetic benchmark tool')
+    parser.add_argument('--num_lookups', type=int, default=500, required=False, help='number of timed tool lookups')
+    args = parser.parse_args()
+
+    if args.command == "compile":
+        num_tools = compile_catalog(args.tool_root_dir, args.output, args.response_examples_folder or None)
+        print(f"Compiled {num_tools} tools into {args.output}")
+    else:
+        benchmark(args.tool_root_dir, args.num_tools, args.apis_per_tool, args.num_lookups)
@@ -110,11 +110,14 @@ def replace_llama_with_condense(ratio):
 
     
 def process_retrieval_ducoment(documents_df):
+    return process_retrieval_documents((row.docid, json.loads(row.document_content)) for row in documents_df.itertuples())
+
+def process_retrieval_documents(documents):
+    """Corpus and corpus -> "category[SEP]tool[SEP]api" of (docid, document dict) pairs."""
     ir_corpus = {}
     corpus2tool = {}
-    for row in documents_df.itertuples():
-        doc = json.loads(row.document_content)
-        ir_corpus[row.docid] = (doc.get('category_name', '') or '') + ', ' + \
+    for docid, doc in documents:
+        ir_corpus[docid] = (doc.get('category_name', '') or '') + ', ' + \
         (doc.get('tool_name', '') or '') + ', ' + \
         (doc.get('api_name', '') or '') + ', ' + \
         (doc.get('api_description', '') or '') + \